@@ -4,195 +4,323 @@ Created on 2023-08-16
 
 Main function of the colocation project.
 '''
-from colocation.dataloaders.wikidata_loader import get_wikidata_conferences
-from colocation.cache_manager import JsonCacheManager
+from colocation.dataloaders import wikidata_loader
+from colocation.dataloaders.wikidata_loader import get_wikidata_conferences, wikidata_cacher
+from colocation.dataloaders import dblp_loader
+from colocation.dataloaders.dblp_loader import get_dblp_conferences, dblp_cacher
+from colocation.cache_manager import JsonCacheManager, SqliteCacheManager
 from colocation.extractor import ColocationExtractor, ExtractionProcessor
 from colocation.matcher import Matcher
 from colocation.neo4j_manager import Neo4jManager
+from colocation.pipeline import Pipeline
 from colocation.values import Constants
 from colocation.result_processor import ResultProcessor
+from typing import Callable, Union
+import hashlib
+import os
+import time
 import pandas as pd
 import argparse
 
 MATCH_THREASHOLD = Constants.MATCH_THREASHOLD
 LINK_THREASHOLD = Constants.LINK_THREASHOLD
 
-if __name__ == "__main__":
 
-    ################################
-    # setup command line interface #
-    ################################
+def build_pipeline(args: argparse.Namespace) -> Pipeline:
+    """
+    Build the stages of the colocation process.
+    Only the stages working with Neo4j and Wikidata are run every time,
+    all others are taken from their checkpoints as long as their inputs did not change.
 
-    parser = argparse.ArgumentParser(
-        prog="Ceur-WS Colocation",
-        description="Extracts information from Ceur-WS volumes to link workshops to \
-their co-located conference using Wikidata and Dblp as additional datasources. \
-Refer to https://github.com/MaikUlmer/KGLab-SS2023-Colocation for additional information."
-    )
-    parser.add_argument('-r', '--reload', action='store_true', help="Force reload cached results.")
-    parser.add_argument('-w', '--write', action='store_true', help="Actually write the updated parameters to Wikidata.")
-
-    args = parser.parse_args()
+    Args:
+        args(argparse.Namespace): the parsed command line arguments
+    Returns:
+        Pipeline: the colocation pipeline
+    """
     reload = args.reload
-    write = args.write
+
+    cacher = JsonCacheManager(ttl=args.max_age * 3600 if args.max_age is not None else None,
+                              compression=args.compress)
+    extra_provider = JsonCacheManager(base_url="http://ceurspt.wikidata.dbis.rwth-aachen.de",
+                                      compression=args.compress,
+                                      document_store=SqliteCacheManager("ceurspt-volumes"))
+    wikidata_cacher.compression = args.compress
+    dblp_cacher.compression = args.compress
+    dblp_loader.dblp_dump_path = args.dblp_dump
+    wikidata_loader.wikidata_dump_path = args.wikidata_dump
+
+    def new_matcher(dblp_conferences: Union[pd.DataFrame, None] = None) -> Matcher:
+        # every stage gets its own matcher, since stages run concurrently
+        matcher = Matcher(title_backend=args.title_backend, reuse_title_index=args.reuse_title_index)
+        matcher.cacher.compression = args.compress
+        matcher.dblp_conferences = dblp_conferences
+        return matcher
+
+    pipeline = Pipeline("colocation")
 
     ###########################
     # get Ceur-WS information #
     ###########################
-    print("Getting Ceur-WS volumes.")
 
-    cacher = JsonCacheManager()
-    volumes = cacher.reload_lod("volumes") if reload else cacher.load_lod("volumes")
-    if reload:
-        cacher.reload_lod("proceedings")
-    extractor = ColocationExtractor(volumes)
-    colocation_lod = extractor.get_colocation_info()
-
-    colocation_processor = ExtractionProcessor(colocation_lod)
+    def ceur_file(lod_name: str) -> Callable[[], str]:
+        def fingerprint() -> str:
+            print(f"Getting Ceur-WS {lod_name}.")
+            # downloads the list if missing and revalidates it if outdated
+            next(cacher.iter_lod(lod_name, reload=reload), None)
+            digest = hashlib.sha1()
+            with open(cacher.json_path(lod_name), "rb") as json_file:
+                for chunk in iter(lambda: json_file.read(1 << 20), b""):
+                    digest.update(chunk)
+            return digest.hexdigest()
+        return fingerprint
+
+    def colocation(volumes: str, proceedings: str) -> list:
+        # stream the volumes, the extractor only keeps the relevant ones
+        extractor = ColocationExtractor(cacher.iter_lod("volumes"), proc_provider=cacher,
+                                        extra_provider=extra_provider)
+        return extractor.get_colocation_info()
+
+    # the files are only fingerprinted, the extractor reads them itself
+    pipeline.add_stage("volumes", ceur_file("volumes"), checkpoint=False)
+    pipeline.add_stage("proceedings", ceur_file("proceedings"), checkpoint=False)
+    pipeline.add_stage("colocation", colocation, inputs=["volumes", "proceedings"])
 
     #####################################
     # get information from data sources #
     #####################################
 
-    print("Getting extra data from sources.")
+    def wikidata_conferences() -> pd.DataFrame:
+        print("Getting Wikidata conferences.")
+        return get_wikidata_conferences(reload=reload, refresh=args.refresh)
+
+    def dblp_conferences() -> pd.DataFrame:
+        print("Getting Dblp conferences.")
+        return get_dblp_conferences(reload=reload)
 
-    wikidata_conferences = get_wikidata_conferences(reload=reload)
+    # a refresh has to look for changes every time, unchanged results still keep the later stages
+    refreshed = {"refreshed": time.time()} if args.refresh else {}
+
+    # all sources are loaded concurrently, as the stages do not depend on each other
+    # the results differ between the endpoint and a dump, and between versions of the dump
+    wikidata_source = {"wikidata_dump": args.wikidata_dump, "modified": os.path.getmtime(args.wikidata_dump)} \
+        if args.wikidata_dump else {}
+    pipeline.add_stage("wikidata_conferences", wikidata_conferences, params={**refreshed, **wikidata_source})
+    dblp_source = {"dblp_dump": args.dblp_dump, "modified": os.path.getmtime(args.dblp_dump)} if args.dblp_dump else {}
+    pipeline.add_stage("dblp_conferences", dblp_conferences, params=dblp_source)
 
     ##################################
     # match and link events together #
     ##################################
 
-    matcher = Matcher()
-
-    # match Ceur-Ws against wikidata
-    print("Matching Ceur-WS volumes against Wikidata conferences.")
-
-    match_workshop_wikidata: pd.DataFrame = matcher.match_extract(
-        extract_function=colocation_processor.get_loctime_info,
-        remove_function=colocation_processor.remove_events_by_keys,
-        remove_key="number",
-        conferences=wikidata_conferences,
-        threshold=MATCH_THREASHOLD,
-        reload=reload,
-        save_name="Ceur_Wikidata"
-    )
-
-    # get present wikidata conferences found by the matching process
-    retained = ["C.conference", "C.title", "C.countryISO3", "C.short", "C.month", "C.year"]
-    matched_wikidata_conferences = (
-        match_workshop_wikidata[retained]
-        .drop_duplicates(subset="C.conference")
-        .rename(columns={old: old[2:] for old in retained})
-    )
-    matched_wikidata_conference_ids = [c.split("/")[-1] for c in matched_wikidata_conferences["conference"]]
-
-    # try to link wikidata conferences to dblp conference proceedings
-
-    links_wikidata_dblp = matcher.link_wikidata_dblp_conferences(
-        conference_ids=matched_wikidata_conference_ids,
-        name="wikidata_dblp_links",
-        reload=reload
-    )
-
-    # try to link Ceur-Ws to dblp conference proceedings
-    print("Linking Ceur-Ws to Dblp conferences.")
-
-    links_workshop_dblp = matcher.link_workshops_dblp_conferences(
-        colocation_lod, reload=reload
-    )
-
-    # link split dblp confernece proceedings to virtual node for the entire proceeding
-    print("Linking Dblp conferences and virtual nodes.")
-
-    dblp_virtual_links = matcher.link_dblp_split_proceedings(
-        potential_virtual_nodes=links_workshop_dblp["C.conference_guess"]
-    )
-
-    # supplement the present dblp conferences with attributes for matching
-    print("Matching Wikidata and Dblp conferences.")
-
-    linked_dblp_conferences = links_workshop_dblp[
-        [c for c in links_workshop_dblp.columns if c[0:2] == "C."]
-    ]
-    linked_dblp_conferences = linked_dblp_conferences.rename(
-        columns={old: old[2:] for old in linked_dblp_conferences.columns}
-    )
-
-    # match dblp against wikidata
-    match_dblp_wikidata = matcher.match_dataframes_with_title_extract(
-        linked_dblp_conferences,
-        matched_wikidata_conferences,
-        threshold=MATCH_THREASHOLD,
-        reload=reload,
-        save_name="Wikidata_Dblp",
-        to_extract=[1]
-    )
+    def match_workshop_wikidata(colocation: list, wikidata_conferences: pd.DataFrame) -> pd.DataFrame:
+        # match Ceur-Ws against wikidata
+        print("Matching Ceur-WS volumes against Wikidata conferences.")
+        colocation_processor = ExtractionProcessor(colocation)
+        return new_matcher().match_extract(
+            extract_function=colocation_processor.get_loctime_info,
+            remove_function=colocation_processor.remove_events_by_keys,
+            remove_key="number",
+            conferences=wikidata_conferences,
+            threshold=MATCH_THREASHOLD,
+            reload=reload,
+            save_name="Ceur_Wikidata",
+            inputs=pd.DataFrame(colocation)
+        )
+
+    def matched_wikidata_conferences(match_workshop_wikidata: pd.DataFrame) -> pd.DataFrame:
+        # get present wikidata conferences found by the matching process
+        retained = ["C.conference", "C.title", "C.countryISO3", "C.short", "C.month", "C.year"]
+        return (
+            match_workshop_wikidata[retained]
+            .drop_duplicates(subset="C.conference")
+            .rename(columns={old: old[2:] for old in retained})
+        )
+
+    def links_wikidata_dblp(match_workshop_wikidata: pd.DataFrame, dblp_conferences: pd.DataFrame) -> pd.DataFrame:
+        # try to link wikidata conferences to dblp conference proceedings
+        conferences = matched_wikidata_conferences(match_workshop_wikidata)
+        return new_matcher(dblp_conferences).link_wikidata_dblp_conferences(
+            conference_ids=[c.split("/")[-1] for c in conferences["conference"]],
+            name="wikidata_dblp_links",
+            reload=reload,
+            refresh=args.refresh
+        )
+
+    def links_workshop_dblp(colocation: list, dblp_conferences: pd.DataFrame) -> pd.DataFrame:
+        # try to link Ceur-Ws to dblp conference proceedings
+        print("Linking Ceur-Ws to Dblp conferences.")
+        return new_matcher(dblp_conferences).link_workshops_dblp_conferences(colocation, reload=reload)
+
+    def dblp_virtual_links(links_workshop_dblp: pd.DataFrame, dblp_conferences: pd.DataFrame) -> pd.DataFrame:
+        # link split dblp confernece proceedings to virtual node for the entire proceeding
+        print("Linking Dblp conferences and virtual nodes.")
+        return new_matcher(dblp_conferences).link_dblp_split_proceedings(
+            potential_virtual_nodes=links_workshop_dblp["C.conference_guess"]
+        )
+
+    def match_dblp_wikidata(links_workshop_dblp: pd.DataFrame, match_workshop_wikidata: pd.DataFrame) -> pd.DataFrame:
+        # supplement the present dblp conferences with attributes for matching
+        print("Matching Wikidata and Dblp conferences.")
+        linked_dblp_conferences = links_workshop_dblp[
+            [c for c in links_workshop_dblp.columns if c[0:2] == "C."]
+        ]
+        linked_dblp_conferences = linked_dblp_conferences.rename(
+            columns={old: old[2:] for old in linked_dblp_conferences.columns}
+        )
+
+        # match dblp against wikidata
+        return new_matcher().match_dataframes_with_title_extract(
+            linked_dblp_conferences,
+            matched_wikidata_conferences(match_workshop_wikidata),
+            threshold=MATCH_THREASHOLD,
+            reload=reload,
+            save_name="Wikidata_Dblp",
+            to_extract=[1]
+        )
+
+    matching = {"threshold": MATCH_THREASHOLD, "title_backend": args.title_backend,
+                "minhash_threshold": Constants.MINHASH_MATCH_THREASHOLD,
+                "reuse_title_index": args.reuse_title_index}
+    pipeline.add_stage("match_workshop_wikidata", match_workshop_wikidata,
+                       inputs=["colocation", "wikidata_conferences"], params=matching)
+    pipeline.add_stage("links_wikidata_dblp", links_wikidata_dblp,
+                       inputs=["match_workshop_wikidata", "dblp_conferences"], params={**refreshed, **wikidata_source})
+    pipeline.add_stage("links_workshop_dblp", links_workshop_dblp, inputs=["colocation", "dblp_conferences"],
+                       params=dblp_source)
+    pipeline.add_stage("dblp_virtual_links", dblp_virtual_links, inputs=["links_workshop_dblp", "dblp_conferences"])
+    pipeline.add_stage("match_dblp_wikidata", match_dblp_wikidata,
+                       inputs=["links_workshop_dblp", "match_workshop_wikidata"], params=matching)
 
     ############################
     # input results into Neo4j #
     ############################
 
-    print("Importing results into Neo4j.")
-
-    neo = Neo4jManager()
-
-    neo.add_matched_nodes(
-        match_workshop_wikidata, "number", "conference", "Ceur-WS", "Wikidata"
-    )
-    neo.add_matched_nodes_undirected(
-        links_wikidata_dblp, "conference", "dblp_id", "Wikidata", "Dblp",
-        "conference", "conference", "linked"
-    )
-    neo.add_matched_nodes(
-        links_workshop_dblp, "number", "conference_guess",
-        "Ceur-WS", "Dblp", relation_type="linked"
-    )
-    neo.add_matched_nodes(
-        dblp_virtual_links, "conference", "virtual", "Dblp", "Dblp",
-        "conference", "conference", "linked"
-    )
-    neo.add_matched_nodes_undirected(
-        match_dblp_wikidata,
-        key_w="conference_guess", key_c="conference",
-        source_w="Dblp", source_c="Wikidata",
-        type_w="conference", type_c="conference"
-    )
+    def neo4j_import(match_workshop_wikidata: pd.DataFrame, links_wikidata_dblp: pd.DataFrame,
+                     links_workshop_dblp: pd.DataFrame, dblp_virtual_links: pd.DataFrame,
+                     match_dblp_wikidata: pd.DataFrame):
+        print("Importing results into Neo4j.")
+
+        neo = Neo4jManager()
+
+        neo.add_matched_nodes(
+            match_workshop_wikidata, "number", "conference", "Ceur-WS", "Wikidata"
+        )
+        neo.add_matched_nodes_undirected(
+            links_wikidata_dblp, "conference", "dblp_id", "Wikidata", "Dblp",
+            "conference", "conference", "linked"
+        )
+        neo.add_matched_nodes(
+            links_workshop_dblp, "number", "conference_guess",
+            "Ceur-WS", "Dblp", relation_type="linked"
+        )
+        neo.add_matched_nodes(
+            dblp_virtual_links, "conference", "virtual", "Dblp", "Dblp",
+            "conference", "conference", "linked"
+        )
+        neo.add_matched_nodes_undirected(
+            match_dblp_wikidata,
+            key_w="conference_guess", key_c="conference",
+            source_w="Dblp", source_c="Wikidata",
+            type_w="conference", type_c="conference"
+        )
 
     ######################
     # editing graph data #
     ######################
 
-    print("Editing Neo4j data.")
-
-    neo.set_dblp_virtual()
-    neo.create_link_by_workshop_connectivity(
-        type_workshop="Ceur-WS",
-        type_matched="Wikidata",
-        type_linked="Dblp",
-        threshold=LINK_THREASHOLD
-    )
-    neo.delete_match_when_linked("Wikidata", "Dblp")
-    neo.add_ceur_attributes(volumes, colocation_lod)
-    neo.add_missing_wikidata_event(reload)
+    def neo4j_edit(colocation: list):
+        print("Editing Neo4j data.")
+
+        neo = Neo4jManager()
+        neo.set_dblp_virtual()
+        neo.create_link_by_workshop_connectivity(
+            type_workshop="Ceur-WS",
+            type_matched="Wikidata",
+            type_linked="Dblp",
+            threshold=LINK_THREASHOLD
+        )
+        neo.delete_match_when_linked("Wikidata", "Dblp")
+        neo.add_ceur_attributes(cacher.iter_lod("volumes"), colocation)
+        neo.add_missing_wikidata_event(reload)
 
     ######################
     # processing results #
     ######################
 
-    print()
-    print("Serializing results.")
+    def serialize():
+        print()
+        print("Serializing results.")
 
-    neo.serialize_results()
+        Neo4jManager().serialize_results()
 
     ###############################
     # writing results to Wikidata #
     ###############################
 
-    processor = ResultProcessor('https://www.wikidata.org/', write=write)
-    file_name = "fully_connected_event_present"
-    if write:
-        res = processor.write_result_to_wikidata(file_name)
-        print(f"Wrote co-located attribute for {len(res)} workshops.")
+    def wikidata_write():
+        processor = ResultProcessor('https://www.wikidata.org/', write=args.write)
+        file_name = "fully_connected_event_present"
+        if args.write:
+            res = processor.write_result_to_wikidata(file_name)
+            print(f"Wrote co-located attribute for {len(res)} workshops.")
+        else:
+            res = processor.get_event_conference_pairs(file_name)
+            print(f"Would have written co-located attribute for {len(res)} workshops.")
+
+    # the graph is changed in place, so these stages are never skipped
+    pipeline.add_stage("neo4j_import", neo4j_import,
+                       inputs=["match_workshop_wikidata", "links_wikidata_dblp", "links_workshop_dblp",
+                               "dblp_virtual_links", "match_dblp_wikidata"], checkpoint=False)
+    pipeline.add_stage("neo4j_edit", neo4j_edit, inputs=["colocation"], after=["neo4j_import"], checkpoint=False)
+    pipeline.add_stage("serialize", serialize, after=["neo4j_edit"], checkpoint=False)
+    pipeline.add_stage("wikidata_write", wikidata_write, after=["serialize"], checkpoint=False)
+
+    return pipeline
+
+
+if __name__ == "__main__":
+
+    ################################
+    # setup command line interface #
+    ################################
+
+    parser = argparse.ArgumentParser(
+        prog="Ceur-WS Colocation",
+        description="Extracts information from Ceur-WS volumes to link workshops to \
+their co-located conference using Wikidata and Dblp as additional datasources. \
+Refer to https://github.com/MaikUlmer/KGLab-SS2023-Colocation for additional information."
+    )
+    parser.add_argument('-r', '--reload', action='store_true', help="Force reload cached results.")
+    parser.add_argument('-w', '--write', action='store_true', help="Actually write the updated parameters to Wikidata.")
+    parser.add_argument('--title-backend', choices=["tfidf", "minhash"], default="tfidf",
+                        help="Similarity used for fuzzy title matching: exact tf-idf or approximate MinHash/LSH.")
+    parser.add_argument('--reuse-title-index', action='store_true',
+                        help="Fit the tf-idf embedding once on the conference titles and cache it, \
+instead of fitting it on the workshop and conference titles of every matching step. Changes the match scores slightly.")
+    parser.add_argument('--max-age', type=float, default=None, metavar="HOURS",
+                        help="Revalidate cached Ceur-WS volumes and proceedings older than this with the server, \
+only downloading them again if they changed.")
+    parser.add_argument('--refresh', action='store_true',
+                        help="Update the cached Wikidata results with the changes since they were downloaded.")
+    parser.add_argument('--dblp-dump', default=None, metavar="PATH",
+                        help="Read the Dblp conferences and Ceur-WS workshops from a local dblp.xml(.gz) dump \
+instead of the Dblp SPARQL endpoint.")
+    parser.add_argument('--wikidata-dump', default=None, metavar="PATH",
+                        help="Read the Wikidata conferences, workshops and Dblp links from a local json dump \
+(latest-all.json.gz or a filtered part of it) instead of the Wikidata SPARQL endpoint.")
+    parser.add_argument('--compress', choices=["gzip", "zstd"], default=None,
+                        help="Compress newly written cache files, existing ones are read either way.")
+    parser.add_argument('--from-stage', default=None, metavar="STAGE",
+                        help="Rerun this stage and all stages after it, taking earlier results from their checkpoints.")
+    parser.add_argument('--only', nargs="+", default=None, metavar="STAGE",
+                        help="Only run these stages, taking their inputs from the checkpoints of earlier runs.")
+    parser.add_argument('--list-stages', action='store_true', help="List the stages of the process and exit.")
+
+    args = parser.parse_args()
+    pipeline = build_pipeline(args)
+
+    if args.list_stages:
+        for stage in pipeline.stages.values():
+            print(f"{stage.name} <- {', '.join(stage.dependencies)}" if stage.dependencies else stage.name)
     else:
-        res = processor.get_event_conference_pairs(file_name)
-        print(f"Would have written co-located attribute for {len(res)} workshops.")
+        pipeline.run(from_stage=args.from_stage, only=args.only, reload=args.reload)
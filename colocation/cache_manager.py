@@ -2,30 +2,254 @@
 Created on 2023-04-28
 @author: nm
 '''
+import urllib.error
 import urllib.request
+import gzip
+import io
+import json
+import mmap
 import os
+import shutil
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import numpy as np
 import orjson
 import pandas as pd
-from typing import List, Dict, Union
+from typing import IO, Any, Iterator, List, Dict, Tuple, Union
 
 
 # mostly from https://github.com/ceurws/ceur-spt/blob/d7b5249a275179ca9aed4888f50ce31b927ec1f6/ceurspt/ceurws.py#L869
 
+class MemoryCache():
+    """
+    process wide least recently used cache of loaded files,
+    entries are only valid as long as the file keeps its modification time and size
+    """
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024):
+        """
+        constructor
+
+        Args:
+            max_bytes(int): approximate memory the cached values may use before the least recently used are evicted
+        """
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def stamp(path: str) -> Union[tuple, None]:
+        """
+        Args:
+            path(str): path of the file
+
+        Returns:
+            tuple|None: modification time and size of the file, None if it does not exist
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, path: str, kind: str) -> Union[Any, None]:
+        """
+        get the value loaded from the file if the file did not change since
+
+        Args:
+            path(str): path of the loaded file
+            kind(str): how the file was loaded, e.g. 'frame' or 'bytes'
+
+        Returns:
+            object|None: the cached value, None if not present or outdated
+        """
+        stamp = self.stamp(path)
+        with self.lock:
+            entry = self.entries.get((path, kind))
+            if entry is None:
+                return None
+            if entry[0] != stamp:
+                self.size -= self.entries.pop((path, kind))[2]
+                return None
+            self.entries.move_to_end((path, kind))
+            return entry[1]
+
+    def put(self, path: str, kind: str, value: Any, size: int, stamp: Union[tuple, None] = None):
+        """
+        remember the value loaded from the file
+
+        Args:
+            path(str): path of the loaded file
+            kind(str): how the file was loaded, e.g. 'frame' or 'bytes'
+            value(object): the loaded value, which must not be changed afterwards
+            size(int): approximate memory of the value in bytes
+            stamp(tuple|None): stamp of the file before it was loaded, taken now if None
+        """
+        stamp = stamp or self.stamp(path)
+        with self.lock:
+            if (path, kind) in self.entries:
+                self.size -= self.entries.pop((path, kind))[2]
+            if stamp is None or size > self.max_bytes:
+                return
+            self.entries[(path, kind)] = (stamp, value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self.size -= self.entries.popitem(last=False)[1][2]
+
+    def clear(self):
+        """
+        forget all cached values
+        """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+# shared by all cache managers of the process
+memory_cache = MemoryCache()
+
+
+class SqliteCacheManager():
+    """
+    cache many small json documents in a single sqlite key-value store
+    """
+    def __init__(self, db_name: str, base_folder: Union[str, None] = None):
+        """
+        constructor
+
+        Args:
+            db_name(str): name of the database file
+            base_folder(str|None): folder to put the database into
+        """
+        self.db_name = db_name
+        self.base_folder = base_folder
+
+    def db_path(self) -> str:
+        """
+        get path of the database
+
+        Returns:
+            str: the path to the sqlite database
+        """
+        root_path = f"{Path.home()}/.ceurws"
+        if self.base_folder:
+            root_path += f"/{self.base_folder}"
+        os.makedirs(root_path, exist_ok=True)  # make directory if it does not exist
+        return f"{root_path}/{self.db_name}.sqlite"
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Returns:
+            sqlite3.Connection: connection to the database with the key-value table present
+        """
+        connection = sqlite3.connect(self.db_path(), timeout=60)
+        connection.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+        return connection
+
+    def get_many(self, keys: List[str], chunk_size: int = 500) -> Dict[str, Any]:
+        """
+        load the documents stored under the given keys
+
+        Args:
+            keys(list(str)): keys of the documents
+            chunk_size(int): number of keys looked up per statement
+
+        Returns:
+            dict: documents by key, keys without document are missing
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        connection = self.connect()
+        try:
+            for start in range(0, len(keys), chunk_size):
+                chunk = keys[start:start + chunk_size]
+                rows = connection.execute(
+                    f"SELECT key, value FROM kv WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                found.update({key: orjson.loads(value) for key, value in rows})
+        finally:
+            connection.close()
+        return found
+
+    def put_many(self, documents: Dict[str, Any]):
+        """
+        store documents under the given keys, replacing present ones
+
+        Args:
+            documents(dict): documents by key
+        """
+        connection = self.connect()
+        try:
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                    [(key, orjson.dumps(value, default=str)) for key, value in documents.items()])
+        finally:
+            connection.close()
+
+    def get(self, key: str) -> Union[Any, None]:
+        """
+        Args:
+            key(str): key of the document
+
+        Returns:
+            object|None: the document or None if not present
+        """
+        return self.get_many([key]).get(key)
+
+    def put(self, key: str, document: Any):
+        """
+        Args:
+            key(str): key of the document
+            document(object): json serializable document to store
+        """
+        self.put_many({key: document})
+
+
 class JsonCacheManager():
     """
     cache json based volume information
     """
-    def __init__(self, base_url: str = "http://cvb.bitplan.com", base_folder: Union[str, None] = None):
+    created_folders = set()
+    document_store = None
+
+    def __init__(self, base_url: str = "http://cvb.bitplan.com", base_folder: Union[str, None] = None,
+                 retries: int = 3, backoff: float = 1.0, min_interval: float = 0.05, timeout: float = 30,
+                 ttl: Union[float, None] = None, compression: Union[str, None] = None,
+                 document_store: Union[SqliteCacheManager, None] = None):
         """
         constructor
 
         Args:
             base_url(str): base url of json provider
             base_folder(str|None): folder to put cached files into
+            retries(int): number of further attempts if a download fails temporarily
+            backoff(float): seconds to wait before the first retry, doubled for every further retry
+            min_interval(float): minimal seconds between the start of two downloads, shared by all threads
+            timeout(float): seconds to wait for the provider to answer
+            ttl(float|None): seconds after which a cached list is revalidated with the provider,
+                None to use cached lists forever
+            compression(str|None): 'gzip' or 'zstd' to compress cached lists, None to store them as plain json.
+                Compressed files are detected when reading regardless of this setting.
+            document_store(SqliteCacheManager|None): packed store to keep many small documents like the Vol-N
+                volumes in instead of a json file each. Present json files are still read and moved into the store.
         """
+        check_compression(compression)
         self.base_url = base_url
         self.base_folder = base_folder
+        self.retries = retries
+        self.backoff = backoff
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.ttl = ttl
+        self.compression = compression
+        self.document_store = document_store
+        self.request_lock = threading.Lock()
+        self.next_request = 0.0
 
     def json_path(self, lod_name: str) -> str:
         """
@@ -40,7 +264,10 @@ class JsonCacheManager():
         root_path = f"{Path.home()}/.ceurws"
         if self.base_folder:
             root_path += f"/{self.base_folder}"
-        os.makedirs(root_path, exist_ok=True)  # make directory if it does not exist
+        # this is called for every lookup, so only check the directory once
+        if root_path not in self.created_folders:
+            os.makedirs(root_path, exist_ok=True)  # make directory if it does not exist
+            self.created_folders.add(root_path)
         json_path = f"{root_path}/{lod_name}.json"
         return json_path
 
@@ -54,12 +281,19 @@ class JsonCacheManager():
         Returns:
             list(dict): the requested list of dicts
         """
+        if self.document_store is not None:
+            return self.load_lods([lod_name])[lod_name]
+
         json_path = self.json_path(lod_name)
+        if os.path.isfile(json_path) and self.is_stale(lod_name):
+            try:
+                return self.reload_lod(lod_name, revalidate=True)
+            except Exception as e:
+                # an outdated copy is better than none while the provider is unreachable
+                print(f"Using the cached {lod_name}, since it could not be revalidated: {str(e)}")
         if os.path.isfile(json_path):
             try:
-                with open(json_path, encoding="utf8") as json_file:
-                    json_str = json_file.read()
-                    lod = orjson.loads(json_str)
+                lod = read_json_file(json_path)
             except Exception as e:
                 msg = f"Could not read {lod_name} from {json_path} due to {str(e)}."
                 raise Exception(msg)
@@ -68,6 +302,153 @@ class JsonCacheManager():
             lod = self.reload_lod(lod_name)
         return lod
 
+    def iter_lod(self, lod_name: str, reload: bool = False, chunk_size: int = 1 << 20) -> Iterator[Dict]:
+        """
+        iterate over the dicts of a cached list of dicts without loading all of them at once.
+        The list is downloaded into the cache first if necessary.
+
+        Args:
+            lod_name(str): name of the list of dicts to iterate over
+            reload(bool): whether to download the list even if it is cached
+            chunk_size(int): number of characters to read from the file at once
+
+        Returns:
+            Iterator(dict): the dicts of the list one after another
+        """
+        if self.document_store is not None:
+            yield from (self.reload_lod(lod_name) if reload else self.load_lod(lod_name))
+            return
+
+        json_path = self.json_path(lod_name)
+        if reload or not os.path.isfile(json_path):
+            self.fetch_lod(lod_name)
+        elif self.is_stale(lod_name):
+            try:
+                self.fetch_lod(lod_name, revalidate=True)
+            except Exception as e:
+                print(f"Using the cached {lod_name}, since it could not be revalidated: {str(e)}")
+
+        decoder = json.JSONDecoder()
+        with io.TextIOWrapper(open_cache_file(json_path, "rb"), encoding="utf8") as json_file:
+            buffer = json_file.read(chunk_size).lstrip()
+            if not buffer.startswith("["):
+                raise Exception(f"Could not iterate {lod_name} from {json_path}, since it does not contain a list.")
+            position = 1
+            eof = False
+            while True:
+                # skip whitespace and separators between the elements
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position < len(buffer) and buffer[position] == "]":
+                    return
+                try:
+                    element, end = decoder.raw_decode(buffer, position)
+                    # the end of the buffer might have cut off a number or literal
+                    complete = end < len(buffer) or eof
+                except json.JSONDecodeError as e:
+                    if eof:
+                        raise Exception(f"Could not iterate {lod_name} from {json_path} due to {str(e)}.")
+                    complete = False
+                if complete:
+                    yield element
+                    position = end
+                    continue
+                # drop consumed text and read more
+                chunk = json_file.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+
+    def load_lods(self, lod_names: List[str], max_workers: int = 8) -> Dict[str, List[Dict]]:
+        """
+        load several lists of dicts at once,
+        the ones not cached yet are downloaded concurrently
+
+        Args:
+            lod_names(list(str)): names of the lists of dicts to get
+            max_workers(int): maximal number of concurrent downloads
+
+        Returns:
+            dict: the requested lists of dicts by name
+        """
+        lod_names = list(dict.fromkeys(lod_names))
+        if self.document_store is None:
+            load, found = self.load_lod, {}
+        else:
+            # a single indexed read for all stored documents
+            load, found = self.fetch_document, self.document_store.get_many(lod_names)
+        missing = [lod_name for lod_name in lod_names if lod_name not in found]
+
+        def attempt(lod_name: str) -> Tuple[Any, Union[Exception, None]]:
+            # a failing list must not discard the ones loaded successfully
+            try:
+                return load(lod_name), None
+            except Exception as e:
+                return None, e
+
+        if max_workers <= 1 or len(missing) <= 1:
+            results = [attempt(lod_name) for lod_name in missing]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(attempt, missing))
+        loaded = {lod_name: lod for lod_name, (lod, error) in zip(missing, results) if error is None}
+        errors = [error for _, error in results if error is not None]
+
+        if self.document_store is not None and loaded:
+            self.document_store.put_many(loaded)
+            # json files of earlier runs are now in the store
+            for lod_name in loaded:
+                if os.path.isfile(json_path := self.json_path(lod_name)):
+                    os.remove(json_path)
+        if errors:
+            raise errors[0]
+
+        found.update(loaded)
+        return {lod_name: found[lod_name] for lod_name in lod_names}
+
+    def fetch_document(self, lod_name: str) -> Any:
+        """
+        get a document missing in the document store from its json file of earlier runs or the url
+
+        Args:
+            lod_name(str): name of the document
+
+        Returns:
+            object: the parsed json document
+        """
+        json_path = self.json_path(lod_name)
+        if os.path.isfile(json_path):
+            try:
+                return read_json_file(json_path)
+            except Exception as e:
+                msg = f"Could not read {lod_name} from {json_path} due to {str(e)}."
+                raise Exception(msg)
+        return self.download_document(lod_name)
+
+    def download_document(self, lod_name: str) -> Any:
+        """
+        download and parse a json document without writing it into the cache folder
+
+        Args:
+            lod_name(str): name of the document
+
+        Returns:
+            object: the parsed json document
+        """
+        url = f'{self.base_url}/{lod_name}.json'
+        part_path = f"{self.json_path(lod_name)}.part"
+        try:
+            # download errors already name the list and the source
+            self.download_lod(lod_name, part_path)
+            try:
+                return read_json_file(part_path)
+            except Exception as e:
+                msg = f"Could not read {lod_name} from source {url} due to {str(e)}."
+                raise Exception(msg)
+        finally:
+            if os.path.isfile(part_path):
+                os.remove(part_path)
+
     def store_lod(self, lod_name: str, lod: List[Dict], indent: bool = False):
         """
         stores list of dicts according to the given name
@@ -77,55 +458,369 @@ class JsonCacheManager():
             lod(list(dict)): list of dicts to cache
             indent(bool): whether to format the json file to be readable
         """
+        if self.document_store is not None:
+            self.document_store.put(lod_name, lod)
+            return
+
         store_path = self.json_path(lod_name)
-        with open(store_path, 'wb') as json_file:
+        with open_cache_file(store_path, 'wb', self.compression) as json_file:
             json_str = (orjson.dumps(lod, default=str) if not indent
                         else orjson.dumps(lod, option=orjson.OPT_INDENT_2, default=str))
             json_file.write(json_str)
             pass
 
-    def reload_lod(self, lod_name: str) -> List[Dict]:
+    def reload_lod(self, lod_name: str, revalidate: bool = False) -> List[Dict]:
         """
         forces load from url and may overwrite local copy
 
         Args:
             lod_name(str): name of the list of dicts to reload
+            revalidate(bool): whether to ask the provider if the cached copy changed
+                and only download the list if so
 
         Returns:
             list: the reloaded list of dicts
         """
+        if self.document_store is not None:
+            lod = self.download_document(lod_name)
+            self.document_store.put(lod_name, lod)
+            return lod
+
+        url = f'{self.base_url}/{lod_name}.json'
+        json_path = self.json_path(lod_name)
+        part_path = f"{json_path}.part"
+        meta = self.load_meta(lod_name) if revalidate and os.path.isfile(json_path) else None
         try:
-            url = f'{self.base_url}/{lod_name}.json'
-            with urllib.request.urlopen(url) as source:
-                json_str = source.read()
-                lod = orjson.loads(json_str)
-        except Exception as e:
-            msg = f"Could not read {lod_name} from source {url} due to {str(e)}."
-            raise Exception(msg)
+            # download errors already name the list and the source
+            new_meta = self.download_lod(lod_name, part_path, meta)
+            try:
+                lod = read_json_file(part_path if new_meta is not None else json_path)
+            except Exception as e:
+                msg = f"Could not read {lod_name} from source {url} due to {str(e)}."
+                raise Exception(msg)
+        except Exception:
+            if os.path.isfile(part_path):
+                os.remove(part_path)
+            raise
 
-        self.store_lod(lod_name, lod)
+        if new_meta is None:
+            # not modified, so the cached copy is valid for another ttl
+            meta["fetched"] = time.time()
+            self.store_meta(lod_name, meta)
+        else:
+            # only replace the cached copy by valid json
+            os.replace(part_path, json_path)
+            self.store_meta(lod_name, new_meta)
         return lod
 
+    def fetch_lod(self, lod_name: str, revalidate: bool = False) -> bool:
+        """
+        download the json of a list of dicts into the cache without parsing it
+
+        Args:
+            lod_name(str): name of the list of dicts to download
+            revalidate(bool): whether to only download the list if it changed since the cached copy
+
+        Returns:
+            bool: whether the cached copy was replaced
+        """
+        json_path = self.json_path(lod_name)
+        part_path = f"{json_path}.part"
+        meta = self.load_meta(lod_name) if revalidate and os.path.isfile(json_path) else None
+        try:
+            new_meta = self.download_lod(lod_name, part_path, meta)
+        except Exception:
+            if os.path.isfile(part_path):
+                os.remove(part_path)
+            raise
+        if new_meta is None:
+            meta["fetched"] = time.time()
+            self.store_meta(lod_name, meta)
+            return False
+
+        os.replace(part_path, json_path)
+        self.store_meta(lod_name, new_meta)
+        return True
+
+    def download_lod(self, lod_name: str, path: str, meta: Union[Dict, None] = None) -> Union[Dict, None]:
+        """
+        stream the json of a list of dicts from the url into a file without holding it in memory
+
+        Args:
+            lod_name(str): name of the list of dicts to download
+            path(str): file to write the json to
+            meta(dict|None): metadata of the cached copy to make the request conditional on
+
+        Returns:
+            dict|None: the metadata of the download, None if the cached copy is not modified
+        """
+        url = f'{self.base_url}/{lod_name}.json'
+        headers = {}
+        if meta and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta and meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        request = urllib.request.Request(url, headers=headers)
+
+        for attempt in range(self.retries + 1):
+            try:
+                self.wait_for_request()
+                with urllib.request.urlopen(request, timeout=self.timeout) as source:
+                    with open_cache_file(path, "wb", self.compression) as target:
+                        shutil.copyfileobj(source, target, 1 << 20)
+                    return {"etag": source.headers.get("ETag"), "last_modified": source.headers.get("Last-Modified"),
+                            "fetched": time.time()}
+            except Exception as e:
+                if isinstance(e, urllib.error.HTTPError) and e.code == 304 and headers:
+                    return None
+                if attempt < self.retries and self.is_temporary(e):
+                    time.sleep(self.backoff * 2 ** attempt)
+                    continue
+                msg = f"Could not read {lod_name} from source {url} due to {str(e)}."
+                raise Exception(msg)
+
+    def meta_path(self, lod_name: str) -> str:
+        """
+        get path of the metadata of the cached copy of a list of dicts
+
+        Args:
+            lod_name(str): name of the list of dicts
+
+        Returns:
+            str: the path of the metadata next to the cached json
+        """
+        return f"{self.json_path(lod_name)}.meta"
+
+    def load_meta(self, lod_name: str) -> Dict:
+        """
+        load ETag, Last-Modified and time of the last download of a cached list of dicts
+
+        Args:
+            lod_name(str): name of the list of dicts
+
+        Returns:
+            dict: the metadata, empty if unknown
+        """
+        meta_path = self.meta_path(lod_name)
+        if not os.path.isfile(meta_path):
+            return {}
+        try:
+            return read_json_file(meta_path)
+        except ValueError:
+            return {}
+
+    def store_meta(self, lod_name: str, meta: Dict):
+        """
+        store the metadata of a cached list of dicts
+
+        Args:
+            lod_name(str): name of the list of dicts
+            meta(dict): ETag, Last-Modified and time of the last download
+        """
+        with open(self.meta_path(lod_name), "wb") as meta_file:
+            meta_file.write(orjson.dumps(meta))
+
+    def is_stale(self, lod_name: str) -> bool:
+        """
+        check whether the cached copy of a list of dicts is older than the ttl
+
+        Args:
+            lod_name(str): name of the list of dicts
+
+        Returns:
+            bool: True if the copy should be revalidated, always False without ttl
+        """
+        if self.ttl is None:
+            return False
+        fetched = self.load_meta(lod_name).get("fetched")
+        if fetched is None:
+            # copies from before metadata existed count by their modification time
+            fetched = os.path.getmtime(self.json_path(lod_name))
+        return time.time() - fetched > self.ttl
+
+    def wait_for_request(self):
+        """
+        wait until the next download may start to not flood the provider
+        """
+        with self.request_lock:
+            now = time.monotonic()
+            start = max(now, self.next_request)
+            self.next_request = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+    @staticmethod
+    def is_temporary(error: Exception) -> bool:
+        """
+        check whether a failed download might succeed if repeated
+
+        Args:
+            error(Exception): the error of the download
+
+        Returns:
+            bool: False for client errors and invalid json, True otherwise
+        """
+        if isinstance(error, urllib.error.HTTPError):
+            return error.code == 429 or error.code >= 500
+        return isinstance(error, (urllib.error.URLError, OSError))
+
+
+def read_json_file(path: str) -> Any:
+    """
+    parse a json file directly from a memory map instead of copying it into a string first,
+    compressed files are decompressed in memory.
+    The text of small files is kept in the memory cache, so reading them again skips the disk.
+
+    Args:
+        path(str): path of the json file
+
+    Returns:
+        Any: the parsed json
+    """
+    # the parsed json may be changed by the caller, so only the text is kept in memory
+    json_bytes = memory_cache.get(path, "bytes")
+    if json_bytes is not None:
+        return orjson.loads(json_bytes)
+
+    stamp = memory_cache.stamp(path)
+    with open(path, "rb") as json_file:
+        size = os.fstat(json_file.fileno()).st_size
+        if size == 0:
+            raise ValueError("the file is empty")
+        with mmap.mmap(json_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if compression_of(mapped[:4]) is not None:
+                with open_cache_file(path, "rb") as source:
+                    json_bytes = source.read()
+            elif size <= max_cached_json_bytes:
+                json_bytes = mapped[:]
+            else:
+                with memoryview(mapped) as view:
+                    return orjson.loads(view)
+
+    document = orjson.loads(json_bytes)
+    if len(json_bytes) <= max_cached_json_bytes:
+        memory_cache.put(path, "bytes", json_bytes, len(json_bytes), stamp)
+    return document
+
+
+# larger json files are parsed from the memory map without keeping their text
+max_cached_json_bytes = 16 * 1024 * 1024
+
+
+compressions = ["gzip", "zstd"]
+compression_magic = {b"\x1f\x8b": "gzip", b"\x28\xb5\x2f\xfd": "zstd"}
+
+
+def compression_of(head: bytes) -> Union[str, None]:
+    """
+    detect the compression of a file by its magic bytes
+
+    Args:
+        head(bytes): the first four bytes of the file
+
+    Returns:
+        str|None: 'gzip', 'zstd' or None for uncompressed files
+    """
+    for magic, compression in compression_magic.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def detect_compression(path: str) -> Union[str, None]:
+    """
+    detect the compression of a file by its magic bytes
+
+    Args:
+        path(str): path of the file
+
+    Returns:
+        str|None: 'gzip', 'zstd' or None for uncompressed files
+    """
+    with open(path, "rb") as file:
+        return compression_of(file.read(4))
+
+
+def check_compression(compression: Union[str, None]):
+    """
+    check that a compression is known and can be used
+
+    Args:
+        compression(str|None): 'gzip', 'zstd' or None
+    """
+    if compression is not None and compression not in compressions:
+        raise ValueError(f"Unknown compression {compression}, expected one of {compressions}.")
+    if compression == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            raise ValueError("Compressing with zstd requires zstandard.")
+
+
+def open_cache_file(path: str, mode: str, compression: Union[str, None] = None) -> IO:
+    """
+    open a cached file in binary mode, decompressing it transparently when reading
+
+    Args:
+        path(str): path of the file
+        mode(str): 'rb' to read the file in the compression found, 'wb' to write it
+        compression(str|None): 'gzip', 'zstd' or None to write the file uncompressed
+
+    Returns:
+        IO: binary file object
+    """
+    if mode == "rb":
+        compression = detect_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, mode, compresslevel=6)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception(f"Could not open {path}, since reading zstd requires zstandard.")
+        file = open(path, mode)
+        if mode == "rb":
+            return zstandard.ZstdDecompressor().stream_reader(file, closefd=True)
+        return zstandard.ZstdCompressor(level=3).stream_writer(file, closefd=True)
+    return open(path, mode)
+
 
 class CsvCacheManager():
     """
-    cache pandas dataframe based information as csv
+    cache pandas dataframe based information as parquet, feather or csv
     """
-    def __init__(self, base_folder: Union[str, None] = None):
+    file_formats = ["parquet", "feather", "csv"]
+
+    def __init__(self, base_folder: Union[str, None] = None, file_format: str = "auto",
+                 compression: Union[str, None] = None):
         """
         constructor
 
         Args:
             base_folder(str|None): folder to put cached files into
+            file_format(str): one of 'parquet', 'feather' or 'csv' to store dataframes in,
+                'auto' for parquet if pyarrow is installed and csv otherwise
+            compression(str|None): 'gzip' or 'zstd' to compress cached dataframes,
+                None for plain csv and the default compression of the columnar formats
         """
         self.base_folder = base_folder
+        check_compression(compression)
+        self.compression = compression
+        if file_format == "auto":
+            file_format = "parquet" if has_pyarrow() else "csv"
+        if file_format not in self.file_formats:
+            raise ValueError(f"Unknown file format {file_format}, expected one of {self.file_formats}.")
+        if file_format != "csv" and not has_pyarrow():
+            raise ValueError(f"Storing dataframes as {file_format} requires pyarrow.")
+        self.file_format = file_format
 
-    def save_path(self, df_name: str) -> str:
+    def save_path(self, df_name: str, file_format: str = "csv") -> str:
         """
-        get path where dataframe with given name would be cached as csv
+        get path where dataframe with given name would be cached in the given format
 
         Args:
             lod_name(str): name of the dataframe to get from cache
+            file_format(str): format of the cached file
 
         Returns:
             str: the path to the lust of dicts cache
@@ -134,12 +829,13 @@ class CsvCacheManager():
         if self.base_folder:
             root_path += f"/{self.base_folder}"
         os.makedirs(root_path, exist_ok=True)  # make directory if it does not exist
-        csv_path = f"{root_path}/{df_name}.csv"
+        csv_path = f"{root_path}/{df_name}.{file_format}"
         return csv_path
 
     def load_csv(self, df_name: str) -> Union[pd.DataFrame, None]:
         """
-        load pandas DataFrmae from cache if possible
+        load pandas DataFrmae from cache if possible.
+        Columnar files are preferred over csv, since they keep the dtypes.
 
         Args:
             df_name(str): name of the dataframe to get from cache
@@ -147,25 +843,229 @@ class CsvCacheManager():
         Returns:
             pandas.DataFrame|None: the requested dataframe or None
         """
-        csv_path = self.save_path(df_name)
-        if os.path.isfile(csv_path):
+        for file_format in self.file_formats:
+            path = self.save_path(df_name, file_format)
+            if not os.path.isfile(path):
+                continue
+            if file_format != "csv" and not has_pyarrow():
+                continue
+            # frames loaded before are copied, so callers may change them
+            df = memory_cache.get(path, "frame")
+            if df is not None:
+                return df.copy()
+            stamp = memory_cache.stamp(path)
             try:
-                df = pd.read_csv(csv_path)
+                if file_format == "csv":
+                    df = pd.read_csv(path, compression=detect_compression(path))
+                else:
+                    df = read_columnar(path, file_format)
             except Exception as e:
-                msg = f"Could not read {df_name} from {csv_path} due to {str(e)}."
+                msg = f"Could not read {df_name} from {path} due to {str(e)}."
                 raise Exception(msg)
-        else:
-            df = None
+            memory_cache.put(path, "frame", df.copy(), int(df.memory_usage(deep=True).sum()), stamp)
+            return df
 
-        return df
+        return None
 
     def store_csv(self, csv_name: str, df: pd.DataFrame):
         """
-        stores list of dicts according to the given name
+        stores list of dicts according to the given name.
+        Falls back to csv if the dataframe can not be stored in a columnar format,
+        e.g. due to columns with mixed types.
 
         Args:
             csv_name(str): name of the csv file
             df(pandas.DataFrame): dataframe to cache
         """
-        store_path = self.save_path(csv_name)
-        df.to_csv(store_path)
+        stored = "csv"
+        if self.file_format != "csv":
+            store_path = self.save_path(csv_name, self.file_format)
+            try:
+                if self.file_format == "parquet":
+                    df.to_parquet(store_path, compression=self.compression or "snappy")
+                else:
+                    # feather can not store an index and only compresses with zstd or lz4
+                    options = {"compression": "zstd"} if self.compression else {}
+                    df.reset_index(drop=True).to_feather(store_path, **options)
+                stored = self.file_format
+            except (ValueError, TypeError, NotImplementedError):
+                if os.path.isfile(store_path):
+                    os.remove(store_path)
+
+        if stored == "csv":
+            df.to_csv(self.save_path(csv_name, "csv"),
+                      compression={"method": self.compression} if self.compression else None)
+
+        # remove outdated copies in the other formats
+        for file_format in self.file_formats:
+            if file_format != stored and os.path.isfile(path := self.save_path(csv_name, file_format)):
+                os.remove(path)
+
+    def remove_csv(self, csv_name: str):
+        """
+        removes the cached dataframe of the given name in all formats together with its metadata
+
+        Args:
+            csv_name(str): name of the cached dataframe
+        """
+        for file_format in self.file_formats + ["meta"]:
+            if os.path.isfile(path := self.save_path(csv_name, file_format)):
+                os.remove(path)
+
+    def meta_path(self, df_name: str) -> str:
+        """
+        get path of the metadata of a cached dataframe
+
+        Args:
+            df_name(str): name of the dataframe
+
+        Returns:
+            str: the path of the metadata next to the cached dataframe
+        """
+        return self.save_path(df_name, "meta")
+
+    def load_meta(self, df_name: str) -> Dict:
+        """
+        load the metadata of a cached dataframe, e.g. when it was last synchronized with its source
+
+        Args:
+            df_name(str): name of the dataframe
+
+        Returns:
+            dict: the metadata, empty if unknown
+        """
+        meta_path = self.meta_path(df_name)
+        if not os.path.isfile(meta_path):
+            return {}
+        try:
+            return read_json_file(meta_path)
+        except ValueError:
+            return {}
+
+    def store_meta(self, df_name: str, meta: Dict):
+        """
+        store the metadata of a cached dataframe
+
+        Args:
+            df_name(str): name of the dataframe
+            meta(dict): metadata to store
+        """
+        with open(self.meta_path(df_name), "wb") as meta_file:
+            meta_file.write(orjson.dumps(meta))
+
+    def cached_names(self, prefix: str = "") -> List[str]:
+        """
+        Args:
+            prefix(str): only list dataframes whose name starts with it
+
+        Returns:
+            list(str): names of the cached dataframes in any format
+        """
+        folder = os.path.dirname(self.save_path(prefix or "_"))
+        names = set()
+        for file_name in os.listdir(folder):
+            name, _, file_format = file_name.rpartition(".")
+            if file_format in self.file_formats and name.startswith(prefix):
+                names.add(name)
+        return sorted(names)
+
+
+def has_pyarrow() -> bool:
+    """
+    Returns:
+        bool: whether pyarrow is installed to read and write columnar files
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def read_columnar(path: str, file_format: str) -> pd.DataFrame:
+    """
+    read a memory mapped parquet or feather file
+
+    Args:
+        path(str): path of the file
+        file_format(str): 'parquet' or 'feather'
+
+    Returns:
+        pandas.DataFrame: the stored dataframe with lists as lists instead of numpy arrays
+    """
+    import pyarrow
+    if file_format == "parquet":
+        from pyarrow import parquet
+        table = parquet.read_table(path, memory_map=True)
+    else:
+        from pyarrow import feather
+        table = feather.read_table(path, memory_map=True)
+
+    df = table.to_pandas()
+    for field in table.schema:
+        if pyarrow.types.is_list(field.type) or pyarrow.types.is_large_list(field.type):
+            df[field.name] = df[field.name].map(
+                lambda value: value.tolist() if isinstance(value, np.ndarray) else value)
+    return df
+
+
+class PickleCacheManager():
+    """
+    cache arbitrary python objects like fitted models as pickle
+    """
+    def __init__(self, base_folder: Union[str, None] = None):
+        """
+        constructor
+
+        Args:
+            base_folder(str|None): folder to put cached files into
+        """
+        self.base_folder = base_folder
+
+    def pickle_path(self, name: str) -> str:
+        """
+        get path where the object with given name would be cached as pickle
+
+        Args:
+            name(str): name of the object to get from cache
+
+        Returns:
+            str: the path to the object cache
+        """
+        root_path = f"{Path.home()}/.ceurws"
+        if self.base_folder:
+            root_path += f"/{self.base_folder}"
+        os.makedirs(root_path, exist_ok=True)  # make directory if it does not exist
+        return f"{root_path}/{name}.pkl"
+
+    def load_pickle(self, name: str) -> Union[Any, None]:
+        """
+        load object from cache if possible
+
+        Args:
+            name(str): name of the object to get from cache
+
+        Returns:
+            object|None: the requested object or None
+        """
+        pickle_path = self.pickle_path(name)
+        if not os.path.isfile(pickle_path):
+            return None
+        try:
+            with open(pickle_path, "rb") as pickle_file:
+                return pickle.load(pickle_file)
+        except Exception as e:
+            msg = f"Could not read {name} from {pickle_path} due to {str(e)}."
+            raise Exception(msg)
+
+    def store_pickle(self, name: str, obj: Any):
+        """
+        stores object according to the given name
+
+        Args:
+            name(str): name of the pickle file
+            obj(object): object to cache
+        """
+        store_path = self.pickle_path(name)
+        with open(store_path, "wb") as pickle_file:
+            pickle.dump(obj, pickle_file, protocol=pickle.HIGHEST_PROTOCOL)
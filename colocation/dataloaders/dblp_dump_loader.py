@@ -0,0 +1,125 @@
+'''
+Created on 2026-10-17
+@author: nm
+
+Offline source for the Dblp conferences and Ceur-WS workshops reading the dblp.xml dump.
+'''
+import html.entities
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Tuple, Union
+import pandas as pd
+from colocation.cache_manager import open_cache_file
+
+dblp_rec_prefix = "https://dblp.org/rec/"
+dblp_base_url = "https://dblp.org/"
+doi_prefixes = ["https://doi.org/", "http://doi.org/", "https://dx.doi.org/", "http://dx.doi.org/"]
+ceur_series = "CEUR Workshop Proceedings"
+
+
+class ProceedingsCollector():
+    """
+    Target for the xml parser collecting the fields of the proceedings records of the dump.
+    All other records are skipped.
+    """
+    fields = ["title", "series", "volume", "url", "ee"]
+
+    def __init__(self):
+        """
+        constructor
+        """
+        self.proceedings: List[Dict[str, Union[str, List[str]]]] = []
+        self.depth = 0
+        self.record: Union[Dict[str, Union[str, List[str]]], None] = None
+        self.field: Union[str, None] = None
+        self.text: List[str] = []
+
+    def start(self, tag: str, attrib: Dict[str, str]):
+        self.depth += 1
+        if self.depth == 2 and tag == "proceedings":
+            self.record = {"key": attrib.get("key", ""), "ee": []}
+        elif self.depth == 3 and self.record is not None and tag in self.fields:
+            self.field = tag
+            self.text = []
+
+    def end(self, tag: str):
+        if self.depth == 3 and self.field is not None:
+            text = "".join(self.text).strip()
+            if self.field == "ee":
+                self.record["ee"].append(text)
+            # only the first occurrence of the other fields is kept
+            elif self.field not in self.record:
+                self.record[self.field] = text
+            self.field = None
+        elif self.depth == 2 and self.record is not None:
+            self.proceedings.append(self.record)
+            self.record = None
+        self.depth -= 1
+
+    def data(self, data: str):
+        # markup within a field like <i> in titles is part of its text
+        if self.field is not None:
+            self.text.append(data)
+
+    def close(self) -> List[Dict[str, Union[str, List[str]]]]:
+        return self.proceedings
+
+
+def read_dblp_proceedings(dump_path: str, chunk_size: int = 1 << 20) -> List[Dict[str, Union[str, List[str]]]]:
+    """
+    Stream the dblp.xml dump in a single pass and collect the proceedings records.
+
+    Args:
+        dump_path(str): path of dblp.xml, which may be compressed with gzip or zstd
+        chunk_size(int): number of bytes to read at once
+
+    Returns:
+        list(dict): key, title, series, volume, url and list of ee of every proceedings record
+    """
+    collector = ProceedingsCollector()
+    parser = ET.XMLParser(target=collector)
+    # the dump uses the html entities declared in dblp.dtd
+    parser.entity.update({name: chr(codepoint) for name, codepoint in html.entities.name2codepoint.items()})
+    with open_cache_file(dump_path, "rb") as dump_file:
+        for chunk in iter(lambda: dump_file.read(chunk_size), b""):
+            parser.feed(chunk)
+    return parser.close()
+
+
+def read_dblp_dump(dump_path: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Build the conference and Ceur-WS workshop tables from the dblp.xml dump
+    with the same columns the SPARQL queries of the dblp loader produce.
+
+    Args:
+        dump_path(str): path of dblp.xml, which may be compressed with gzip or zstd
+
+    Returns:
+        tuple(pandas.DataFrame, pandas.DataFrame): conferences with the columns 'volume', 'event', 'title', 'doi'
+            and all Ceur-WS workshops with the columns 'number', 'volume', 'dblpid', 'urn'
+    """
+    conferences = []
+    workshops = []
+    for record in read_dblp_proceedings(dump_path):
+        key = record["key"]
+        volume = dblp_rec_prefix + key
+
+        if record.get("series") == ceur_series and record.get("volume"):
+            urns = [ee[ee.index("urn:"):] for ee in record["ee"] if "urn:nbn:" in ee]
+            workshops.append({
+                "number": record["volume"], "volume": volume, "dblpid": key, "urn": urns[0] if urns else None
+            })
+
+        # like the query, only conference volumes with a table of contents and conference in the title
+        title = record.get("title", "")
+        if "conf" in key.lower() and "conference" in title.lower() and record.get("url"):
+            # the url of the table of contents is relative like db/conf/aaai/aaai2019.html
+            url = record["url"].split("#")[0]
+            event = dblp_base_url + (url[:-5] if url.endswith(".html") else url)
+            dois = [ee for ee in record["ee"] if any(ee.startswith(prefix) for prefix in doi_prefixes)]
+            conferences.append({
+                "volume": volume, "event": event, "title": title,
+                "doi": dois[0].split("doi.org/", 1)[1] if dois else None
+            })
+
+    return (pd.DataFrame(conferences, columns=["volume", "event", "title", "doi"]),
+            pd.DataFrame(workshops, columns=["number", "volume", "dblpid", "urn"]))
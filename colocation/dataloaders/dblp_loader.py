@@ -4,31 +4,44 @@ Created on 2023-07-28
 '''
 
 from colocation.cache_manager import CsvCacheManager
+from colocation.dataloaders.sparql_client import get_client
+from colocation.dataloaders.dblp_dump_loader import read_dblp_dump
+from concurrent.futures import ThreadPoolExecutor
 from lodstorage.query import Query
-from lodstorage.sparql import SPARQL
 import pandas as pd
-from typing import List, Dict
+from typing import Callable, List, Dict, Tuple, Union
+import os
 import re
 
 dblp_cacher = CsvCacheManager(base_folder="dblp")
 
+# endpoint all Dblp queries are sent to
+dblp_endpoint_url = "https://sparql.dblp.org/sparql"
+# number of values inlined into one query and number of such queries sent at the same time
+values_chunk_size = 500
+max_concurrent_queries = 4
+# local dblp.xml(.gz) dump to read conferences and workshops from instead of querying the endpoint
+dblp_dump_path: Union[str, None] = None
 
-def query_dblp(query) -> List[Dict]:
+
+def query_dblp(query, endpoint_url: Union[str, None] = None) -> List[Dict]:
     """
     Helper function that performs the Dblp query.
 
     Args:
         query: pylodstorage query to execute.
+        endpoint_url(str|None): SPARQL endpoint to query, the Dblp endpoint by default
 
     Returns:
         list(dict): resulting lod
     """
-    endpoint_url = "https://sparql.dblp.org/sparql"
-    endpoint = SPARQL(endpoint_url)
+    endpoint_url = endpoint_url or dblp_endpoint_url
+    # the client is shared, so its connections are reused and concurrent queries are limited per endpoint
+    endpoint = get_client(endpoint_url, max_concurrent=max_concurrent_queries)
     q = Query(**query)
 
     try:
-        lod = endpoint.queryAsListOfDicts(q.query)
+        lod = endpoint.query(q.query)
     except Exception as ex:
         print(f"{q.title} at {endpoint_url} failed: {str(ex)}")
         raise ex
@@ -36,6 +49,35 @@ def query_dblp(query) -> List[Dict]:
     return lod
 
 
+def query_dblp_batched(build_query: Callable[[str], Dict], values: List[str],
+                       chunk_size: Union[int, None] = None, max_workers: Union[int, None] = None) -> List[Dict]:
+    """
+    Performs a Dblp query inlining the given values into a VALUES clause.
+    To keep the queries small, the values are split into chunks queried concurrently.
+
+    Args:
+        build_query(callable): creates the pylodstorage query given the space separated values of one chunk
+        values(list(str)): SPARQL terms to inline, duplicates are only queried once
+        chunk_size(int|None): maximal number of values per query, values_chunk_size by default
+        max_workers(int|None): maximal number of queries running at the same time, max_concurrent_queries by default
+
+    Returns:
+        list(dict): resulting lods of all chunks in the order of the values
+    """
+    chunk_size = chunk_size or values_chunk_size
+    max_workers = max_workers or max_concurrent_queries
+
+    values = list(dict.fromkeys(values))
+    chunks = [" ".join(values[i:i + chunk_size]) for i in range(0, len(values), chunk_size)]
+    if not chunks:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        lods = list(executor.map(lambda chunk: query_dblp(build_query(chunk)), chunks))
+
+    return [record for lod in lods for record in lod]
+
+
 def guess_dblp_conference(workshop_df: pd.DataFrame) -> pd.DataFrame:
     """
     Helper function for get_dblp_workshops.
@@ -66,24 +108,25 @@ def verify_dblp_uris(dblp_uris: pd.Series) -> pd.Series:
     Returns:
         pandas.Series: column of the same shape as the input with corresponding truth value.
     """
-    uris = [f"<{proceeding}>" for proceeding in dblp_uris.to_list()]
-
-    verify_query = {
-        "lang": "sparql",
-        "name": "Verify uris",
-        "title": "Verification",
-        "description": "Dblp SPARQL query checking if the uri has any property",
-        "query": f"""
+    uris = [f"<{proceeding}>" for proceeding in dblp_uris.dropna().to_list()]
+
+    def verify_query(values: str) -> Dict:
+        return {
+            "lang": "sparql",
+            "name": "Verify uris",
+            "title": "Verification",
+            "description": "Dblp SPARQL query checking if the uri has any property",
+            "query": f"""
 PREFIX dblp: <https://dblp.org/rdf/schema#>
 select distinct ?dblp
 where {{
-  Values ?dblp {{ {" ".join(uris)} }}.
+  Values ?dblp {{ {values} }}.
   ?dblp ?p ?o.
 }}
 """
-    }
+        }
 
-    lod = query_dblp(verify_query)
+    lod = query_dblp_batched(verify_query, uris)
     results = [res["dblp"] for res in lod]
 
     truth_column = dblp_uris.map(lambda x: x in results)
@@ -105,24 +148,25 @@ def verify_dblp_events(dblp_uris: pd.Series, dblp_event_urls: pd.Series) -> pd.S
     if (a := dblp_uris.shape[0]) != (b := dblp_event_urls.shape[0]):
         raise ValueError(f"Series have different shapes: {a,b}.")
 
-    uris = [f"<{proceeding}>" for proceeding in dblp_uris.to_list()]
+    uris = [f"<{proceeding}>" for proceeding in dblp_uris.dropna().to_list()]
 
-    verify_query = {
-        "lang": "sparql",
-        "name": "Verify event url",
-        "title": "Verification",
-        "description": "Dblp SPARQL query getting the toc page of the conference proceeedings",
-        "query": f"""
+    def verify_query(values: str) -> Dict:
+        return {
+            "lang": "sparql",
+            "name": "Verify event url",
+            "title": "Verification",
+            "description": "Dblp SPARQL query getting the toc page of the conference proceeedings",
+            "query": f"""
 PREFIX dblp: <https://dblp.org/rdf/schema#>
 select distinct ?dblp ?event
 where {{
-  Values ?dblp {{ {" ".join(uris)} }}.
+  Values ?dblp {{ {values} }}.
   ?dblp dblp:listedOnTocPage ?event.
 }}
 """
-    }
+        }
 
-    lod = query_dblp(verify_query)
+    lod = query_dblp_batched(verify_query, uris)
     assingment_dict = {pair["dblp"]: pair["event"] for pair in lod}
 
     toc_pages = dblp_uris.map(lambda x: assingment_dict[x] if x in assingment_dict else None)
@@ -132,7 +176,8 @@ where {{
 
 
 def get_dblp_workshops(workshop_numbers: List[int], number_key: str = "number",
-                       name: str = "volumes", reload: bool = False) -> pd.DataFrame:
+                       name: str = "volumes", reload: bool = False,
+                       dump_path: Union[str, None] = None) -> pd.DataFrame:
     """
     Use a SPARQL query to get all Ceur-WS workshops from the given list of ids from Dblp.
     Cache the result using the specified name and reuse, unless reload is specified.
@@ -142,22 +187,32 @@ def get_dblp_workshops(workshop_numbers: List[int], number_key: str = "number",
         name(str) : name to differentiate queries for different purposes.
         number_key(str): name the number attribute should have
         reload(bool) : whether to force reload the conferences instead of taking from cache.
+        dump_path(str|None): dblp.xml dump to take the workshops from instead, dblp_dump_path by default
 
     Returns:
         pandas.DataFrame: DataFrame containing relevant information about the Ceur-WS volumes,
                           including guess for proceedings of the co-located conference.
     """
+    dump_path = dump_path or dblp_dump_path
+    if dump_path:
+        _, workshops = load_dblp_dump(dump_path, reload)
+        numbers = [str(number) for number in workshop_numbers]
+        df = workshops[workshops["number"].astype(str).isin(numbers)].reset_index(drop=True)
+        df = df.rename(columns={"number": number_key})
+        return guess_dblp_conference(df)
+
     file_name = f"workshops-{name}"
     df = dblp_cacher.load_csv(file_name)
     if not reload and df is not None:
         return df
 
-    workshop_query = {
-        "lang": "sparql",
-        "name": "DWS",
-        "title": "DWorkshops",
-        "description": "Dblp SPARQL query getting academic workshops with relevant information",
-        "query": f"""
+    def workshop_query(values: str) -> Dict:
+        return {
+            "lang": "sparql",
+            "name": "DWS",
+            "title": "DWorkshops",
+            "description": "Dblp SPARQL query getting academic workshops with relevant information",
+            "query": f"""
 PREFIX datacite: <http://purl.org/spar/datacite/>
 PREFIX dblp: <https://dblp.org/rdf/schema#>
 PREFIX litre: <http://purl.org/spar/literal/>
@@ -166,7 +221,7 @@ WHERE{{
 ?volume dblp:publishedIn "CEUR Workshop Proceedings" ;
     dblp:publishedInSeries "CEUR Workshop Proceedings" ;
     dblp:publishedInSeriesVolume ?{number_key}.
-    VALUES ?{number_key} {{{" ".join([f'"{number}"' for number in workshop_numbers])}}}.  # dblp needs number as string
+    VALUES ?{number_key} {{{values}}}.  # dblp needs number as string
     ?volume datacite:hasIdentifier ?s.
     ?s	datacite:usesIdentifierScheme datacite:dblp-record ;
         litre:hasLiteralValue ?dblpid ;
@@ -179,9 +234,9 @@ WHERE{{
     }}
  }}
 """
-    }
+        }
 
-    lod = query_dblp(workshop_query)
+    lod = query_dblp_batched(workshop_query, [f'"{number}"' for number in workshop_numbers])
     df = pd.DataFrame(lod)
 
     df = guess_dblp_conference(df)
@@ -191,17 +246,23 @@ WHERE{{
     return df
 
 
-def get_dblp_conferences(reload: bool = False) -> pd.DataFrame:
+def get_dblp_conferences(reload: bool = False, dump_path: Union[str, None] = None) -> pd.DataFrame:
     """
     Use a SPARQL query to get all conferences from Dblp.
     Cache the result and reuse, unless reload is specified.
 
     Args:
         reload(bool) : whether to force reload the conferences instead of taking from cache.
+        dump_path(str|None): dblp.xml dump to take the conferences from instead, dblp_dump_path by default
 
     Returns:
         pandas.DataFrame: conferences with columns 'volume', 'event', 'title', 'doi'
     """
+    dump_path = dump_path or dblp_dump_path
+    if dump_path:
+        conferences, _ = load_dblp_dump(dump_path, reload)
+        return postprocess_dblp_conferences(conferences)
+
     file_name = "conferences"
     df = dblp_cacher.load_csv(file_name)
     if not reload and df is not None:
@@ -236,8 +297,24 @@ where {
 """
     }
     lod = query_dblp(conference_query)
-    df = pd.DataFrame(lod)
+    df = postprocess_dblp_conferences(pd.DataFrame(lod))
+
+    dblp_cacher.store_csv(file_name, df)
 
+    return df
+
+
+def postprocess_dblp_conferences(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Helper function for get_dblp_conferences.
+    Drops workshops and adds virtual proceedings for split proceedings.
+
+    Args:
+        df(pandas.DataFrame): conferences with columns 'volume', 'event', 'title', 'doi' from the query or the dump
+
+    Returns:
+        pandas.DataFrame: the conferences to match against
+    """
     # drop workshops
     df = df[df["title"].map(lambda x: "workshop" not in x.lower())]
 
@@ -249,11 +326,40 @@ where {
 
     df = pd.concat([df, split])
 
-    dblp_cacher.store_csv(file_name, df)
-
     return df
 
 
+def load_dblp_dump(dump_path: str, reload: bool = False) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Get the conference and Ceur-WS workshop tables of a dblp.xml dump.
+    The tables are cached and only built again if the dump changed or reload is specified.
+
+    Args:
+        dump_path(str): path of dblp.xml, which may be compressed with gzip or zstd
+        reload(bool): whether to read the dump even if its tables are cached
+
+    Returns:
+        tuple(pandas.DataFrame, pandas.DataFrame): the raw conferences and all Ceur-WS workshops
+    """
+    stat = os.stat(dump_path)
+    source = {"dump": os.path.abspath(dump_path), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+    if not reload and dblp_cacher.load_meta("dump-conferences") == source:
+        conferences = dblp_cacher.load_csv("dump-conferences")
+        workshops = dblp_cacher.load_csv("dump-workshops")
+        if conferences is not None and workshops is not None:
+            return conferences, workshops
+
+    print(f"Reading Dblp dump {dump_path}.")
+    conferences, workshops = read_dblp_dump(dump_path)
+    dblp_cacher.store_csv("dump-conferences", conferences)
+    dblp_cacher.store_csv("dump-workshops", workshops)
+    # the source is written last, so it only matches complete tables
+    dblp_cacher.store_meta("dump-conferences", source)
+
+    return conferences, workshops
+
+
 def dblp_events_to_proceedings(events: pd.Series) -> pd.Series:
     """
     Given the links to dblp events like
@@ -288,23 +394,26 @@ def dblp_proceedings_to_events(proceedings: pd.Series) -> pd.Series:
         pandas.Series: proceedings ids replaced with event ids.
     """
 
-    pro = [f"<{proceeding}>" for proceeding in proceedings.to_list()]
+    pro = [f"<{proceeding}>" for proceeding in proceedings.dropna().to_list()]
 
-    transform_query = {
-        "lang": "sparql",
-        "name": "Proceedings to Event",
-        "title": "Proceedings to Event",
-        "description": "Dblp SPARQL query getting the Event id for the given proceedings id",
-        "query": f"""
+    def transform_query(values: str) -> Dict:
+        return {
+            "lang": "sparql",
+            "name": "Proceedings to Event",
+            "title": "Proceedings to Event",
+            "description": "Dblp SPARQL query getting the Event id for the given proceedings id",
+            "query": f"""
 PREFIX dblp: <https://dblp.org/rdf/schema#>
 select ?dblp ?toc
 where {{
-  Values ?dblp {{ {" ".join(pro)} }}
-  optional {{?dblp dblp:listedOnTocPage ?toc. }}
+  Values ?dblp {{ {values} }}
+  ?dblp dblp:listedOnTocPage ?toc.
 }}
 """
-    }
-    lod = query_dblp(transform_query)
+        }
+    lod = query_dblp_batched(transform_query, pro)
+    events = {pair["dblp"]: pair["toc"] for pair in lod}
 
-    res = pd.DataFrame(lod)["toc"] if lod else pd.Series(data=[])
+    # the results of the chunks are assigned by uri, so the index of the input is kept
+    res = proceedings.map(events)
     return res
@@ -0,0 +1,214 @@
+'''
+Created on 2026-10-17
+@author: nm
+
+Shared client for the SPARQL endpoints of Wikidata and Dblp.
+'''
+import asyncio
+import datetime
+import email.utils
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Union
+import requests
+from requests.adapters import HTTPAdapter
+from colocation.values import Bot
+
+XSD = "http://www.w3.org/2001/XMLSchema#"
+
+clients: Dict[str, "SparqlClient"] = {}
+clients_lock = threading.Lock()
+
+
+class SparqlClient():
+    """
+    Sends SPARQL queries to one endpoint reusing the connections of a persistent session.
+    At most max_concurrent queries run at the same time, rate limits and unavailability are retried with backoff.
+    """
+    retry_statuses = [429, 502, 503, 504]
+
+    def __init__(self, endpoint_url: str, max_concurrent: int = 4, timeout: float = 300,
+                 retries: int = 4, backoff: float = 2.0, max_backoff: float = 120):
+        """
+        constructor
+
+        Args:
+            endpoint_url(str): url of the SPARQL endpoint
+            max_concurrent(int): maximal number of queries running at the same time
+            timeout(float): seconds to wait for the connection and for each read of the response
+            retries(int): how often to repeat a query that was rate limited or failed temporarily
+            backoff(float): seconds to wait before the first retry, doubled for every further one
+            max_backoff(float): maximal seconds to wait before a retry, also for a requested Retry-After
+        """
+        self.endpoint_url = endpoint_url
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Accept": "application/sparql-results+json",
+            # Wikidata rejects requests without a descriptive user agent
+            "User-Agent": f"{Bot.name}/{Bot.version}"
+        })
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent)
+
+    def query_bindings(self, query: str) -> List[Dict[str, Dict[str, str]]]:
+        """
+        Run a query and return the raw result bindings.
+
+        Args:
+            query(str): SPARQL query to run
+
+        Returns:
+            list(dict): bindings of the SPARQL json result
+        """
+        for attempt in range(self.retries + 1):
+            with self.slots:
+                try:
+                    response = self.session.post(self.endpoint_url, data={"query": query}, timeout=self.timeout)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if attempt == self.retries:
+                        raise e
+                    delay = None
+                else:
+                    if response.status_code not in self.retry_statuses or attempt == self.retries:
+                        response.raise_for_status()
+                        return response.json()["results"]["bindings"]
+                    delay = retry_after(response)
+            # wait without blocking a slot for the other queries
+            if delay is None:
+                delay = self.backoff * 2 ** attempt
+            time.sleep(min(delay, self.max_backoff))
+
+    def query(self, query: str) -> List[Dict[str, Any]]:
+        """
+        Run a query and convert the result to a list of dicts.
+
+        Args:
+            query(str): SPARQL query to run
+
+        Returns:
+            list(dict): one dict per result with the typed literals converted to python values
+        """
+        return bindings_to_lod(self.query_bindings(query))
+
+    async def query_async(self, query: str) -> List[Dict[str, Any]]:
+        """
+        Run a query without blocking the event loop.
+
+        Args:
+            query(str): SPARQL query to run
+
+        Returns:
+            list(dict): one dict per result with the typed literals converted to python values
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.query, query)
+
+    def query_many(self, queries: List[str]) -> List[List[Dict[str, Any]]]:
+        """
+        Run queries concurrently.
+
+        Args:
+            queries(list(str)): SPARQL queries to run
+
+        Returns:
+            list(list(dict)): the results in the order of the queries
+        """
+        return list(self.executor.map(self.query, queries))
+
+    def close(self):
+        """
+        close the connections of the session
+        """
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+def get_client(endpoint_url: str, **settings) -> SparqlClient:
+    """
+    Get the client shared by all queries to the endpoint, created with the given settings on first use.
+
+    Args:
+        endpoint_url(str): url of the SPARQL endpoint
+        settings: keyword arguments for the SparqlClient constructor
+
+    Returns:
+        SparqlClient: client for the endpoint
+    """
+    with clients_lock:
+        if endpoint_url not in clients:
+            clients[endpoint_url] = SparqlClient(endpoint_url, **settings)
+        return clients[endpoint_url]
+
+
+def retry_after(response: requests.Response) -> Union[float, None]:
+    """
+    Args:
+        response(requests.Response): response of a rate limited query
+
+    Returns:
+        float|None: seconds the server asked to wait, None if it did not say
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (date - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+def bindings_to_lod(bindings: List[Dict[str, Dict[str, str]]]) -> List[Dict[str, Any]]:
+    """
+    Convert SPARQL json bindings to python values like pylodstorage does.
+
+    Args:
+        bindings(list(dict)): bindings of the SPARQL json result
+
+    Returns:
+        list(dict): one dict per binding, variables without value are left out
+    """
+    return [{key: convert_literal(value) for key, value in binding.items()} for binding in bindings]
+
+
+def convert_literal(value: Dict[str, str]) -> Any:
+    """
+    Args:
+        value(dict): SPARQL json value with 'value' and optionally 'datatype'
+
+    Returns:
+        object: int, float, bool, date or datetime for the corresponding xsd types, otherwise the string value
+    """
+    datatype = value.get("datatype")
+    text = value["value"]
+    if datatype == XSD + "integer":
+        return int(text)
+    if datatype == XSD + "decimal":
+        return float(text)
+    if datatype == XSD + "boolean":
+        return text in ["TRUE", "true"]
+    if datatype == XSD + "date":
+        return datetime.datetime.strptime(text, "%Y-%m-%d").date()
+    if datatype == XSD + "dateTime":
+        date_format = "%Y-%m-%dT%H:%M:%SZ" if "T" in text and "Z" in text else "%Y-%m-%d %H:%M:%S.%f"
+        try:
+            return datetime.datetime.strptime(text, date_format)
+        except ValueError:
+            return None
+    return text
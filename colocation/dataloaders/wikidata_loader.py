@@ -3,14 +3,45 @@ Created on 2023-06-09
 @author: nm
 '''
 
-from colocation.cache_manager import CsvCacheManager
+from colocation.cache_manager import CsvCacheManager, PickleCacheManager, open_cache_file
+from colocation.dataloaders.sparql_client import get_client
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 from lodstorage.query import Query
-from lodstorage.sparql import SPARQL
+import datetime
+import functools
+import io
+import itertools
+import multiprocessing
+import os
+import threading
+import orjson
 import pandas as pd
-from typing import List, Dict
+from typing import Any, Callable, FrozenSet, Iterator, List, Dict, Set, Tuple, Union
 
 wikidata_cacher = CsvCacheManager(base_folder="wikidata")
 
+# endpoint all Wikidata queries are sent to and the number of queries sent at the same time
+wikidata_endpoint_url = "https://query.wikidata.org/sparql"
+max_concurrent_queries = 4
+# width of the ranges of numeric QIDs the conferences are downloaded in, one query per range
+conference_page_size = 2000000
+# number of ids inlined into one query
+values_chunk_size = 500
+# changes this long before the last synchronization are fetched again
+sync_overlap = datetime.timedelta(hours=1)
+
+conference_columns = ["conference", "conferenceLabel", "short", "countryISO3", "start", "end", "timepoint"]
+dblp_info_columns = ["conference", "proc", "dblp_event", "dblp_proceedings", "uri"]
+
+# local json dump to take the conferences, workshops and dblp links from instead of querying the endpoint,
+# its results are not written to the query cache
+wikidata_dump_path: Union[str, None] = None
+dump_loaders: Dict[str, "WikidataDumpLoader"] = {}
+dump_loaders_lock = threading.Lock()
+# properties of the items kept from the dump, P31 and the P478 qualifiers are kept as well
+dump_properties = ["P1813", "P17", "P298", "P276", "P580", "P582", "P585", "P10692", "P8978", "P973", "P4745", "P179"]
+entity_prefix = "http://www.wikidata.org/entity/"
+
 
 def get_workshop_ids_from_lod(lod: List[Dict]) -> List[str]:
     """
@@ -33,12 +64,12 @@ def query_wikidata(query: Dict[str, str]) -> pd.DataFrame:
     """
     Runner for wikidata queries given the query string
     """
-    endpoint_url = "https://query.wikidata.org/sparql"
-    endpoint = SPARQL(endpoint_url)
+    endpoint_url = wikidata_endpoint_url
+    endpoint = get_client(endpoint_url, max_concurrent=max_concurrent_queries)
     query = Query(**query)
 
     try:
-        lod = endpoint.queryAsListOfDicts(query.query)
+        lod = endpoint.query(query.query)
         df = pd.DataFrame(lod)
 
         return df
@@ -57,6 +88,9 @@ def get_wikidata_workshops(workshop_ids: List[str], name: str, reload: bool = Fa
         name(str) : name to differentiate queries for different purposes
         reload(bool) : whether to force reload the conferences instead of taking from cache
     """
+    if wikidata_dump_path:
+        return get_dump_loader(wikidata_dump_path).workshops(workshop_ids)
+
     name = f"workshops_{name}"
     df = wikidata_cacher.load_csv(name)
     if not reload and df is not None:
@@ -105,6 +139,9 @@ def get_wikidata_workshops_by_number(workshop_numbers: List[int], name: str, rel
         name(str) : name to differentiate queries for different purposes
         reload(bool) : whether to force reload the workshops instead of taking from cache
     """
+    if wikidata_dump_path:
+        return get_dump_loader(wikidata_dump_path).workshops_by_number(workshop_numbers)
+
     df = wikidata_cacher.load_csv(name)
     if not reload and df is not None:
         return df
@@ -136,48 +173,360 @@ where {{
     return df
 
 
-def get_wikidata_conferences(reload: bool = False) -> pd.DataFrame:
+def get_wikidata_conferences(reload: bool = False, page_size: Union[int, None] = None,
+                             refresh: bool = False) -> pd.DataFrame:
     """
-    Use a SPARQL query to get all conferences from Wikidata.
-    Cache the result and reuse, unless reload is specified.
+    Use SPARQL queries to get all conferences from Wikidata.
+    The conferences are downloaded in concurrent pages of fixed QID ranges, which are cached on their own
+    under their range, so an interrupted download only fetches the missing pages when repeated.
+    Cache the result and reuse, unless reload or refresh is specified.
 
     Args:
         reload(bool) : whether to force reload the conferences instead of taking from cache
+        page_size(int|None): number of QIDs per page, conference_page_size by default
+        refresh(bool): whether to update the cached conferences with the changes since the last download
     """
+    if wikidata_dump_path:
+        return get_dump_loader(wikidata_dump_path).conferences()
+
     name = "conferences"
     df = wikidata_cacher.load_csv(name)
     if not reload and df is not None:
-        return df
+        if not refresh:
+            return df
+        meta = wikidata_cacher.load_meta(name)
+        # conferences cached without a watermark can only be downloaded again
+        if meta.get("watermark"):
+            return refresh_wikidata_conferences(df, meta)
 
-    conference_query = {
+    page_size = page_size or conference_page_size
+    max_id = max_wikidata_conference_id()
+
+    def load_page(start: int) -> Tuple[pd.DataFrame, str]:
+        # the ranges do not move when conferences are added or removed, so pages of earlier attempts stay valid
+        page_name = f"{name}-page-{start}-{start + page_size}"
+        page = wikidata_cacher.load_csv(page_name)
+        if page is None:
+            watermark = sync_watermark()
+            page = get_wikidata_conference_page(start, start + page_size)
+            wikidata_cacher.store_csv(page_name, page)
+            wikidata_cacher.store_meta(page_name, {"watermark": watermark})
+            return page, watermark
+        return page, wikidata_cacher.load_meta(page_name).get("watermark", "")
+
+    with ThreadPoolExecutor(max_workers=max_concurrent_queries) as executor:
+        results = list(executor.map(load_page, range(0, max_id + 1, page_size)))
+    pages = [page for page, _ in results]
+    # changes after the oldest page are fetched by the next refresh
+    watermark = min((page_watermark for _, page_watermark in results), default=sync_watermark())
+
+    df = conference_frame(pages)
+    wikidata_cacher.store_csv(name, df)
+    wikidata_cacher.store_meta(name, {"watermark": watermark, "tombstones": {}})
+
+    # the pages are only kept until the download is complete
+    for page_name in wikidata_cacher.cached_names(f"{name}-page-"):
+        wikidata_cacher.remove_csv(page_name)
+
+    return df
+
+
+def refresh_wikidata_conferences(df: pd.DataFrame, meta: Dict) -> pd.DataFrame:
+    """
+    Update cached conferences with the changes in Wikidata since the watermark of the last synchronization.
+    Conferences modified since then, including the ones new to the class, and cached conferences whose proceedings
+    were modified are downloaded again and replace their cached rows.
+    Cached conferences which were deleted or are no longer conferences are removed and remembered as tombstones.
+    Only the modified items and the cached ids are queried, the class is never listed as a whole.
+
+    Args:
+        df(pandas.DataFrame): the cached conferences
+        meta(dict): metadata of the cache with the watermark and the tombstones
+
+    Returns:
+        pandas.DataFrame: the updated conferences
+    """
+    name = "conferences"
+    watermark = sync_watermark()
+
+    cached = set(df["conference"])
+    current = set(get_existing_wikidata_conferences([to_wikidata_id(uri) for uri in sorted(cached)]))
+    deleted = cached - current
+    modified = set(get_modified_wikidata_items(meta["watermark"]))
+    modified.update(get_modified_wikidata_items(meta["watermark"], [to_wikidata_id(uri) for uri in sorted(current)]))
+
+    changed = modified - deleted
+    print(f"Refreshing Wikidata conferences: {len(changed)} changed, {len(deleted)} deleted.")
+
+    updates = query_wikidata_batched(conference_details_query, [to_wikidata_id(uri) for uri in sorted(changed)])
+    updates = conference_frame([updates.reindex(conference_columns, axis=1)])
+
+    df = df[~df["conference"].isin(changed | deleted)]
+    df = pd.concat([df, updates], ignore_index=True) if not updates.empty else df.reset_index(drop=True)
+
+    tombstones = meta.get("tombstones", {})
+    tombstones.update({uri: watermark for uri in deleted})
+    for uri in changed:
+        tombstones.pop(uri, None)
+
+    wikidata_cacher.store_csv(name, df)
+    wikidata_cacher.store_meta(name, {"watermark": watermark, "tombstones": tombstones})
+
+    return df
+
+
+def conference_frame(pages: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Combine raw conference query results into the format required for matching.
+
+    Args:
+        pages(list(pandas.DataFrame)): raw results with the conference_columns
+
+    Returns:
+        pandas.DataFrame: the formatted conferences
+    """
+    # ranges without any conference give empty pages
+    pages = [page for page in pages if not page.empty]
+    df = pd.concat(pages, ignore_index=True) if pages else pd.DataFrame(columns=conference_columns)
+    # pages without any value for a date have no datetime column
+    for column in ["start", "end", "timepoint"]:
+        df[column] = pd.to_datetime(df[column], errors="coerce")
+
+    renaming = {"conferenceLabel": "title"}
+    return format_frame(df, renaming)
+
+
+def max_wikidata_conference_id() -> int:
+    """
+    Use a SPARQL query to get the highest numeric QID of the conferences in Wikidata.
+
+    Returns:
+        int: number of the highest QID, 0 without conferences
+    """
+    max_query = {
         "lang": "sparql",
-        "name": "Cf",
-        "title": "Conferences",
-        "description": "Wikidata SPARQL query getting academic conferences with relevant information",
+        "name": "CfMaxId",
+        "title": "Highest conference id",
+        "description": "Wikidata SPARQL query getting the highest QID of academic conferences",
         "query": """
-SELECT distinct ?conference ?conferenceLabel ?short ?countryISO3 ?start ?end ?timepoint
+SELECT (max(?qid) as ?max)
 WHERE
 {
-  ?conference wdt:P31/wdt:P279* wd:Q2020153;
-              rdfs:label ?conferenceLabel.
-  FILTER langMatches(lang(?conferenceLabel), "en")
-  SERVICE wikibase:label {bd:serviceParam wikibase:language "en". }
-  OPTIONAL { ?conference wdt:P1813 ?short.}
-  optional { ?conference wdt:P17 ?country.
-           ?country wdt:P298 ?countryISO3.}
-  optional { ?conference wdt:P580 ?start.}
-  optional { ?conference wdt:P582 ?end.}
-  optional { ?conference wdt:P585 ?timepoint.}
+  ?conference wdt:P31/wdt:P279* wd:Q2020153.
+  BIND (xsd:integer(STRAFTER(STR(?conference), "/entity/Q")) as ?qid)
 }
 """
     }
+    df = query_wikidata(max_query)
+    if isinstance(df, Exception):
+        raise df
+    return int(df["max"].iloc[0]) if not df.empty and not pd.isna(df["max"].iloc[0]) else 0
+
+
+def get_existing_wikidata_conferences(conference_ids: List[str]) -> List[str]:
+    """
+    Use SPARQL queries to check which of the given items still exist and are conferences.
+
+    Args:
+        conference_ids(list(str)): ids of the form 'wd:Q87055069'
+
+    Returns:
+        list(str): uris of the given items which are conferences
+    """
+    def existing_query(values: str) -> Dict[str, str]:
+        return {
+            "lang": "sparql",
+            "name": "CfExisting",
+            "title": "Existing conferences",
+            "description": "Wikidata SPARQL query getting the given items which are academic conferences",
+            "query": f"""
+SELECT distinct ?conference
+WHERE
+{{
+  VALUES ?conference {{{values}}}.
+  ?conference wdt:P31/wdt:P279* wd:Q2020153.
+}}
+"""
+        }
+    df = query_wikidata_batched(existing_query, conference_ids)
+    return df["conference"].to_list() if not df.empty else []
+
+
+def get_modified_wikidata_items(watermark: str, conference_ids: Union[List[str], None] = None) -> List[str]:
+    """
+    Use SPARQL queries to get the conferences modified since the given time.
+    For given conferences, a modification of one of their proceedings also counts.
+
+    Args:
+        watermark(str): xsd:dateTime of the last synchronization
+        conference_ids(list(str)|None): ids of the form 'wd:Q87055069' to restrict the query to,
+            None for all conferences, which are selected by their modification date before their class is checked
+
+    Returns:
+        list(str): uris of the modified conferences
+    """
+    if conference_ids is None:
+        modified_query = {
+            "lang": "sparql",
+            "name": "CfModified",
+            "title": "Modified conferences",
+            "description": "Wikidata SPARQL query getting the conferences modified since the watermark",
+            "query": f"""
+SELECT distinct ?conference
+WHERE
+{{
+  ?conference schema:dateModified ?modified.
+  FILTER (?modified >= "{watermark}"^^xsd:dateTime)
+  ?conference wdt:P31/wdt:P279* wd:Q2020153.
+}}
+"""
+        }
+        df = query_wikidata(modified_query)
+        if isinstance(df, Exception):
+            raise df
+    else:
+        def modified_query(values: str) -> Dict[str, str]:
+            return {
+                "lang": "sparql",
+                "name": "Modified",
+                "title": "Modified conferences",
+                "description": "Wikidata SPARQL query getting the given conferences modified since the watermark",
+                "query": f"""
+SELECT distinct ?conference
+WHERE
+{{
+  VALUES ?conference {{{values}}}.
+  {{ ?conference schema:dateModified ?modified. }}
+  UNION
+  {{ ?proc wdt:P4745 ?conference;
+          schema:dateModified ?modified. }}
+  FILTER (?modified >= "{watermark}"^^xsd:dateTime)
+}}
+"""
+            }
+        df = query_wikidata_batched(modified_query, conference_ids)
+
+    return df["conference"].to_list() if not df.empty else []
+
+
+def get_wikidata_conference_page(start: int, stop: int) -> pd.DataFrame:
+    """
+    Use a SPARQL query to get the conferences from Wikidata in a range of numeric QIDs.
+
+    Args:
+        start(int): smallest QID of the page
+        stop(int): QID after the page
+
+    Returns:
+        pandas.DataFrame: the raw results for the conferences of the page
+    """
+    conference_query = {
+        "lang": "sparql",
+        "name": "Cf",
+        "title": "Conferences",
+        "description": "Wikidata SPARQL query getting a range of academic conferences with relevant information",
+        "query": conference_query_string(f"""
+  ?conference wdt:P31/wdt:P279* wd:Q2020153.
+  BIND (xsd:integer(STRAFTER(STR(?conference), "/entity/Q")) as ?qid)
+  FILTER (?qid >= {start} && ?qid < {stop})""")
+    }
 
     df = query_wikidata(conference_query)
-    renaming = {"conferenceLabel": "title"}
-    df = format_frame(df, renaming)
-    wikidata_cacher.store_csv(name, df)
+    if isinstance(df, Exception):
+        raise df
+    # variables without any value in the page are missing
+    return df.reindex(conference_columns, axis=1)
 
-    return df
+
+def conference_details_query(values: str) -> Dict[str, str]:
+    """
+    Args:
+        values(str): space separated ids of the form 'wd:Q87055069'
+
+    Returns:
+        dict: query getting the given conferences with relevant information
+    """
+    return {
+        "lang": "sparql",
+        "name": "CfDetails",
+        "title": "Conferences",
+        "description": "Wikidata SPARQL query getting the given academic conferences with relevant information",
+        "query": conference_query_string(f"""
+  VALUES ?conference {{{values}}}.
+  ?conference wdt:P31/wdt:P279* wd:Q2020153.""")
+    }
+
+
+def conference_query_string(selection: str) -> str:
+    """
+    Args:
+        selection(str): SPARQL pattern binding ?conference
+
+    Returns:
+        str: query for the conference_columns of the selected conferences
+    """
+    return f"""
+SELECT distinct ?conference ?conferenceLabel ?short ?countryISO3 ?start ?end ?timepoint
+WHERE
+{{{selection}
+  ?conference rdfs:label ?conferenceLabel.
+  FILTER langMatches(lang(?conferenceLabel), "en")
+  OPTIONAL {{ ?conference wdt:P1813 ?short.}}
+  optional {{ ?conference wdt:P17 ?country.
+           ?country wdt:P298 ?countryISO3.}}
+  optional {{ ?conference wdt:P580 ?start.}}
+  optional {{ ?conference wdt:P582 ?end.}}
+  optional {{ ?conference wdt:P585 ?timepoint.}}
+}}
+"""
+
+
+def query_wikidata_batched(build_query: Callable[[str], Dict[str, str]], values: List[str],
+                           chunk_size: Union[int, None] = None) -> pd.DataFrame:
+    """
+    Runner for wikidata queries inlining the given values into a VALUES clause.
+    The values are split into chunks queried concurrently.
+
+    Args:
+        build_query(callable): creates the query given the space separated values of one chunk
+        values(list(str)): SPARQL terms to inline
+        chunk_size(int|None): maximal number of values per query, values_chunk_size by default
+
+    Returns:
+        pandas.DataFrame: the combined results of all chunks
+    """
+    chunk_size = chunk_size or values_chunk_size
+    chunks = [" ".join(values[i:i + chunk_size]) for i in range(0, len(values), chunk_size)]
+    if not chunks:
+        return pd.DataFrame()
+
+    with ThreadPoolExecutor(max_workers=min(max_concurrent_queries, len(chunks))) as executor:
+        frames = list(executor.map(lambda chunk: query_wikidata(build_query(chunk)), chunks))
+
+    for df in frames:
+        if isinstance(df, Exception):
+            raise df
+    return pd.concat(frames, ignore_index=True)
+
+
+def sync_watermark() -> str:
+    """
+    Returns:
+        str: xsd:dateTime to take changes from in the next synchronization.
+            It lies sync_overlap before now, as the query service shows edits with a delay.
+    """
+    return (datetime.datetime.now(datetime.timezone.utc) - sync_overlap).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def to_wikidata_id(uri: str) -> str:
+    """
+    Args:
+        uri(str): uri of a Wikidata entity
+
+    Returns:
+        str: id of the form 'wd:Q87055069'
+    """
+    return "wd:" + uri.split("/")[-1]
 
 
 def format_frame(df: pd.DataFrame, renaming: Dict[str, str]) -> pd.DataFrame:
@@ -200,29 +549,94 @@ def format_frame(df: pd.DataFrame, renaming: Dict[str, str]) -> pd.DataFrame:
     return df
 
 
-def get_wikidata_dblp_info(conference_ids: List[str], name: str, reload: bool = False) -> pd.DataFrame:
+def get_wikidata_dblp_info(conference_ids: List[str], name: str, reload: bool = False,
+                           refresh: bool = False) -> pd.DataFrame:
     """
     Use a SPARQL query to potentially get dois and dblp links for conferences from the given list of ids from Wikidata.
-    Cache the result using the specified name and reuse, unless reload is specified.
+    Cache the result using the specified name and reuse, unless reload or refresh is specified.
 
     Args:
         conference_ids(list(str)) : list of the ids for the conferences to query wikidata for
         name(str) : name to differentiate queries for different purposes
         reload(bool) : whether to force reload the conferences instead of taking from cache
+        refresh(bool): whether to update the cached result with the changes since the last download
 
     Returns:
         pandas.DataFrame: successfully connected elements with the columns
             'conference', 'proc', 'dblp_event', 'dblp_proceedings', 'uri'
     """
+    if wikidata_dump_path:
+        return get_dump_loader(wikidata_dump_path).dblp_info(conference_ids)
 
     name = f"dblp_{name}"
     df = wikidata_cacher.load_csv(name)
     if not reload and df is not None:
-        return df
+        if not refresh:
+            return df
+        meta = wikidata_cacher.load_meta(name)
+        if meta.get("watermark"):
+            return refresh_wikidata_dblp_info(df, conference_ids, name, meta)
+
+    watermark = sync_watermark()
+    conference_ids = ["wd:" + c for c in conference_ids]
+
+    df = query_wikidata_batched(dblp_info_query, conference_ids)
+    df = df.reindex(dblp_info_columns, axis=1)
+    wikidata_cacher.store_csv(name, df)
+    wikidata_cacher.store_meta(name, {"watermark": watermark, "tombstones": {}, "requested": conference_ids})
 
+    return df
+
+
+def refresh_wikidata_dblp_info(df: pd.DataFrame, conference_ids: List[str], name: str, meta: Dict) -> pd.DataFrame:
+    """
+    Update cached dblp links of conferences with the changes in Wikidata since the last synchronization.
+    Conferences requested for the first time and conferences whose item or proceedings were modified
+    are queried again and replace their cached rows. Conferences without result anymore are remembered as tombstones,
+    conferences no longer requested are dropped.
+
+    Args:
+        df(pandas.DataFrame): the cached links
+        conference_ids(list(str)): list of the ids for the conferences to query wikidata for
+        name(str): name of the cached links
+        meta(dict): metadata of the cache with the watermark, the tombstones and the requested conferences
+
+    Returns:
+        pandas.DataFrame: the updated links
+    """
+    watermark = sync_watermark()
     conference_ids = ["wd:" + c for c in conference_ids]
 
-    dblp_query = {
+    new = set(conference_ids) - set(meta.get("requested", []))
+    modified = {to_wikidata_id(uri) for uri in get_modified_wikidata_items(meta["watermark"], conference_ids)}
+    changed = sorted(new | (modified & set(conference_ids)))
+    print(f"Refreshing Wikidata dblp links: {len(changed)} changed.")
+
+    updates = query_wikidata_batched(dblp_info_query, changed).reindex(dblp_info_columns, axis=1)
+
+    ids = df["conference"].map(to_wikidata_id)
+    kept = ids.isin(conference_ids) & ~ids.isin(changed)
+    tombstones = meta.get("tombstones", {})
+    tombstones.update({uri: watermark for uri in set(df["conference"][ids.isin(changed)]) - set(updates["conference"])})
+    for uri in updates["conference"]:
+        tombstones.pop(uri, None)
+
+    df = pd.concat([df[kept], updates], ignore_index=True) if not updates.empty else df[kept].reset_index(drop=True)
+    wikidata_cacher.store_csv(name, df)
+    wikidata_cacher.store_meta(name, {"watermark": watermark, "tombstones": tombstones, "requested": conference_ids})
+
+    return df
+
+
+def dblp_info_query(values: str) -> Dict[str, str]:
+    """
+    Args:
+        values(str): space separated ids of the form 'wd:Q87055069'
+
+    Returns:
+        dict: query getting information connecting the given conferences to dblp
+    """
+    return {
         "lang": "sparql",
         "name": "Wikidata Dblp",
         "title": "Dblp",
@@ -232,7 +646,7 @@ SELECT distinct ?conference (sample(?proc) as ?proc) (sample(?dblp_event) as ?db
 (sample(?dblp_proceedings) as ?dblp_proceedings) (sample(?uri) as ?uri)
 WHERE
 {{
-  VALUES ?conference {{{" ".join(conference_ids)}}}.
+  VALUES ?conference {{{values}}}.
   ?conference wdt:P31/wdt:P279* wd:Q2020153.
   optional {{?conference wdt:P10692 ?dblp_event.}}
   optional {{
@@ -248,8 +662,434 @@ Group by ?conference
 """
     }
 
-    df = query_wikidata(dblp_query)
-    df = df.reindex(["conference", "proc", "dblp_event", "dblp_proceedings", "uri"], axis=1)
-    wikidata_cacher.store_csv(name, df)
 
-    return df
+def get_dump_loader(dump_path: str) -> "WikidataDumpLoader":
+    """
+    Get the loader shared by all functions reading the given dump.
+
+    Args:
+        dump_path(str): path of the Wikidata json dump
+
+    Returns:
+        WikidataDumpLoader: loader for the dump
+    """
+    with dump_loaders_lock:
+        if dump_path not in dump_loaders:
+            dump_loaders[dump_path] = WikidataDumpLoader(dump_path)
+        return dump_loaders[dump_path]
+
+
+class WikidataDumpLoader():
+    """
+    Offline source for the Wikidata frames reading a json dump (plain, gzip or zstd) line by line.
+    Only the conferences, workshops, proceedings and countries with the properties used by the queries
+    and the labels of the locations of workshops are kept.
+    The lines are parsed in a pool of processes and the kept subset is cached until the dump changes.
+    """
+    conference_class = "Q2020153"
+    workshop_class = "Q40444998"
+    ceur_series = "Q27230297"
+
+    def __init__(self, dump_path: str, max_workers: Union[int, None] = None, batch_size: int = 2000,
+                 cacher: Union[PickleCacheManager, None] = None):
+        """
+        constructor
+
+        Args:
+            dump_path(str): path of the Wikidata json dump, e.g. latest-all.json.gz or a filtered part of it
+            max_workers(int|None): number of processes parsing the lines, 1 to parse in this process
+            batch_size(int): number of lines sent to a process at once
+            cacher(PickleCacheManager|None): cache for the kept subset of the dump, the wikidata folder by default
+        """
+        self.dump_path = dump_path
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.cacher = cacher if cacher is not None else PickleCacheManager(base_folder="wikidata")
+        self.classes: Union[Dict[str, List[str]], None] = None
+        self.items: Union[Dict[str, Dict[str, List[Any]]], None] = None
+        self.labels: Dict[str, List[str]] = {}
+        self.loaded_source: Union[Dict[str, Any], None] = None
+        self.lock = threading.Lock()
+
+    def source(self) -> Dict[str, Any]:
+        """
+        Returns:
+            dict: path, size and modification time identifying the version of the dump
+        """
+        stat = os.stat(self.dump_path)
+        return {"dump": os.path.abspath(self.dump_path), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+    def load(self, reload: bool = False):
+        """
+        Read the subset of the dump needed for the frames, unless it is loaded or cached already.
+        The dump is read twice: first for the subclasses of conferences and workshops and the locations used by
+        instances of any class, then for the instances of the classes and the labels of the locations of workshops.
+
+        Args:
+            reload(bool): whether to read the dump even if its subset is cached
+        """
+        with self.lock:
+            source = self.source()
+            if not reload and self.items is not None and self.loaded_source == source:
+                return
+            cached = None if reload else self.cacher.load_pickle("dump-subset")
+            if cached is not None and cached["source"] == source:
+                self.classes, self.items, self.labels = cached["classes"], cached["items"], cached["labels"]
+            else:
+                print(f"Reading Wikidata dump {self.dump_path}.")
+                self.classes, locations = self.read_classes()
+                self.items, self.labels = {}, {}
+                for kind, qid, value in self.scan(functools.partial(
+                        extract_dump_item, classes=frozenset(self.classes["conference"] + self.classes["workshop"]),
+                        label_ids=frozenset(locations))):
+                    (self.items if kind == "item" else self.labels)[qid] = value
+                self.items = dict(sorted(self.items.items()))
+                self.store(source)
+            self.loaded_source = source
+
+    def store(self, source: Dict[str, Any]):
+        """
+        cache the subset of the dump
+
+        Args:
+            source(dict): version of the dump the subset belongs to
+        """
+        self.cacher.store_pickle("dump-subset", {"source": source, "classes": self.classes,
+                                                 "items": self.items, "labels": self.labels})
+
+    def read_classes(self) -> Tuple[Dict[str, List[str]], List[str]]:
+        """
+        Returns:
+            tuple(dict, list(str)): the conference and workshop classes including their transitive subclasses
+                and the locations of the instances of the workshop classes, whose labels are needed
+        """
+        children: Dict[str, List[str]] = {}
+        # the classes of the events are only known at the end, so the locations are collected for every class
+        located: Dict[str, Set[str]] = {}
+        for qid, parents, instance_of, locations in self.scan(extract_dump_classes, markers=(b'"P279"', b'"P276"')):
+            for parent in parents:
+                children.setdefault(parent, []).append(qid)
+            for class_id in instance_of:
+                located.setdefault(class_id, set()).update(locations)
+
+        def closure(root: str) -> List[str]:
+            found = {root}
+            queue = [root]
+            while queue:
+                for child in children.get(queue.pop(), []):
+                    if child not in found:
+                        found.add(child)
+                        queue.append(child)
+            return sorted(found)
+
+        classes = {"conference": closure(self.conference_class), "workshop": closure(self.workshop_class)}
+        locations = sorted(set().union(*(located.get(class_id, set()) for class_id in classes["workshop"])))
+        return classes, locations
+
+    def read_batches(self) -> Iterator[List[bytes]]:
+        """
+        Returns:
+            Iterator(list(bytes)): the lines of the dump in batches
+        """
+        with io.BufferedReader(open_cache_file(self.dump_path, "rb"), buffer_size=1 << 20) as dump_file:
+            batch = []
+            for line in dump_file:
+                batch.append(line)
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+    def scan(self, extract: Callable[[Dict], Any], markers: Tuple[bytes, ...] = ()) -> Iterator[Any]:
+        """
+        Parse the entities of the dump and extract information from them.
+        The batches are parsed concurrently in processes, only a few of them are held in memory at once.
+
+        Args:
+            extract(callable): picklable function returning the information of an entity or None to skip it
+            markers(tuple(bytes)): only parse lines containing one of them, all if empty
+
+        Returns:
+            Iterator: the extracted information in no particular order
+        """
+        if self.max_workers == 1:
+            for batch in self.read_batches():
+                yield from scan_dump_batch(batch, extract, markers)
+            return
+
+        max_workers = self.max_workers or os.cpu_count() or 1
+        # forking while other threads of the pipeline hold locks could leave the workers deadlocked
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            # the dump is decompressed in this process, a few batches ahead of the workers
+            limit = 2 * max_workers
+            running = set()
+            for batch in self.read_batches():
+                running.add(executor.submit(scan_dump_batch, batch, extract, markers))
+                if len(running) >= limit:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            for future in as_completed(running):
+                yield from future.result()
+
+    def instances(self, kind: str) -> List[Dict[str, List[Any]]]:
+        """
+        Args:
+            kind(str): 'conference' or 'workshop'
+
+        Returns:
+            list(dict): the kept items which are instances of the class or one of its subclasses
+        """
+        self.load()
+        classes = set(self.classes[kind])
+        return [item for item in self.items.values() if classes.intersection(item["P31"])]
+
+    def event_frame(self, events: List[Dict[str, List[Any]]], key: str, locations: bool) -> pd.DataFrame:
+        """
+        Build the rows a query for the events with optional attributes would return.
+
+        Args:
+            events(list(dict)): kept items of the events
+            key(str): name of the event column, 'conference' or 'workshop'
+            locations(bool): whether to add the English labels of the locations
+
+        Returns:
+            pandas.DataFrame: one row per combination of the values of the events
+        """
+        rows = []
+        for event in events:
+            if not event["labels"]:
+                continue
+            countries = [iso for country in event["P17"]
+                         for iso in self.items.get(country, {}).get("P298", [])] or [None]
+            options = [event["labels"], event["P1813"] or [None], countries]
+            if locations:
+                # locations which are kept items have their labels there
+                labels = [self.labels.get(location) or self.items.get(location, {}).get("labels", [])
+                          for location in event["P276"]]
+                options.append([label for found in labels for label in found] or [None])
+            options.extend([event["P580"] or [None], event["P582"] or [None], event["P585"] or [None]])
+            for values in dict.fromkeys(itertools.product(*options)):
+                rows.append((entity_prefix + event["id"], ) + values)
+
+        columns = [key, f"{key}Label", "short", "countryISO3"] + (["locationLabel"] if locations else []) + \
+            ["start", "end", "timepoint"]
+        df = pd.DataFrame(rows, columns=columns)
+        for column in ["start", "end", "timepoint"]:
+            df[column] = pd.to_datetime(df[column], errors="coerce")
+        return df
+
+    def conferences(self) -> pd.DataFrame:
+        """
+        Returns:
+            pandas.DataFrame: the frame of get_wikidata_conferences
+        """
+        df = self.event_frame(self.instances("conference"), "conference", locations=False)
+        return format_frame(df, {"conferenceLabel": "title"})
+
+    def workshops(self, workshop_ids: List[str]) -> pd.DataFrame:
+        """
+        Args:
+            workshop_ids(list(str)): ids of the form 'wd:Q87055069'
+
+        Returns:
+            pandas.DataFrame: the frame of get_wikidata_workshops
+        """
+        ids = {workshop_id.split(":")[-1] for workshop_id in workshop_ids}
+        workshops = [item for item in self.instances("workshop") if item["id"] in ids]
+        df = self.event_frame(workshops, "workshop", locations=True)
+        return format_frame(df, {"workshopLabel": "title", "locationLabel": "locations"})
+
+    def workshops_by_number(self, workshop_numbers: List[int]) -> pd.DataFrame:
+        """
+        Args:
+            workshop_numbers(list(int)): Ceur-WS series numbers of the workshops
+
+        Returns:
+            pandas.DataFrame: the frame of get_wikidata_workshops_by_number
+        """
+        self.load()
+        numbers = {str(number) for number in workshop_numbers}
+        rows = []
+        for item in self.items.values():
+            if self.ceur_series not in item["P179"]:
+                continue
+            for number in dict.fromkeys(item["P478"]):
+                if number in numbers:
+                    rows.extend({"Ceur-WS": int(number), "Wikidata": entity_prefix + event} for event in item["P4745"])
+        return pd.DataFrame(rows, columns=["Ceur-WS", "Wikidata"])
+
+    def dblp_info(self, conference_ids: List[str]) -> pd.DataFrame:
+        """
+        Args:
+            conference_ids(list(str)): ids of the form 'Q87055069'
+
+        Returns:
+            pandas.DataFrame: the frame of get_wikidata_dblp_info
+        """
+        ids = set(conference_ids)
+        conferences = [item for item in self.instances("conference") if item["id"] in ids]
+        proceedings: Dict[str, List[Dict[str, List[Any]]]] = {}
+        for item in self.items.values():
+            if item["P8978"]:
+                for event in item["P4745"]:
+                    proceedings.setdefault(event, []).append(item)
+
+        rows = []
+        for conference in conferences:
+            proc = proceedings.get(conference["id"], [None])[0]
+            uris = [uri for uri in conference["P973"] if "dblp" in uri.lower()]
+            rows.append({
+                "conference": entity_prefix + conference["id"],
+                "proc": entity_prefix + proc["id"] if proc else None,
+                "dblp_event": conference["P10692"][0] if conference["P10692"] else None,
+                "dblp_proceedings": proc["P8978"][0] if proc else None,
+                "uri": uris[0] if uris else None
+            })
+        return pd.DataFrame(rows, columns=dblp_info_columns)
+
+
+def scan_dump_batch(lines: List[bytes], extract: Callable[[Dict], Any], markers: Tuple[bytes, ...]) -> List[Any]:
+    """
+    Helper function for WikidataDumpLoader.scan running in the worker processes.
+
+    Args:
+        lines(list(bytes)): lines of the dump, one entity per line
+        extract(callable): returns the information of an entity or None to skip it
+        markers(tuple(bytes)): only parse lines containing one of them, all if empty
+
+    Returns:
+        list: the extracted information
+    """
+    results = []
+    for line in lines:
+        if markers and not any(marker in line for marker in markers):
+            continue
+        line = line.strip().rstrip(b",")
+        if not line.startswith(b"{"):
+            continue
+        result = extract(orjson.loads(line))
+        if result is not None:
+            results.append(result)
+    return results
+
+
+def truthy_values(entity: Dict, prop: str) -> List[Any]:
+    """
+    Get the values of the statements a query finds with wdt:, i.e. the best ranked ones that are not deprecated.
+
+    Args:
+        entity(dict): entity of the dump
+        prop(str): property id
+
+    Returns:
+        list: entity ids, strings, monolingual texts or datetimes
+    """
+    statements = [s for s in entity.get("claims", {}).get(prop, []) if s.get("rank") != "deprecated"]
+    preferred = [s for s in statements if s.get("rank") == "preferred"]
+    values = [snak_value(s["mainsnak"]) for s in (preferred or statements)]
+    return [value for value in values if value is not None]
+
+
+def snak_value(snak: Dict) -> Any:
+    """
+    Args:
+        snak(dict): main snak or qualifier of a statement
+
+    Returns:
+        object: entity id, string, text or datetime of the value, None for unknown or no values
+    """
+    if snak.get("snaktype") != "value":
+        return None
+    value = snak["datavalue"]["value"]
+    if not isinstance(value, dict):
+        return value
+    if "id" in value:
+        return value["id"]
+    if "text" in value:
+        return value["text"]
+    if "time" in value:
+        return wikidata_time(value["time"])
+    return None
+
+
+def wikidata_time(value: str) -> Union[datetime.datetime, None]:
+    """
+    Convert a Wikidata time like '+2019-01-27T00:00:00Z' like the query service does,
+    unknown months and days of imprecise dates become the first.
+
+    Args:
+        value(str): Wikidata time value
+
+    Returns:
+        datetime|None: the time, None for years before the common era or beyond 9999
+    """
+    if value.startswith("-"):
+        return None
+    date, _, time = value.lstrip("+").rstrip("Z").partition("T")
+    year, month, day = (int(part) for part in date.split("-"))
+    if not 0 < year < 10000:
+        return None
+    hour, minute, second = (int(part) for part in (time or "00:00:00").split(":"))
+    return datetime.datetime(year, max(month, 1), max(day, 1), hour, minute, second)
+
+
+def extract_dump_classes(entity: Dict) -> Union[Tuple[str, List[str], List[str], List[str]], None]:
+    """
+    Args:
+        entity(dict): entity of the dump
+
+    Returns:
+        tuple(str, list(str), list(str), list(str))|None: id, superclasses, classes and locations of the entity,
+            None if it has neither superclasses nor locations
+    """
+    parents = truthy_values(entity, "P279")
+    locations = [location for location in truthy_values(entity, "P276") if isinstance(location, str)]
+    if not (parents or locations):
+        return None
+    return entity["id"], parents, truthy_values(entity, "P31") if locations else [], locations
+
+
+def extract_dump_item(entity: Dict, classes: FrozenSet[str],
+                      label_ids: FrozenSet[str]) -> Union[Tuple[str, str, Any], None]:
+    """
+    Keep events, proceedings and countries with the properties used by the queries,
+    and the English labels of the other requested entities.
+
+    Args:
+        entity(dict): entity of the dump
+        classes(frozenset(str)): conference and workshop classes
+        label_ids(frozenset(str)): ids of the entities to get the labels of, e.g. locations
+
+    Returns:
+        tuple(str, str, dict|list(str))|None: 'item', id and kept values of the entity
+            or 'label', id and English labels of a requested entity which is not kept, None if it is not needed
+    """
+    if entity.get("type") != "item":
+        return None
+    instance_of = truthy_values(entity, "P31")
+    item = {prop: truthy_values(entity, prop) for prop in dump_properties}
+    if not (classes.intersection(instance_of) or item["P4745"] or item["P298"]):
+        return ("label", entity["id"], english_labels(entity)) if entity["id"] in label_ids else None
+    item["id"] = entity["id"]
+    item["P31"] = instance_of
+    item["labels"] = english_labels(entity)
+    # the series numbers are qualifiers of any series statement
+    item["P478"] = [snak_value(qualifier) for statement in entity.get("claims", {}).get("P179", [])
+                    for qualifier in statement.get("qualifiers", {}).get("P478", [])]
+    item["P478"] = [number for number in item["P478"] if number is not None]
+    return "item", entity["id"], item
+
+
+def english_labels(entity: Dict) -> List[str]:
+    """
+    Args:
+        entity(dict): entity of the dump
+
+    Returns:
+        list(str): distinct labels in English or one of its variants, like langMatches(lang(?label), "en")
+    """
+    labels = [label["value"] for language, label in entity.get("labels", {}).items()
+              if language == "en" or language.startswith("en-")]
+    return list(dict.fromkeys(labels))
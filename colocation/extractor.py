@@ -1,9 +1,10 @@
-from .cache_manager import JsonCacheManager
+from .cache_manager import JsonCacheManager, SqliteCacheManager
+import hashlib
 import re
+import threading
 import pandas as pd
-import spacy
-import country_converter as coco
-from typing import List, Dict
+from importlib import metadata
+from typing import Any, Iterable, List, Dict, Tuple, Union
 
 
 matchtypes = ["coloc", "hosted", "aff", "conjunction", "@2", "part", "affiliated", "at"]
@@ -34,22 +35,112 @@ matchregexes[matchtypes[7]] = re.compile(
     "(?:\w* at )(.*)"
 )
 
+# each regex matches exactly if one of the literal keywords of its matchtype occurs in the text,
+# so a single search for all keywords tells whether any regex has to be applied at all
+matchkeywords = {
+    matchtypes[0]: ["co-located with ", "colocated with ", "collocated with "],
+    matchtypes[1]: ["hosted by "],
+    matchtypes[2]: ["affiliated with "],
+    matchtypes[3]: ["in conjunction with "],
+    matchtypes[4]: [" @ "],
+    matchtypes[5]: ["part of "],
+    matchtypes[6]: ["affiliated with ", "affiliated to "],
+    matchtypes[7]: [" at "],
+}
+keywordregex = re.compile(
+    "|".join(re.escape(keyword) for keyword in dict.fromkeys(k for ks in matchkeywords.values() for k in ks))
+)
+
+
+def extract_matches(volume: Dict) -> Dict[str, List[str]]:
+    """
+    Searches all text fields of a volume for the matchtypes.
+    Only fields containing any keyword are searched with the regexes of the matchtypes whose keywords occur.
+    Numbers and missing values are skipped, since their text can not contain any keyword.
+
+    Args:
+        volume(dict): volume to search
+    Returns:
+        dict(str, list(str)): for each matchtype the strings following its keyword in the order of the fields
+    """
+    matches = {mt: [] for mt in matchtypes}
+
+    for value in volume.values():
+        if value is None or isinstance(value, (int, float)):
+            continue
+        text = value if isinstance(value, str) else str(value)
+        if keywordregex.search(text) is None:
+            continue
+
+        # use appropriate regex for each search type present
+        for mt in matchtypes:
+            if any(keyword in text for keyword in matchkeywords[mt]):
+                result = re.search(matchregexes[mt], text)
+                if result is not None:
+                    matches[mt].append(result[1])
+
+    return matches
+
+
+# spacy models shared by all ExtractionProcessors, loaded on first use
+nlp_models: Dict[str, Any] = {}
+nlp_models_lock = threading.Lock()
+
+
+def get_nlp(model_name: str = "en_core_web_sm") -> Any:
+    """
+    Get the spacy model of the given name.
+    The model is loaded only once per process with all components except the named entity recognition excluded.
+    spacy itself is only imported here, since importing it alone takes seconds.
+
+    Args:
+        model_name(str): name of the spacy model
+    Returns:
+        spacy.language.Language: the shared model
+    """
+    with nlp_models_lock:
+        if model_name not in nlp_models:
+            import spacy
+            # the ner component of the trained pipelines has its own tok2vec layer
+            nlp_models[model_name] = spacy.load(
+                model_name, exclude=["tok2vec", "tagger", "morphologizer", "parser", "senter",
+                                     "attribute_ruler", "lemmatizer"])
+        return nlp_models[model_name]
+
+
+def get_nlp_model_id(model_name: str = "en_core_web_sm") -> str:
+    """
+    Identify the installed version of a spacy model without loading it.
+
+    Args:
+        model_name(str): name of the spacy model
+    Returns:
+        str: name and version of the model
+    """
+    try:
+        version = metadata.version(model_name)
+    except metadata.PackageNotFoundError:
+        version = get_nlp(model_name).meta.get("version")
+    return f"{model_name}-{version}"
+
 
 class ColocationExtractor():
     """
     Given a list of dicts, searches for "co-located" information.
     """
 
-    def __init__(self, volumes_lod: List[Dict],
+    def __init__(self, volumes_lod: Iterable[Dict],
                  proc_provider: JsonCacheManager = JsonCacheManager(),
                  extra_provider: JsonCacheManager =
-                 JsonCacheManager(base_url="http://ceurspt.wikidata.dbis.rwth-aachen.de")):
+                 JsonCacheManager(base_url="http://ceurspt.wikidata.dbis.rwth-aachen.de",
+                                  document_store=SqliteCacheManager("ceurspt-volumes"))):
         """
         constructor
         Automatically extracts the information of the passed list of dicts.
 
         Args:
-            volumes_lod(list): list of dict for the volumes to extract information from.
+            volumes_lod(iterable): list of dict for the volumes to extract information from,
+                which is only iterated once, so it may also be a generator like JsonCacheManager.iter_lod.
             proc_provider(JsonCacheManager): loader for additional volume information,
                 should only be changed for test purposes.
             extra_provider(JsonCacheManager): loader for volume information not present in proc_provider,
@@ -94,12 +185,15 @@ class ColocationExtractor():
         event_map = {proc["sVolume"]: proc["event"] for proc in self.ceurWSProcs if proc["event"]}
         proceedings_map = {proc["sVolume"]: proc["item"] for proc in self.ceurWSProcs}
 
+        # fetch all volumes missing in the proceedings at once instead of one after another
+        vol_names = [f'Vol-{volume["number"]}' for volume in colocation_lod if volume["number"] not in event_map]
+        vols = self.extra_provider.load_lods(vol_names)
+
         for volume in colocation_lod:
             if volume["number"] in event_map.keys():
                 uri = str(event_map[volume["number"]]).split("|")
             else:
-                vol_name = f'Vol-{volume["number"]}'
-                vol = self.extra_provider.load_lod(vol_name)
+                vol = vols[f'Vol-{volume["number"]}']
 
                 if "wd.event" in vol.keys() and vol["wd.event"]:
                     uri = str(vol["wd.event"]).split("|")
@@ -121,15 +215,7 @@ class ColocationExtractor():
         colocation_lod = []
 
         for volume in self.volumes_lod:
-            matches = {mt: [] for mt in matchtypes}
-
-            for _, value in volume.items():
-
-                # use appropriate regex for each search type
-                for mt in matchtypes:
-                    result = re.search(matchregexes[mt], str(value))
-                    if result is not None:
-                        matches[mt].append(result[1])
+            matches = extract_matches(volume)
 
             # check for any posssible match
             if volume["colocated"] or any([m for m in matches.values()]):
@@ -156,17 +242,30 @@ class ExtractionProcessor():
     time and place of the conference in question to use in incremental matching.
     """
 
-    def __init__(self, extract_lod: List[Dict]):
+    def __init__(self, extract_lod: List[Dict], batch_size: int = 256, n_process: int = 1,
+                 entity_cache: Union[SqliteCacheManager, None] = SqliteCacheManager("ner"),
+                 model_name: str = "en_core_web_sm"):
         """"
         constructor
         initialises the events from which additional information is required
         Args:
             extract_lod(list(dict)): extract of the events of interest
-        """
-        # we need a shallow copy to reuse the lod elsewhere
-        self.remaining_events = extract_lod.copy()
-
-        self.nlp = spacy.load("en_core_web_sm")
+            batch_size(int): number of texts the nlp model processes at once
+            n_process(int): number of processes the nlp model uses
+            entity_cache(SqliteCacheManager|None): store of previously extracted entities by text,
+                None to always use the nlp model
+            model_name(str): name of the spacy model, which is only loaded once it is needed
+        """
+        # events by their position in the extract, so removing does not shift the others
+        self.remaining_events: Dict[int, Dict] = dict(enumerate(extract_lod))
+        # positions of the events by number per number key, built on the first removal
+        self.event_positions: Dict[str, Dict[Any, List[int]]] = {}
+
+        self.model_name = model_name
+        self.model_id = None
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.entity_cache = entity_cache
         self.year_regex = re.compile("[0-9]{4}")
         self.months = ["january", "february", "march,", "april", "may", "june",
                        "july", "august", "september", "october", "november", "december"]
@@ -175,6 +274,14 @@ class ExtractionProcessor():
 
         self.month_numerizer = dict((v, k) for v, k in zip(self.months, range(1, 13)))
 
+    @property
+    def nlp(self) -> Any:
+        """
+        Returns:
+            spacy.language.Language: the shared nlp model
+        """
+        return get_nlp(self.model_name)
+
     # this does not work because the dataframe indices are different from the overall lod
     # def remove_events_by_index(self, indices: list):
     #     """
@@ -195,10 +302,17 @@ class ExtractionProcessor():
             keys(list[int]): indices of events to remove
         """
 
-        # iterate in reverse order over list indices
-        for index in range(len(self.remaining_events) - 1, -1, -1):
-            if self.remaining_events[index][number_key] in keys:
-                del self.remaining_events[index]
+        if number_key not in self.event_positions:
+            positions = {}
+            for index, event in self.remaining_events.items():
+                positions.setdefault(event[number_key], []).append(index)
+            self.event_positions[number_key] = positions
+
+        positions = self.event_positions[number_key]
+        for key in keys:
+            for index in positions.pop(key, []):
+                # the event might already be removed by another number key
+                self.remaining_events.pop(index, None)
 
     def split_by_short_title(self, keyword: str) -> list:
         """
@@ -220,7 +334,7 @@ class ExtractionProcessor():
         if keyword == "colocated":
             extractList = [{"number": info["number"], keyword: info[keyword], "title": [],
                             "short": info[keyword], "loctime": info["loctime"]}
-                           for info in self.remaining_events if info[keyword]]
+                           for info in self.remaining_events.values() if info[keyword]]
             return extractList
 
         extractList = []
@@ -228,7 +342,7 @@ class ExtractionProcessor():
         shortRegex = re.compile("\(([^)]*)\)")
         # match containing 2 captial letters but not USA. Do not seperately capture the year: (?:
         shortRegex2 = re.compile("([^\s)]*(?!USA)[A-Z]{2}[^\s)]*\s?(?:[0-9]{4})?)")
-        for info in self.remaining_events:
+        for info in self.remaining_events.values():
             if info[keyword]:
                 befores = []
                 shorts = []
@@ -253,25 +367,56 @@ class ExtractionProcessor():
                 extractList.append(extract)
         return extractList
 
+    def extract_entities(self, texts: List[str]) -> List[Tuple[List[str], List[str]]]:
+        """
+        Extract times and locations from a list of texts using nlp.
+        Texts already processed by the same model are taken from the entity cache,
+        the others are processed in batches in a single pass over the model.
+        Args:
+            texts(list(str)): texts to extract entities from
+        Returns:
+            list((list(str), list(str))): for each text the found times (DATE) and locations (GPE)
+        """
+        keys = [self.entity_key(text) for text in texts]
+        known = self.entity_cache.get_many(keys) if self.entity_cache is not None else {}
+
+        unknown = {key: text for key, text in zip(keys, texts) if key not in known}
+        found = {}
+        docs = (self.nlp.pipe(unknown.values(), batch_size=self.batch_size, n_process=self.n_process)
+                if unknown else [])
+        for key, doc in zip(unknown.keys(), docs):
+            found[key] = (
+                [entity.text for entity in doc.ents if entity.label_ == "DATE"],
+                [entity.text for entity in doc.ents if entity.label_ == "GPE"]
+            )
+        if found and self.entity_cache is not None:
+            self.entity_cache.put_many(found)
+
+        known.update(found)
+        return [(list(known[key][0]), list(known[key][1])) for key in keys]
+
+    def entity_key(self, text: str) -> str:
+        """
+        Args:
+            text(str): text to get the entity cache key for
+        Returns:
+            str: hash of the model and the text
+        """
+        if self.model_id is None:
+            self.model_id = get_nlp_model_id(self.model_name)
+        return hashlib.sha1(f"{self.model_id}\0{text}".encode("utf8")).hexdigest()
+
     def extract_times(self, texts: List[str]):
         """
         Extract times from a list of texts using nlp
         """
-        times = []
-        for text in texts:
-            doc = self.nlp(text)
-            times.extend([entity.text for entity in doc.ents if entity.label_ == "DATE"])
-        return times
+        return [time for times, _ in self.extract_entities(texts) for time in times]
 
     def extract_location(self, texts: List[str]):
         """
         Extract locations from a list of texts using nlp
         """
-        locs = []
-        for text in texts:
-            doc = self.nlp(text)
-            locs.extend([entity.text for entity in doc.ents if entity.label_ == "GPE"])
-        return locs
+        return [loc for _, locs in self.extract_entities(texts) for loc in locs]
 
     def match_month(self, texts: List[str]):
         """
@@ -336,11 +481,20 @@ class ExtractionProcessor():
         # if the keyword is not colocated, try extracting further info
         if keyword != "colocated":
             # use nlp to get information when loctime was not set
-            df["dates"] = df[keyword].map(self.extract_times)
+            # all texts of all events are processed in one pass and then regrouped by event
+            texts = list(df[keyword])
+            entities = iter(self.extract_entities([text for event_texts in texts for text in event_texts]))
+            dates, locations = [], []
+            for event_texts in texts:
+                event_entities = [next(entities) for _ in event_texts]
+                dates.append([time for times, _ in event_entities for time in times])
+                locations.append([loc for _, locs in event_entities for loc in locs])
+
+            df["dates"] = pd.Series(dates, index=df.index, dtype=object)
 
             df.loc[pd.isna(df['loctime']), "month"] = df["dates"].map(self.match_month)
             df.loc[pd.isna(df['loctime']), "year"] = df["dates"].map(self.match_year)
-            df.loc[pd.isna(df['loctime']), "locations"] = df[keyword].map(self.extract_location)
+            df.loc[pd.isna(df['loctime']), "locations"] = pd.Series(locations, index=df.index, dtype=object)
 
             df.drop(columns=["dates"])
 
@@ -351,6 +505,7 @@ class ExtractionProcessor():
         df["loc2"] = df["locations"].map(lambda l: l[1] if len(l) > 1 else None)
 
         # use country converter to get ISO3 names
+        import country_converter as coco  # imported lazily, since it loads its country table on import
         cc = coco.CountryConverter()
         coco_logger = coco.logging.getLogger()
         coco_logger.setLevel(50)  # supress coco conversion output
@@ -2,17 +2,43 @@
 Created on 2023-04-21
 
 '''
+import hashlib
 import pandas as pd
 import numpy as np
 import re
+from concurrent.futures import ThreadPoolExecutor
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from typing import Union, Callable, List, Dict, Literal
 from .extractor import matchtypes, TitleExtractor
 from .dataloaders.dblp_loader import (get_dblp_workshops, get_dblp_conferences, verify_dblp_uris, verify_dblp_events,
                                       dblp_events_to_proceedings, dblp_proceedings_to_events)
 from .dataloaders.wikidata_loader import get_wikidata_dblp_info
-from .cache_manager import CsvCacheManager
+from .cache_manager import CsvCacheManager, PickleCacheManager
+from . import __version__
+from .values import Constants
+from .similarity import sparse_top_k, blocked_top_k, ConferenceIndex, TitleIndex, MinHashIndex
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Hash the columns, dtypes, index and values of a dataframe.
+    Values pandas can not hash, like the lists of extracted titles, are hashed by their representation.
+
+    Args:
+        df(pandas.DataFrame): dataframe to fingerprint.
+    Returns:
+        str: hex digest identifying the content of the dataframe
+    """
+    fingerprint = hashlib.sha1(repr([(str(column), str(dtype)) for column, dtype in df.dtypes.items()]).encode("utf8"))
+    fingerprint.update(pd.util.hash_pandas_object(df.index).values.tobytes())
+    for position in range(df.shape[1]):
+        column = df.iloc[:, position]
+        try:
+            hashed = pd.util.hash_pandas_object(column, index=False)
+        except TypeError:
+            hashed = pd.util.hash_pandas_object(column.map(repr), index=False)
+        fingerprint.update(hashed.values.tobytes())
+    return fingerprint.hexdigest()
 
 
 class Matcher:
@@ -20,16 +46,47 @@ class Matcher:
     match and link different types of events
     """
 
-    def __init__(self, types_to_match: Union[list, None] = None):
+    def __init__(self, types_to_match: Union[list, None] = None,
+                 top_k: Union[int, None] = None, chunk_size: int = 1024,
+                 block_by_year: bool = True, year_tolerance: int = 0, max_workers: int = 1,
+                 reuse_title_index: bool = False, title_backend: Literal["tfidf", "minhash"] = "tfidf",
+                 minhash_threshold: Union[float, None] = None):
         """
         constructor
 
         Args:
             types_to_match(list|None): list of matchtypes if only a subset of the possible types should be matched
+            top_k(int|None): maximal number of fuzzy title candidates per workshop, None to keep all
+            chunk_size(int): number of workshops whose title similarities are computed at once
+            block_by_year(bool): only compare titles of workshops and conferences of the same year
+            year_tolerance(int): maximal difference between the years of fuzzily matched events
+            max_workers(int): number of year blocks whose similarities are computed in parallel
+            reuse_title_index(bool): embed conference titles once per conference set and cache the embedding
+            instead of fitting a new embedding for every fuzzy matching step. The cached embedding is fitted on the
+            conference titles only, so the similarities and hence the matches differ slightly from the default,
+            which fits on the titles of both workshops and conferences.
+            title_backend(str): similarity used for fuzzy title matching, either the exact tf-idf cosine similarity
+            or the approximate Jaccard similarity of character shingles using MinHash and LSH. The latter
+            always builds a cached index and only compares titles sharing an LSH bucket.
+            minhash_threshold(float|None): minimal estimated Jaccard similarity of fuzzily matched titles with the
+            MinHash backend, which replaces the cosine threshold given to the matching functions.
+            Constants.MINHASH_MATCH_THREASHOLD by default.
         """
+        if title_backend not in ["tfidf", "minhash"]:
+            raise ValueError(f"Unknown title backend {title_backend}.")
         self.matchtypes = types_to_match.copy() if types_to_match else matchtypes.copy()
+        self.top_k = top_k
+        self.chunk_size = chunk_size
+        self.block_by_year = block_by_year
+        self.year_tolerance = year_tolerance
+        self.max_workers = max_workers
+        self.reuse_title_index = reuse_title_index
+        self.title_backend = title_backend
+        self.minhash_threshold = (minhash_threshold if minhash_threshold is not None
+                                  else Constants.MINHASH_MATCH_THREASHOLD)
         self.dblp_conferences = None
         self.cacher = CsvCacheManager(base_folder="matches")
+        self.index_cacher = PickleCacheManager(base_folder="matches")
 
     def match_dataframes_with_title_extract(self, df1: pd.DataFrame, df2: pd.DataFrame, threshold: float,
                                             reload: bool = False, save_name: str = "placeholder",
@@ -51,8 +108,9 @@ class Matcher:
         Returns:
             pandas.DataFrame: DataFrame that holds the pairs that are matched to be the same type
         """
-        if not reload:
-            cache = self.cacher.load_csv(save_name)
+        cache_name = self.cache_name(save_name, [df1, df2], threshold=threshold, to_extract=sorted(to_extract))
+        if not reload and cache_name is not None:
+            cache = self.cacher.load_csv(cache_name)
             if cache is not None:
                 return cache
 
@@ -60,10 +118,10 @@ class Matcher:
         df1 = extractor.extract_attributes(df1) if 1 in to_extract else df1
         df2 = extractor.extract_attributes(df2) if 2 in to_extract else df2
 
-        matchres = self.match_dataframes(df1, df2, threshold, reload, save_name)
+        matchres = self.match_dataframes(df1, df2, threshold, reload)
 
-        if save_name != "placeholder":
-            self.cacher.store_csv(save_name, matchres)
+        if cache_name is not None:
+            self.store_match(cache_name, matchres)
         return matchres
 
     def match_dataframes(self, df1: pd.DataFrame, df2: pd.DataFrame, threshold: float,
@@ -82,8 +140,9 @@ class Matcher:
         Returns:
             pandas.DataFrame: DataFrame that holds the pairs that are matched to be the same type
         """
-        if not reload:
-            cache = self.cacher.load_csv(save_name)
+        cache_name = self.cache_name(save_name, [df1, df2], threshold=threshold)
+        if not reload and cache_name is not None:
+            cache = self.cacher.load_csv(cache_name)
             if cache is not None:
                 return cache
 
@@ -110,44 +169,138 @@ class Matcher:
         matchres = matchres[matchres["W.title"].notna()]
 
         self.matchtypes = proper_matchtypes
-        if save_name != "placeholder":
-            self.cacher.store_csv(save_name, matchres)
+        if cache_name is not None:
+            self.store_match(cache_name, matchres)
         return matchres
 
+    def cache_name(self, save_name: str, frames: List[pd.DataFrame], **settings) -> Union[str, None]:
+        """
+        Name a cached match result by the inputs it was computed from,
+        so a cached result is only reused if the inputs and settings are the same.
+
+        Args:
+            save_name(str): name of the cached file, 'placeholder' to not cache the result.
+            frames(list(pandas.DataFrame)): the events matched.
+            settings: further arguments of the matching influencing the result.
+        Returns:
+            str|None: the save name followed by the fingerprint of the inputs or None if not cached
+        """
+        if save_name == "placeholder":
+            return None
+        settings.update({
+            "version": __version__,
+            "matchtypes": self.matchtypes,
+            "top_k": self.top_k,
+            "block_by_year": self.block_by_year,
+            "year_tolerance": self.year_tolerance,
+            "reuse_title_index": self.reuse_title_index,
+            "title_backend": self.title_backend,
+            "minhash_threshold": self.minhash_threshold
+        })
+        fingerprint = hashlib.sha1(repr(sorted(settings.items())).encode("utf8"))
+        for frame in frames:
+            fingerprint.update(frame_fingerprint(frame).encode("utf8"))
+        return f"{save_name}-{fingerprint.hexdigest()[:16]}"
+
+    def store_match(self, cache_name: str, df: pd.DataFrame):
+        """
+        Cache a match result and remove the results cached under the same save name for other inputs,
+        which would never be reused again.
+
+        Args:
+            cache_name(str): name given by cache_name
+            df(pandas.DataFrame): the match result
+        """
+        self.cacher.store_csv(cache_name, df)
+        save_name = cache_name.rpartition("-")[0]
+        for name in self.cacher.cached_names(f"{save_name}-"):
+            # other save names may start with this one
+            if name != cache_name and re.fullmatch(r"[0-9a-f]{16}", name[len(save_name) + 1:]):
+                self.cacher.remove_csv(name)
+
+    def build_title_index(self, conference_titles: List[str], reload: bool = False) -> Union[ConferenceIndex, None]:
+        """
+        Gets the index of the given conference titles for the configured title backend from cache
+        or builds it.
+
+        Args:
+            conference_titles(list(str)): titles of the conferences to match against.
+            reload(bool): whether to force rebuilding the index if a cached version exists.
+        Returns:
+            ConferenceIndex|None: index to pass to fuzzy_title_matching, None if no index should be reused.
+        """
+        if self.title_backend == "minhash":
+            return MinHashIndex.load_or_fit(conference_titles, self.index_cacher, reload=reload)
+        if self.reuse_title_index:
+            return TitleIndex.load_or_fit(conference_titles, self.index_cacher, reload=reload)
+        return None
+
     @staticmethod
     def fuzzy_title_matching(workshops: pd.DataFrame,
-                             conferences: pd.DataFrame, threshold: float) -> pd.DataFrame:
+                             conferences: pd.DataFrame, threshold: float,
+                             top_k: Union[int, None] = None, chunk_size: int = 1024,
+                             block_by_year: bool = True, year_tolerance: int = 0,
+                             max_workers: int = 1, title_index: Union[ConferenceIndex, None] = None) -> pd.DataFrame:
         """
         Uses td-idf embedding and cosine similarity to match titles.
         Since titles of conferences from different years are extremely similar, also use the year
         to refine which titles are valid matches.
+        The similarities are only computed between workshops and conferences using sparse chunked products,
+        so the dense similarity matrix of the whole corpus is never built.
 
         Args:
             workshops(pandas.DataFrame): workshops as used in match_extract
             conferences(pandas.DataFrame): conferences as used in match_extract
             threshold(float): threshold value when titles should be seen as similar
+            top_k(int|None): maximal number of candidate conferences per workshop, None to keep all
+            chunk_size(int): number of workshops whose similarities are computed at once
+            block_by_year(bool): only compute similarities within blocks of workshops and conferences
+            of the same year instead of between all of them
+            year_tolerance(int): maximal difference between the years of matched workshops and conferences
+            max_workers(int): number of year blocks processed in parallel
+            title_index(ConferenceIndex|None): prebuilt index of the conference titles in the order of conferences,
+            e.g. a TitleIndex or MinHashIndex. If None, a tf-idf embedding is fitted on the titles of both
+            workshops and conferences.
         Returns:
             pandas.DataFrame: workshops matched with conferences
         """
 
-        corpus = list(workshops["W.title"])
-        len_work = len(corpus)
-
-        corpus.extend(list(conferences["C.title"]))
-        # vectorize corpus using td-idf
-        vectorizer = TfidfVectorizer(max_df=0.7)  # ignore stopwords
-        X = vectorizer.fit_transform(corpus)
-
-        # get pairwise cosine similarity
-        cos = cosine_similarity(X)
-
-        # remove symmetry and zero all matches within same type
-        cos = np.triu(cos, k=1)  # only keep upper triangular matrix with 0 diagonal
-        cos[0:len_work, 0:len_work] = 0
-        cos[len_work:, len_work:] = 0
+        # years are compared as integers, missing years never match
+        work_years = np.trunc(pd.to_numeric(workshops["W.year"], errors="coerce").to_numpy(dtype=float))
+        conf_years = np.trunc(pd.to_numeric(conferences["C.year"], errors="coerce").to_numpy(dtype=float))
 
         # find matches according to the similarity and threshold value
-        matches = np.argwhere(cos >= threshold)
+        if title_index is not None:
+            if len(title_index) != conferences.shape[0]:
+                raise ValueError(f"Title index holds {len(title_index)} titles, but {conferences.shape[0]} "
+                                 "conferences were given.")
+            work_idx, conf_idx, _ = title_index.query(
+                list(workshops["W.title"]), threshold, top_k=top_k, chunk_size=chunk_size,
+                workshop_keys=work_years if block_by_year else None,
+                conference_keys=conf_years if block_by_year else None,
+                tolerance=year_tolerance, max_workers=max_workers)
+        else:
+            corpus = list(workshops["W.title"])
+            len_work = len(corpus)
+
+            corpus.extend(list(conferences["C.title"]))
+            # vectorize corpus using td-idf
+            vectorizer = TfidfVectorizer(max_df=0.7)  # ignore stopwords
+            X = vectorizer.fit_transform(corpus)
+
+            # the rows are l2-normalized, so the sparse product of both blocks is the cosine similarity
+            if block_by_year:
+                work_idx, conf_idx, _ = blocked_top_k(X[0:len_work], X[len_work:], work_years, conf_years,
+                                                      threshold, tolerance=year_tolerance, top_k=top_k,
+                                                      chunk_size=chunk_size, max_workers=max_workers)
+            else:
+                work_idx, conf_idx, _ = sparse_top_k(X[0:len_work], X[len_work:], threshold,
+                                                     top_k=top_k, chunk_size=chunk_size)
+
+        # further check year
+        valid = np.abs(work_years[work_idx] - conf_years[conf_idx]) <= year_tolerance
+        pairs = pd.DataFrame({"w": work_idx[valid], "c": conf_idx[valid]})
+        pairs["num"] = np.arange(pairs.shape[0], dtype=float)
 
         # make copies since we start changing the dataframes
         w = workshops.copy()
@@ -158,22 +311,16 @@ class Matcher:
         c = c.reset_index(drop=True)
 
         # mark found matches
+        # a conference keeps the number of the first pair it occurs in,
+        # so that all workshops matched against it share its number
+        # a workshop takes the number of the conference of the last pair it occurs in
+        conf_partner = pairs.groupby("c")["num"].first()
+        work_partner = pairs.groupby("w")["c"].last().map(conf_partner)
+
         w["W.partner"] = np.nan
         c["C.partner"] = np.nan
-
-        # further check year
-        for num, match in enumerate(matches):
-            workshop = workshops.iloc[match[0]]
-            conference = conferences.iloc[match[1] - len_work]
-
-            if (pd.notna(workshop["W.year"]) and pd.notna(conference["C.year"]) and
-                    int(workshop["W.year"]) == int(conference["C.year"])):
-
-                # check whether conference has already matched against another workshop
-                if pd.notna(a := c.at[match[1] - len_work, "C.partner"]):
-                    num = a
-                w.at[match[0], "W.partner"] = num
-                c.at[match[1] - len_work, "C.partner"] = num
+        w.loc[work_partner.index, "W.partner"] = work_partner.to_numpy()
+        c.loc[conf_partner.index, "C.partner"] = conf_partner.to_numpy()
 
         # now remove all unmatched rows
         w = w[pd.notna(w["W.partner"])]
@@ -196,7 +343,8 @@ class Matcher:
                       remove_function: Callable[[str, list], None], remove_key: str,
                       conferences: pd.DataFrame, threshold: float,
                       add_colocated_attribute: bool = True,
-                      reload: bool = False, save_name: str = "placeholder") -> pd.DataFrame:
+                      reload: bool = False, save_name: str = "placeholder",
+                      inputs: Union[pd.DataFrame, None] = None) -> pd.DataFrame:
         """
         Matches the extract found from worshops using the iterative matching process
         to the given conferences.
@@ -210,31 +358,52 @@ class Matcher:
                              values with which to call the remove_function
             conferences(pandas.DataFrame): Conferences with matchable attributes. Required
             to have the columns short, title, locations, month, year to match against.
-            threshold(float): threshold value when titles should be seen as similar by fuzzy matching.
+            threshold(float): threshold value when titles should be seen as similar by fuzzy matching
+            with the tf-idf backend, the MinHash backend uses minhash_threshold instead.
             add_colocated_attribute(bool): flag to specify whether the colocated entry should be added as the
             second highest matching priority.
             reload(bool): whether to force reload match if cached version exists.
             save_name(str): name of the cached file.
+            inputs(pandas.DataFrame|None): all workshops the extract function provides information for,
+            used to decide whether a cached result is still valid. Callers caching the result should pass them:
+            if None, the extract for the first keyword is used instead, which has to be computed
+            before the cache can be checked, so a cache hit still costs one extraction.
         Returns:
             pandas.DataFrame: DataFrame that holds workshops and the conferences that they have matched with
         """
-        if not reload:
-            cache = self.cacher.load_csv(save_name)
+        iterative_match_list = self.matchtypes.copy()
+        # the similarities of the backends are on different scales
+        fuzzy_threshold = self.minhash_threshold if self.title_backend == "minhash" else threshold
+        if add_colocated_attribute:
+            iterative_match_list.insert(0, "colocated")
+
+        def cache_name(workshops: pd.DataFrame) -> Union[str, None]:
+            return self.cache_name(save_name, [workshops, conferences], threshold=threshold, remove_key=remove_key,
+                                   add_colocated_attribute=add_colocated_attribute)
+
+        cached_as = cache_name(inputs) if inputs is not None else None
+        if not reload and cached_as is not None:
+            cache = self.cacher.load_csv(cached_as)
             if cache is not None:
                 return cache
 
-        iterative_match_list = self.matchtypes
-        if add_colocated_attribute:
-            iterative_match_list.insert(0, "colocated")
+        work = extract_function(iterative_match_list[0])
+        if inputs is None:
+            cached_as = cache_name(work)
+            cache = self.cacher.load_csv(cached_as) if not reload and cached_as is not None else None
+            if cache is not None:
+                return cache
 
         # rename columns to control join operations
         conf = conferences.rename(columns={old: f"C.{old}" for old in conferences.columns})
-        work = extract_function(iterative_match_list[0])
         work = work.rename(columns={old: f"W.{old}" for old in work.columns})
 
         if type(conf["C.title"].iloc[0]) == list:
             conf["C.title"] = conf["C.title"].map(lambda l: l[0] if l else "")
 
+        # the conference titles are indexed once for all keywords
+        title_index = self.build_title_index(list(conf["C.title"]), reload=reload)
+
         res = pd.DataFrame(columns=list(work.columns).extend(list(conf.columns)))
 
         for match_type in iterative_match_list:
@@ -263,7 +432,12 @@ class Matcher:
             match2 = match2[pd.notna(match2["W.month"])]
 
             # remaining matching conditions are matching titles and year with additional identifier
-            match3 = self.fuzzy_title_matching(work, conf, threshold=threshold)
+            match3 = self.fuzzy_title_matching(work, conf, threshold=fuzzy_threshold,
+                                               top_k=self.top_k, chunk_size=self.chunk_size,
+                                               block_by_year=self.block_by_year,
+                                               year_tolerance=self.year_tolerance,
+                                               max_workers=self.max_workers,
+                                               title_index=title_index)
 
             # add found matches to result
             new = pd.concat([match1, match2, match3], ignore_index=True)
@@ -277,8 +451,11 @@ class Matcher:
             to_remove = list(new[f"W.{remove_key}"])
             remove_function(remove_key, to_remove)
 
-        if save_name != "placeholder":
-            self.cacher.store_csv(save_name, res)
+        if title_index is not None:
+            title_index.store(self.index_cacher)
+
+        if cached_as is not None:
+            self.store_match(cached_as, res)
         return res
 
     def link_workshops_dblp_conferences(self, workshops: List[Dict], number_key: str = "number",
@@ -325,7 +502,7 @@ class Matcher:
         return link_df
 
     def link_wikidata_dblp_conferences(self, conference_ids: List[str],
-                                       name: str, reload: bool = False) -> pd.DataFrame:
+                                       name: str, reload: bool = False, refresh: bool = False) -> pd.DataFrame:
         """
         Uses references from wikidata conferences and its proceedings into dblp to link the entities.
         Also notes, when a conference could be reached by using only the event / only the proceedings.
@@ -334,11 +511,12 @@ class Matcher:
             conference_ids(list(str)): wikidata ids of the form 'Q87055069' of conferences to link between sources.
             name(str): Argument to pass to sparql query cacher to identify already performed query.
             reload(bool): Argument to pass to sparql query cacher whether to force reload even if named query is cached.
+            refresh(bool): whether to update the cached Wikidata query with the changes since it was cached.
         Returns:
             pandas.DataFrame: DataFrame that holds the conference pairs that were successfully linked.
                               The key for wikidata is 'conference' and for dblp 'dblp_id'.
         """
-        wikidata_conferences = get_wikidata_dblp_info(conference_ids, name, reload)
+        wikidata_conferences = get_wikidata_dblp_info(conference_ids, name, reload, refresh)
 
         # first off we drop rows where none of the linking techniques have worked
         wikidata_conferences = wikidata_conferences.dropna(subset=["dblp_event", "dblp_proceedings", "uri"], how="all")
@@ -386,24 +564,32 @@ class Matcher:
             dblp_events_to_proceedings(wikidata_conferences[unknown]["uri"])
         )
 
-        # remove all entries that are not valid uris
-        wikidata_conferences = wikidata_conferences[
-            verify_dblp_uris(wikidata_conferences["dblp_id"])
-        ]
+        # the verification of the uris, the lookup of the events and the download of the conferences
+        # do not depend on each other, so their queries run at the same time
+        unknown = pd.isna(wikidata_conferences["uri"])
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            valid = executor.submit(verify_dblp_uris, wikidata_conferences["dblp_id"])
+            events = executor.submit(dblp_proceedings_to_events, wikidata_conferences[unknown]["dblp_id"])
+            conferences = (executor.submit(get_dblp_conferences, reload)
+                           if self.dblp_conferences is None else None)
 
-        # step 2: remember additional info for wikidata
-        # here we should verify each of our results
+            # remove all entries that are not valid uris
+            wikidata_conferences = wikidata_conferences[valid.result()]
 
-        # the uri may supply the dblp_event the most accurately
-        wikidata_conferences["dblp_event_supplement"] = (
-            wikidata_conferences["uri"]
-        )
-        # otherwise we may also use the proceedings
-        unknown = pd.isna(wikidata_conferences["dblp_event_supplement"])
+            # step 2: remember additional info for wikidata
+            # here we should verify each of our results
 
-        wikidata_conferences.loc[unknown, "dblp_event_supplement"] = (
-            dblp_proceedings_to_events(wikidata_conferences[unknown]["dblp_id"])
-        )
+            # the uri may supply the dblp_event the most accurately
+            wikidata_conferences["dblp_event_supplement"] = (
+                wikidata_conferences["uri"]
+            )
+            # otherwise we may also use the proceedings, the events are assigned by index
+            unknown = pd.isna(wikidata_conferences["dblp_event_supplement"])
+
+            wikidata_conferences.loc[unknown, "dblp_event_supplement"] = events.result()
+
+            if conferences is not None:
+                self.dblp_conferences = conferences.result()
 
         # verify events
         wikidata_conferences["dblp_event_supplement"] = (
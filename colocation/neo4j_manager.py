@@ -7,7 +7,7 @@ from py2neo.bulk import merge_nodes
 from .cache_manager import CsvCacheManager, JsonCacheManager
 from .dataloaders.wikidata_loader import get_wikidata_workshops_by_number
 import pandas as pd
-from typing import List, Tuple
+from typing import Iterable, List, Tuple
 
 
 class Neo4jManager:
@@ -194,7 +194,7 @@ return d, w1, w2
             print("The results problematic data will be saved in the home directory in .ceurws/conflicts.csv")
             print("Check if perhaps some incorrect data is present and correct it.")
             print("Conflict nodes will be ignored in the heuristic.")
-            cacher = CsvCacheManager()
+            cacher = CsvCacheManager(file_format="csv")
             cacher.store_csv("conflicts", pd.DataFrame(data=data))
 
             # if the type was wrapped, we need to unwrap it to access the variable
@@ -264,13 +264,13 @@ create (w)<-[:LINKED]-(d)
 
         merge_nodes(self.graph.auto(), result, merge_key=("Ceur-WS", "Ceur-WS"))
 
-    def add_ceur_attributes(self, volumes: List[dict], colocation_lod: List[dict]):
+    def add_ceur_attributes(self, volumes: Iterable[dict], colocation_lod: List[dict]):
         """
         Matches the already present Ceur-WS volumes and adds their information
         into the neo4j graph for better result readability.
 
         Args:
-            volumes(list(dict)): Ceur-WS volumes lod.
+            volumes(iterable(dict)): Ceur-WS volumes lod, only iterated once.
             colocation_lod(list(dict)): Ceur-Ws extract
         """
         # make a deep copy to modify the volume properties
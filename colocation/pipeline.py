@@ -0,0 +1,268 @@
+'''
+Created on 2026-10-17
+@author: nm
+
+Runner for the stages of the colocation process with resumable checkpoints.
+'''
+import hashlib
+import pickle
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Set, Union
+from .cache_manager import PickleCacheManager
+
+
+class Stage():
+    """
+    named step of a pipeline that computes its output from the outputs of other stages
+    """
+    def __init__(self, name: str, function: Callable[..., Any], inputs: Union[List[str], None] = None,
+                 after: Union[List[str], None] = None, params: Union[Dict[str, Any], None] = None,
+                 checkpoint: bool = True):
+        """
+        constructor
+
+        Args:
+            name(str): name of the stage, which is also the name of its output
+            function(callable): computes the output given the outputs of the input stages as keyword arguments
+            inputs(list(str)|None): stages whose outputs are passed to the function
+            after(list(str)|None): stages that have to be finished before, without using their output
+            params(dict|None): settings influencing the output, a checkpoint is only valid for the same settings
+            checkpoint(bool): whether to store the output to reuse it in later runs.
+                Stages with side effects like writing to a database should not be checkpointed.
+        """
+        self.name = name
+        self.function = function
+        self.inputs = inputs or []
+        self.after = after or []
+        self.params = params or {}
+        self.checkpoint = checkpoint
+
+    @property
+    def dependencies(self) -> List[str]:
+        """
+        Returns:
+            list(str): all stages that have to be finished before this one
+        """
+        return self.inputs + [name for name in self.after if name not in self.inputs]
+
+
+class Pipeline():
+    """
+    Runs stages in the order of their dependencies, independent stages concurrently.
+    Outputs of checkpointed stages are stored and reused as long as the stage,
+    its params and the checkpoints of its inputs did not change.
+    """
+    def __init__(self, name: str, cacher: Union[PickleCacheManager, None] = None,
+                 max_workers: int = 4, verbose: bool = True):
+        """
+        constructor
+
+        Args:
+            name(str): name of the pipeline, used to name the checkpoints
+            cacher(PickleCacheManager|None): store for the checkpoints, a folder named pipeline by default
+            max_workers(int): maximal number of stages running at the same time
+            verbose(bool): whether to print which stages are run
+        """
+        self.name = name
+        self.cacher = cacher if cacher is not None else PickleCacheManager(base_folder="pipeline")
+        self.max_workers = max_workers
+        self.verbose = verbose
+        self.stages: Dict[str, Stage] = {}
+
+    def add_stage(self, name: str, function: Callable[..., Any], inputs: Union[List[str], None] = None,
+                  after: Union[List[str], None] = None, params: Union[Dict[str, Any], None] = None,
+                  checkpoint: bool = True) -> Stage:
+        """
+        Add a stage after all stages it depends on.
+
+        Args:
+            name(str): name of the stage, which is also the name of its output
+            function(callable): computes the output given the outputs of the input stages as keyword arguments
+            inputs(list(str)|None): stages whose outputs are passed to the function
+            after(list(str)|None): stages that have to be finished before, without using their output
+            params(dict|None): settings influencing the output
+            checkpoint(bool): whether to store the output to reuse it in later runs
+        Returns:
+            Stage: the added stage
+        """
+        if name in self.stages:
+            raise ValueError(f"The stage {name} is already part of the pipeline.")
+        stage = Stage(name, function, inputs, after, params, checkpoint)
+        unknown = [dependency for dependency in stage.dependencies if dependency not in self.stages]
+        if unknown:
+            raise ValueError(f"The stage {name} depends on the unknown stages {unknown}.")
+        self.stages[name] = stage
+        return stage
+
+    def descendants(self, names: List[str]) -> Set[str]:
+        """
+        Args:
+            names(list(str)): stages to start from
+        Returns:
+            set(str): the given stages and all stages depending on them
+        """
+        found = set(names)
+        # stages are added after their dependencies, so one pass in order suffices
+        for stage in self.stages.values():
+            if any(dependency in found for dependency in stage.dependencies):
+                found.add(stage.name)
+        return found
+
+    def checkpoint_name(self, stage_name: str) -> str:
+        """
+        Args:
+            stage_name(str): name of the stage
+        Returns:
+            str: name of the pickle holding the output of the stage
+        """
+        return f"{self.name}-{stage_name}"
+
+    def load_meta(self, stage: Stage) -> Union[Dict[str, str], None]:
+        """
+        Args:
+            stage(Stage): checkpointed stage
+        Returns:
+            dict|None: key and token of the stored checkpoint, None if there is none
+        """
+        return self.cacher.load_pickle(f"{self.checkpoint_name(stage.name)}.meta")
+
+    def stage_key(self, stage: Stage, tokens: Dict[str, Union[str, None]]) -> str:
+        """
+        Identify the computation of a stage by its name, params and the checkpoints of its inputs.
+
+        Args:
+            stage(Stage): the stage
+            tokens(dict): token of the current output of every stage
+        Returns:
+            str: key the checkpoint of the stage has to have to be valid
+        """
+        key = repr((stage.name, sorted(stage.params.items()), [tokens.get(name) for name in stage.inputs]))
+        return hashlib.sha1(key.encode("utf8")).hexdigest()
+
+    def run(self, from_stage: Union[str, None] = None, only: Union[List[str], None] = None,
+            reload: bool = False) -> Dict[str, Any]:
+        """
+        Run the stages whose checkpoints are missing or outdated.
+
+        Args:
+            from_stage(str|None): stage to rerun together with all stages depending on it
+            only(list(str)|None): only run these stages, taking the outputs of their inputs from the checkpoints.
+                Inputs without checkpoint are run as well.
+            reload(bool): whether to rerun all stages
+        Returns:
+            dict: the outputs of the stages that were run and of the checkpoints they needed by stage name
+        """
+        for name in ([from_stage] if from_stage else []) + (only or []):
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage {name}, expected one of {list(self.stages)}.")
+
+        if only:
+            # inputs without checkpoint can only be computed again, stages are added after their inputs
+            selected = set(only)
+            for stage in reversed(list(self.stages.values())):
+                if stage.name in selected:
+                    selected.update(name for name in stage.inputs if not self.stages[name].checkpoint)
+            trusted = {name for stage in self.stages.values() if stage.name in selected
+                       for name in stage.inputs if name not in selected}
+            for name in trusted:
+                if self.load_meta(self.stages[name]) is None:
+                    raise Exception(f"The stage {name} has no checkpoint to take its output from.")
+            # the checkpoints of the inputs are used regardless of their validity
+            return self.execute([name for name in self.stages if name in selected | trusted], forced=selected,
+                                trusted=trusted)
+
+        forced = set(self.stages) if reload else self.descendants([from_stage]) if from_stage else set()
+        return self.execute(list(self.stages), forced=forced)
+
+    def execute(self, stages: List[str], forced: Set[str], trusted: Union[Set[str], None] = None) -> Dict[str, Any]:
+        """
+        Run stages concurrently as soon as the stages they depend on are finished.
+        A stage is skipped if its checkpoint was computed from the same params and input outputs,
+        its output is only loaded if a stage to run needs it.
+
+        Args:
+            stages(list(str)): the stages to consider in the order of the pipeline
+            forced(set(str)): stages to run even if their checkpoint is valid
+            trusted(set(str)): stages whose checkpoint is used without checking it
+        Returns:
+            dict: the outputs of the stages that were run and of the checkpoints they needed by stage name
+        """
+        trusted = trusted or set()
+        outputs = {}
+        tokens = {}
+        pending = list(stages)
+        running = {}
+        error = None
+
+        def resolve(stage: Stage) -> bool:
+            # take the output from the checkpoint if it is still valid
+            if stage.name in forced or not stage.checkpoint:
+                return False
+            meta = self.load_meta(stage)
+            if meta is None or (stage.name not in trusted and meta["key"] != self.stage_key(stage, tokens)):
+                return False
+            tokens[stage.name] = meta["token"]
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name in list(pending):
+                    stage = self.stages[name]
+                    # dependencies outside of the considered stages are not required, e.g. when running only some
+                    if any(dependency in pending or dependency in running.values()
+                           for dependency in stage.dependencies):
+                        continue
+                    pending.remove(name)
+                    if resolve(stage):
+                        continue
+                    for input_name in stage.inputs:
+                        if input_name not in outputs:
+                            if self.verbose:
+                                print(f"Reusing the result of stage {input_name}.")
+                            outputs[input_name] = self.cacher.load_pickle(self.checkpoint_name(input_name))
+                    if self.verbose:
+                        print(f"Running stage {name}.")
+                    kwargs = {input_name: outputs[input_name] for input_name in stage.inputs}
+                    running[executor.submit(stage.function, **kwargs)] = name
+
+                if not running:
+                    continue
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    stage = self.stages[name]
+                    try:
+                        outputs[name] = future.result()
+                    except Exception as e:
+                        # let the running stages finish to keep their checkpoints, but start no new ones
+                        error = error or e
+                        pending.clear()
+                        continue
+                    # stages depending on this one stay valid if the output did not change
+                    key = self.stage_key(stage, tokens)
+                    tokens[name] = output_token(outputs[name])
+                    if stage.checkpoint:
+                        self.cacher.store_pickle(self.checkpoint_name(name), outputs[name])
+                        # the meta data is written last, so it only exists for complete checkpoints
+                        self.cacher.store_pickle(f"{self.checkpoint_name(name)}.meta",
+                                                 {"key": key, "token": tokens[name]})
+
+        if error is not None:
+            raise error
+        return outputs
+
+
+def output_token(output: Any) -> str:
+    """
+    Identify the output of a stage by its content.
+
+    Args:
+        output(object): output of a stage
+    Returns:
+        str: hex digest of the pickled output, random if it can not be pickled
+    """
+    try:
+        return hashlib.sha1(pickle.dumps(output, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+    except Exception:
+        return uuid.uuid4().hex
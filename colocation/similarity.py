@@ -0,0 +1,466 @@
+'''
+Created on 2026-10-17
+@author: nm
+
+Candidate generation for the fuzzy title matching.
+'''
+import hashlib
+import inspect
+import re
+import zlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from typing import Any, Dict, List, Tuple, Union
+from .cache_manager import PickleCacheManager
+
+
+def sparse_top_k(workshop_vectors: sparse.spmatrix, conference_vectors: sparse.spmatrix,
+                 threshold: float, top_k: Union[int, None] = None,
+                 chunk_size: int = 1024) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes the similarity between l2-normalized sparse row vectors of workshops and conferences
+    without ever materializing the dense workshops x conferences similarity matrix.
+    The product is computed in chunks of workshop rows and only the best top_k conferences per
+    workshop with a similarity of at least threshold are retained, so that memory grows linearly
+    with the number of workshops and conferences.
+
+    Args:
+        workshop_vectors(scipy.sparse.spmatrix): l2-normalized vectors of the workshop titles (W x F).
+        conference_vectors(scipy.sparse.spmatrix): l2-normalized vectors of the conference titles (C x F).
+        threshold(float): minimal similarity for a pair to be seen as a candidate.
+        top_k(int|None): maximal number of candidates per workshop, None to keep all above the threshold.
+        chunk_size(int): number of workshop rows multiplied at once.
+    Returns:
+        (numpy.ndarray, numpy.ndarray, numpy.ndarray): workshop indices, conference indices and similarities
+        of the candidate pairs, ordered by workshop and then conference index.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size has to be positive, got {chunk_size}.")
+
+    workshop_vectors = sparse.csr_matrix(workshop_vectors)
+    # csr @ csr multiplies without converting the conferences again for every chunk
+    conference_vectors_t = sparse.csr_matrix(conference_vectors).T.tocsr()
+
+    rows, cols, scores = [], [], []
+    for start in range(0, workshop_vectors.shape[0], chunk_size):
+        block = (workshop_vectors[start:start + chunk_size] @ conference_vectors_t).tocsr()
+
+        for offset in range(block.shape[0]):
+            begin, end = block.indptr[offset], block.indptr[offset + 1]
+            row_scores = block.data[begin:end]
+            row_cols = block.indices[begin:end]
+
+            keep = row_scores >= threshold
+            row_scores, row_cols = row_scores[keep], row_cols[keep]
+
+            if top_k is not None and row_scores.shape[0] > top_k:
+                best = np.argpartition(-row_scores, top_k - 1)[:top_k]
+                row_scores, row_cols = row_scores[best], row_cols[best]
+
+            order = np.argsort(row_cols)
+            rows.append(np.full(row_cols.shape[0], start + offset, dtype=np.int64))
+            cols.append(row_cols[order].astype(np.int64))
+            scores.append(row_scores[order])
+
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=float)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+
+
+def blocked_top_k(workshop_vectors: sparse.spmatrix, conference_vectors: sparse.spmatrix,
+                  workshop_keys: np.ndarray, conference_keys: np.ndarray,
+                  threshold: float, tolerance: int = 0, top_k: Union[int, None] = None,
+                  chunk_size: int = 1024, max_workers: int = 1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Performs sparse_top_k separately for each block of workshops sharing the same numeric key (e.g. the year),
+    only comparing them to the conferences whose key differs by at most the tolerance.
+    Rows with a missing key are never compared.
+
+    Args:
+        workshop_vectors(scipy.sparse.spmatrix): l2-normalized vectors of the workshop titles (W x F).
+        conference_vectors(scipy.sparse.spmatrix): l2-normalized vectors of the conference titles (C x F).
+        workshop_keys(numpy.ndarray): numeric blocking key of each workshop, NaN if missing.
+        conference_keys(numpy.ndarray): numeric blocking key of each conference, NaN if missing.
+        threshold(float): minimal similarity for a pair to be seen as a candidate.
+        tolerance(int): maximal difference between the keys of compared workshops and conferences.
+        top_k(int|None): maximal number of candidates per workshop, None to keep all above the threshold.
+        chunk_size(int): number of workshop rows multiplied at once.
+        max_workers(int): number of blocks computed in parallel.
+    Returns:
+        (numpy.ndarray, numpy.ndarray, numpy.ndarray): workshop indices, conference indices and similarities
+        of the candidate pairs, ordered by workshop and then conference index.
+    """
+    workshop_vectors = sparse.csr_matrix(workshop_vectors)
+    conference_vectors = sparse.csr_matrix(conference_vectors)
+    workshop_keys = np.asarray(workshop_keys, dtype=float)
+    conference_keys = np.asarray(conference_keys, dtype=float)
+
+    def compute_block(key: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        work_block = np.flatnonzero(workshop_keys == key)
+        conf_block = np.flatnonzero(np.abs(conference_keys - key) <= tolerance)
+        rows, cols, scores = sparse_top_k(workshop_vectors[work_block], conference_vectors[conf_block],
+                                          threshold, top_k=top_k, chunk_size=chunk_size)
+        return work_block[rows], conf_block[cols], scores
+
+    keys = np.unique(workshop_keys[~np.isnan(workshop_keys)])
+    if max_workers > 1 and keys.shape[0] > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            blocks = list(executor.map(compute_block, keys))
+    else:
+        blocks = [compute_block(key) for key in keys]
+
+    if not blocks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=float)
+
+    rows = np.concatenate([block[0] for block in blocks])
+    cols = np.concatenate([block[1] for block in blocks])
+    scores = np.concatenate([block[2] for block in blocks])
+
+    order = np.lexsort((cols, rows))
+    return rows[order], cols[order], scores[order]
+
+
+class ConferenceIndex():
+    """
+    Index over conference titles that is built once and queried with workshop titles.
+    Subclasses implement the actual similarity measure.
+    """
+    cache_prefix = "index"
+
+    def __init__(self, conference_titles: List[str]):
+        """
+        constructor
+
+        Args:
+            conference_titles(list(str)): titles of the conferences to index
+        """
+        self.fingerprint = self.titles_fingerprint(conference_titles)
+        self.size = len(conference_titles)
+        self.changed = True
+
+    def __len__(self) -> int:
+        return self.size
+
+    def params(self) -> Dict[str, Any]:
+        """
+        Returns:
+            dict: parameters the index was built with, an index is only reused for the same parameters
+        """
+        return {}
+
+    @staticmethod
+    def titles_fingerprint(titles: List[str]) -> str:
+        """
+        Args:
+            titles(list(str)): titles to get a fingerprint for
+        Returns:
+            str: hash identifying the titles and their order
+        """
+        digest = hashlib.sha1()
+        for title in titles:
+            digest.update(str(title).encode("utf8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def update(self, conference_titles: List[str]) -> bool:
+        """
+        Adapt the index to changed conference titles, e.g. after the conferences were refreshed.
+
+        Args:
+            conference_titles(list(str)): titles of the conferences to index
+        Returns:
+            bool: whether the index covers the titles now, False if it has to be built again
+        """
+        return self.fingerprint == self.titles_fingerprint(conference_titles)
+
+    @classmethod
+    def load_or_fit(cls, conference_titles: List[str], cacher: PickleCacheManager,
+                    reload: bool = False, **params) -> "ConferenceIndex":
+        """
+        Get the index for the given conference titles from cache if present and build it otherwise.
+        The cached index is kept per class and updated for changed titles where the index supports it.
+
+        Args:
+            conference_titles(list(str)): titles of the conferences to index
+            cacher(PickleCacheManager): cache to look for and store the index
+            reload(bool): whether to force rebuilding the index
+            params: parameters passed to the constructor of the index
+        Returns:
+            ConferenceIndex: index for the conference titles
+        """
+        index = None if reload else cacher.load_pickle(cls.cache_prefix)
+        # an index built with other parameters, also with former defaults, is built again
+        defaults = {key: parameter.default for key, parameter in inspect.signature(cls.__init__).parameters.items()
+                    if parameter.default is not inspect.Parameter.empty}
+        expected = {**defaults, **params}
+        if index is None or any(expected.get(key, value) != value for key, value in index.params().items()) \
+                or not index.update(conference_titles):
+            index = cls(conference_titles, **params)
+        index.store(cacher)
+        return index
+
+    def store(self, cacher: PickleCacheManager):
+        """
+        Store the index if it changed since it was built or loaded.
+
+        Args:
+            cacher(PickleCacheManager): cache to store the index in
+        """
+        if self.changed:
+            self.changed = False
+            cacher.store_pickle(self.cache_prefix, self)
+
+    def query(self, workshop_titles: List[str], threshold: float, top_k: Union[int, None] = None,
+              chunk_size: int = 1024, workshop_keys: Union[np.ndarray, None] = None,
+              conference_keys: Union[np.ndarray, None] = None, tolerance: int = 0,
+              max_workers: int = 1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find the conferences similar to the given workshop titles.
+
+        Args:
+            workshop_titles(list(str)): titles to find similar conferences for.
+            threshold(float): minimal similarity for a pair to be seen as a candidate.
+            top_k(int|None): maximal number of candidates per workshop, None to keep all above the threshold.
+            chunk_size(int): number of workshops processed at once.
+            workshop_keys(numpy.ndarray|None): numeric blocking key of each workshop like the year.
+            conference_keys(numpy.ndarray|None): numeric blocking key of each conference.
+            If both keys are given, only workshops and conferences with keys within the tolerance are compared.
+            tolerance(int): maximal difference between the keys of compared workshops and conferences.
+            max_workers(int): number of blocks processed in parallel.
+        Returns:
+            (numpy.ndarray, numpy.ndarray, numpy.ndarray): workshop indices, conference indices and similarities
+            of the candidate pairs, ordered by workshop and then conference index.
+        """
+        raise NotImplementedError
+
+
+class TitleIndex(ConferenceIndex):
+    """
+    tf-idf embedding of conference titles that is fitted once and reused for many workshop queries.
+    Workshop titles are embedded using the vocabulary of the conferences and remembered while the index is in use,
+    such that only titles not seen before have to be transformed. They are not stored with the index.
+    Unlike fitting on the titles of both workshops and conferences, the document frequencies only
+    count conferences, so the similarities differ slightly from that embedding.
+    Changed conference titles are embedded with the fitted vocabulary, the vectorizer is only fitted again
+    once the terms missing from its vocabulary exceed max_drift of the terms it was fitted on.
+    """
+    cache_prefix = "title-index"
+    max_drift = 0.05
+
+    def __init__(self, conference_titles: List[str], max_df: float = 0.7):
+        """
+        constructor
+        fits the vectorizer on the conference titles
+
+        Args:
+            conference_titles(list(str)): titles of the conferences to index
+            max_df(float): ignore terms occurring in a higher share of titles (stopwords)
+        """
+        super().__init__(conference_titles)
+        self.max_df = max_df
+        self.vectorizer = TfidfVectorizer(max_df=max_df)
+        try:
+            self.conference_vectors = self.vectorizer.fit_transform(conference_titles)
+        except ValueError:
+            # small corpora may not have any term below max_df
+            self.vectorizer = TfidfVectorizer()
+            self.conference_vectors = self.vectorizer.fit_transform(conference_titles)
+        self.titles = list(conference_titles)
+        # terms cut by max_df are known as well, only terms never seen count as drift
+        analyzer = self.vectorizer.build_analyzer()
+        terms = [term for title in self.titles for term in analyzer(title)]
+        self.known_terms = set(terms)
+        self.fitted_terms = len(terms)
+        self.unknown_terms = 0
+        self.workshop_vectors: Dict[str, sparse.csr_matrix] = {}
+
+    def params(self) -> Dict[str, Any]:
+        return {"max_df": self.max_df}
+
+    def update(self, conference_titles: List[str]) -> bool:
+        rows = {title: row for row, title in enumerate(self.titles)}
+        new = list(dict.fromkeys(title for title in conference_titles if title not in rows))
+        if not new and len(conference_titles) == len(self.titles) and \
+                all(title == known for title, known in zip(conference_titles, self.titles)):
+            return True
+
+        analyzer = self.vectorizer.build_analyzer()
+        unknown = sum(term not in self.known_terms for title in new for term in analyzer(title))
+        if self.unknown_terms + unknown > self.max_drift * self.fitted_terms:
+            return False
+
+        rows.update({title: len(self.titles) + offset for offset, title in enumerate(new)})
+        vectors = sparse.vstack([self.conference_vectors, self.vectorizer.transform(new)], format="csr") \
+            if new else self.conference_vectors
+        self.conference_vectors = vectors[[rows[title] for title in conference_titles]]
+        self.titles = list(conference_titles)
+        self.unknown_terms += unknown
+        self.fingerprint = self.titles_fingerprint(conference_titles)
+        self.size = len(conference_titles)
+        self.changed = True
+        return True
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # the remembered workshops would make the cached index grow with every run
+        state = self.__dict__.copy()
+        state["workshop_vectors"] = {}
+        return state
+
+    def transform(self, workshop_titles: List[str]) -> sparse.csr_matrix:
+        """
+        Embed workshop titles using the vocabulary of the conferences.
+
+        Args:
+            workshop_titles(list(str)): titles to embed
+        Returns:
+            scipy.sparse.csr_matrix: l2-normalized embedding with one row per title
+        """
+        unseen = list(dict.fromkeys(title for title in workshop_titles if title not in self.workshop_vectors))
+        if unseen:
+            for title, vector in zip(unseen, self.vectorizer.transform(unseen)):
+                self.workshop_vectors[title] = vector
+
+        if not workshop_titles:
+            return sparse.csr_matrix((0, self.conference_vectors.shape[1]))
+        return sparse.vstack([self.workshop_vectors[title] for title in workshop_titles], format="csr")
+
+    def query(self, workshop_titles: List[str], threshold: float, top_k: Union[int, None] = None,
+              chunk_size: int = 1024, workshop_keys: Union[np.ndarray, None] = None,
+              conference_keys: Union[np.ndarray, None] = None, tolerance: int = 0,
+              max_workers: int = 1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        work_vectors = self.transform(workshop_titles)
+        if workshop_keys is not None and conference_keys is not None:
+            return blocked_top_k(work_vectors, self.conference_vectors, workshop_keys, conference_keys,
+                                 threshold, tolerance=tolerance, top_k=top_k,
+                                 chunk_size=chunk_size, max_workers=max_workers)
+        return sparse_top_k(work_vectors, self.conference_vectors, threshold, top_k=top_k, chunk_size=chunk_size)
+
+
+class MinHashIndex(ConferenceIndex):
+    """
+    Approximate title similarity using MinHash signatures of character shingles and LSH banding.
+    Titles are only compared to conferences that share at least one band of their signature,
+    so a lookup does not have to consider every conference.
+    The similarity is the estimated Jaccard similarity of the shingle sets.
+    The default of 64 bands of two rows finds almost all pairs with a similarity of 0.3 and more as candidates.
+    """
+    cache_prefix = "minhash-index"
+    prime = (1 << 31) - 1
+
+    def __init__(self, conference_titles: List[str], num_perm: int = 128, bands: int = 64,
+                 shingle_size: int = 3, seed: int = 1):
+        """
+        constructor
+        computes the signatures of the conference titles and distributes them into the band buckets
+
+        Args:
+            conference_titles(list(str)): titles of the conferences to index
+            num_perm(int): number of hash permutations of a signature
+            bands(int): number of bands the signature is split into, has to divide num_perm
+            shingle_size(int): number of characters per shingle
+            seed(int): seed of the hash permutations
+        """
+        if num_perm % bands != 0:
+            raise ValueError(f"The number of bands {bands} has to divide the number of permutations {num_perm}.")
+        super().__init__(conference_titles)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.seed = seed
+
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, self.prime, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, self.prime, size=num_perm).astype(np.uint64)
+
+        self.conference_signatures, valid = self.signatures(conference_titles)
+        self.buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        for conference in np.flatnonzero(valid):
+            signature = self.conference_signatures[conference]
+            for band, key in enumerate(self.band_keys(signature)):
+                self.buckets[band].setdefault(key, []).append(int(conference))
+
+    def params(self) -> Dict[str, Any]:
+        return {"num_perm": self.num_perm, "bands": self.bands, "shingle_size": self.shingle_size, "seed": self.seed}
+
+    def shingles(self, title: str) -> np.ndarray:
+        """
+        Args:
+            title(str): title to get the shingles for
+        Returns:
+            numpy.ndarray: hashes of the character shingles of the normalized title
+        """
+        text = re.sub(r"\s+", " ", str(title).lower()).strip()
+        if len(text) < self.shingle_size:
+            grams = {text} if text else set()
+        else:
+            grams = {text[i:i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+        return np.array([zlib.crc32(gram.encode("utf8")) % self.prime for gram in grams], dtype=np.uint64)
+
+    def signatures(self, titles: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Args:
+            titles(list(str)): titles to get the MinHash signatures for
+        Returns:
+            (numpy.ndarray, numpy.ndarray): signature per title as rows of a matrix
+            and a mask of the titles that have any shingle and hence a valid signature
+        """
+        signatures = np.zeros((len(titles), self.num_perm), dtype=np.uint64)
+        valid = np.zeros(len(titles), dtype=bool)
+        for row, title in enumerate(titles):
+            hashes = self.shingles(title)
+            if hashes.shape[0] == 0:
+                continue
+            permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % self.prime
+            signatures[row] = permuted.min(axis=1)
+            valid[row] = True
+        return signatures, valid
+
+    def band_keys(self, signature: np.ndarray) -> List[bytes]:
+        """
+        Args:
+            signature(numpy.ndarray): signature to split into bands
+        Returns:
+            list(bytes): bucket key of the signature for every band
+        """
+        return [band.tobytes() for band in np.split(signature, self.bands)]
+
+    def query(self, workshop_titles: List[str], threshold: float, top_k: Union[int, None] = None,
+              chunk_size: int = 1024, workshop_keys: Union[np.ndarray, None] = None,
+              conference_keys: Union[np.ndarray, None] = None, tolerance: int = 0,
+              max_workers: int = 1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        blocked = workshop_keys is not None and conference_keys is not None
+        if blocked:
+            workshop_keys = np.asarray(workshop_keys, dtype=float)
+            conference_keys = np.asarray(conference_keys, dtype=float)
+
+        rows, cols, scores = [], [], []
+        signatures, valid = self.signatures(workshop_titles)
+        for workshop in np.flatnonzero(valid):
+            signature = signatures[workshop]
+            candidates = set()
+            for band, key in enumerate(self.band_keys(signature)):
+                candidates.update(self.buckets[band].get(key, []))
+            if not candidates:
+                continue
+
+            candidates = np.array(sorted(candidates), dtype=np.int64)
+            if blocked:
+                candidates = candidates[np.abs(conference_keys[candidates] - workshop_keys[workshop]) <= tolerance]
+
+            candidate_scores = np.mean(self.conference_signatures[candidates] == signature, axis=1)
+            keep = candidate_scores >= threshold
+            candidates, candidate_scores = candidates[keep], candidate_scores[keep]
+
+            if top_k is not None and candidates.shape[0] > top_k:
+                best = np.sort(np.argpartition(-candidate_scores, top_k - 1)[:top_k])
+                candidates, candidate_scores = candidates[best], candidate_scores[best]
+
+            rows.append(np.full(candidates.shape[0], workshop, dtype=np.int64))
+            cols.append(candidates)
+            scores.append(candidate_scores)
+
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=float)
+        return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
@@ -17,4 +17,6 @@ class Constants():
     Constants impacting aspects of the program.
     """
     MATCH_THREASHOLD = 0.45
+    # the estimated Jaccard similarity of character shingles is lower than the tf-idf cosine of the same titles
+    MINHASH_MATCH_THREASHOLD = 0.35
     LINK_THREASHOLD = 3
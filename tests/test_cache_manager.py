@@ -5,8 +5,46 @@ Created on 2023-04-28
 '''
 import unittest
 import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from colocation.cache_manager import JsonCacheManager
+import orjson
+import pandas as pd
+from colocation.cache_manager import (CsvCacheManager, JsonCacheManager, SqliteCacheManager, MemoryCache,
+                                      detect_compression, memory_cache)
+
+try:
+    import zstandard  # noqa: F401
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+
+class VolumeHandler(BaseHTTPRequestHandler):
+    """
+    stand-in for the volume provider, which fails the first request of every volume
+    """
+    requests = []
+
+    def do_GET(self):
+        path = self.path.strip("/")
+        name = path[:-5] if path.endswith(".json") else path
+        first = name not in self.requests
+        self.requests.append(name)
+        if name.startswith("missing"):
+            self.send_error(404)
+        elif first:
+            self.send_error(503)
+        else:
+            body = orjson.dumps({"number": name, "wd.event": f"http://www.wikidata.org/entity/{name}"})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
 
 
 class TestMatcher(unittest.TestCase):
@@ -38,5 +76,415 @@ class TestMatcher(unittest.TestCase):
         pass
 
 
+class TestSqliteCacheManager(unittest.TestCase):
+    """
+    test the key-value store for many small documents
+    """
+
+    def setUp(self):
+        self.cacher = SqliteCacheManager("test-kv", base_folder="test")
+        if os.path.isfile(path := self.cacher.db_path()):
+            os.remove(path)
+
+    def tearDown(self):
+        pass
+
+    def testStore(self):
+        """
+        test storing and loading documents in batches
+        """
+        cacher = self.cacher
+        self.assertIsNone(cacher.get("a"))
+
+        documents = {f"key-{i}": {"number": i, "entities": [["2015"], ["Italy"]]} for i in range(1200)}
+        cacher.put_many(documents)
+        self.assertTrue(os.path.isfile(f"{Path.home()}/.ceurws/test/test-kv.sqlite"))
+
+        found = cacher.get_many(["key-1", "key-1199", "missing", "key-1"])
+        self.assertDictEqual(found, {"key-1": documents["key-1"], "key-1199": documents["key-1199"]})
+        self.assertEqual(len(cacher.get_many(list(documents.keys()))), 1200)
+
+        cacher.put("key-1", [1, 2])
+        self.assertListEqual(cacher.get("key-1"), [1, 2])
+
+
+class RevalidationHandler(BaseHTTPRequestHandler):
+    """
+    stand-in for a provider supporting conditional requests
+    """
+    list_version = 1
+    statuses = []
+
+    def do_GET(self):
+        etag = f'"v{self.list_version}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.statuses.append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = orjson.dumps([{"number": i, "version": self.list_version} for i in range(100)])
+        self.statuses.append(200)
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", "Mon, 02 Oct 2023 10:00:00 GMT")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestCsvCacheManager(unittest.TestCase):
+    """
+    test caching dataframes in columnar files
+    """
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            "title": [["A conference", "Conf"], [], ["Another conference"]],
+            "short": ["AC 2020", None, "ANC 2021"],
+            "timepoint": pd.to_datetime(["2020-05-01", None, "2021-09-13"]),
+            "year": [2020.0, None, 2021.0]
+        }, index=[3, 5, 7])
+
+    def tearDown(self):
+        pass
+
+    def testColumnar(self):
+        """
+        test that dtypes and lists survive the columnar formats
+        """
+        for file_format in ["parquet", "feather"]:
+            cacher = CsvCacheManager(base_folder="test-frames", file_format=file_format)
+            cacher.store_csv("frame", self.df)
+            self.assertTrue(os.path.isfile(cacher.save_path("frame", file_format)))
+            self.assertFalse(os.path.isfile(cacher.save_path("frame", "csv")))
+
+            df = cacher.load_csv("frame")
+            self.assertListEqual(list(df["title"]), list(self.df["title"]))
+            self.assertTrue(pd.api.types.is_datetime64_any_dtype(df["timepoint"]))
+            self.assertEqual(df["timepoint"].dt.month.iloc[2], 9)
+            self.assertListEqual(list(df.columns), list(self.df.columns))
+
+    def testCsvFallback(self):
+        """
+        test that frames pyarrow can not store are cached as csv
+        """
+        cacher = CsvCacheManager(base_folder="test-frames")
+        cacher.store_csv("mixed", pd.DataFrame({"value": [1, "a", [2]]}))
+        self.assertTrue(os.path.isfile(cacher.save_path("mixed", "csv")))
+        self.assertFalse(os.path.isfile(cacher.save_path("mixed", "parquet")))
+        self.assertEqual(cacher.load_csv("mixed").shape[0], 3)
+
+        self.assertIsNone(cacher.load_csv("not-cached"))
+        with self.assertRaises(ValueError):
+            CsvCacheManager(file_format="xlsx")
+
+
+class TestStreaming(unittest.TestCase):
+    """
+    test iterating over cached lists of dicts
+    """
+
+    def setUp(self):
+        self.cacher = JsonCacheManager(base_folder="test-stream")
+        self.lod = [{"number": i, "title": f"Proceedings {i} [\"quoted\"]", "colocated": None if i % 3 else "ISWC",
+                     "nested": {"list": [i, 1.5, True]}} for i in range(50)] + [7, "text", None]
+
+    def tearDown(self):
+        pass
+
+    def testIterLod(self):
+        """
+        test that the elements are the same for any chunk size and formatting
+        """
+        for indent in [False, True]:
+            self.cacher.store_lod("volumes", self.lod, indent=indent)
+            self.assertListEqual(self.cacher.load_lod("volumes"), self.lod)
+            for chunk_size in [1, 7, 100, 1 << 20]:
+                self.assertListEqual(list(self.cacher.iter_lod("volumes", chunk_size=chunk_size)), self.lod)
+
+        self.cacher.store_lod("empty", [])
+        self.assertListEqual(list(self.cacher.iter_lod("empty", chunk_size=1)), [])
+
+    def testInvalid(self):
+        """
+        test that truncated files and files without a list can not be iterated
+        """
+        with open(self.cacher.json_path("truncated"), "w") as json_file:
+            json_file.write('[{"number": 1}, {"number": 2')
+        with self.assertRaises(Exception):
+            list(self.cacher.iter_lod("truncated", chunk_size=4))
+
+        self.cacher.store_lod("dict", {"number": 1})
+        with self.assertRaises(Exception):
+            list(self.cacher.iter_lod("dict"))
+
+
+class TestCompression(unittest.TestCase):
+    """
+    test compressed cache files
+    """
+
+    def setUp(self):
+        self.compressions = ["gzip", "zstd"] if HAS_ZSTD else ["gzip"]
+        self.lod = [{"number": i, "title": f"Proceedings of the workshop {i}"} for i in range(200)]
+
+    def tearDown(self):
+        pass
+
+    def testJson(self):
+        """
+        test that compressed lists of dicts are read by any cache manager
+        """
+        plain = JsonCacheManager(base_folder="test-compress")
+        for compression in self.compressions:
+            cacher = JsonCacheManager(base_folder="test-compress", compression=compression)
+            cacher.store_lod("volumes", self.lod)
+            path = cacher.json_path("volumes")
+            self.assertEqual(detect_compression(path), compression)
+            self.assertListEqual(plain.load_lod("volumes"), self.lod)
+            self.assertListEqual(list(plain.iter_lod("volumes", chunk_size=10)), self.lod)
+
+        plain.store_lod("volumes", self.lod)
+        self.assertIsNone(detect_compression(plain.json_path("volumes")))
+
+    def testCsv(self):
+        """
+        test that compressed dataframes are read in every format
+        """
+        df = pd.DataFrame(self.lod)
+        for file_format in ["csv", "parquet"]:
+            for compression in self.compressions:
+                cacher = CsvCacheManager(base_folder="test-compress", file_format=file_format, compression=compression)
+                cacher.store_csv("volumes", df)
+                if file_format == "csv":
+                    self.assertEqual(detect_compression(cacher.save_path("volumes", "csv")), compression)
+                self.assertListEqual(list(cacher.load_csv("volumes")["title"]), list(df["title"]))
+
+        with self.assertRaises(ValueError):
+            JsonCacheManager(compression="bz2")
+
+
+class TestMemoryCache(unittest.TestCase):
+    """
+    test the in-memory layer in front of the cached files
+    """
+
+    def setUp(self):
+        memory_cache.clear()
+
+    def tearDown(self):
+        pass
+
+    def testFrames(self):
+        """
+        test that repeated loads are served from memory as copies until the file changes
+        """
+        cacher = CsvCacheManager(base_folder="test-memory")
+        cacher.store_csv("frame", pd.DataFrame({"title": ["A", "B"], "year": [2020, 2021]}))
+        path = cacher.save_path("frame", cacher.file_format)
+
+        df = cacher.load_csv("frame")
+        self.assertIsNotNone(memory_cache.get(path, "frame"))
+        df.loc[0, "title"] = "changed"
+        self.assertListEqual(list(cacher.load_csv("frame")["title"]), ["A", "B"])
+
+        cacher.store_csv("frame", pd.DataFrame({"title": ["C"], "year": [2022]}))
+        self.assertListEqual(list(cacher.load_csv("frame")["title"]), ["C"])
+
+    def testJson(self):
+        """
+        test that parsed lists of dicts are not shared between loads
+        """
+        cacher = JsonCacheManager(base_folder="test-memory")
+        cacher.store_lod("lod", [{"number": 1}])
+        lod = cacher.load_lod("lod")
+        lod[0]["number"] = 2
+        self.assertListEqual(cacher.load_lod("lod"), [{"number": 1}])
+        self.assertIsNotNone(memory_cache.get(cacher.json_path("lod"), "bytes"))
+
+        cacher.store_lod("lod", [{"number": 3}])
+        self.assertListEqual(cacher.load_lod("lod"), [{"number": 3}])
+
+    def testEviction(self):
+        """
+        test that the least recently used values are evicted first
+        """
+        cache = MemoryCache(max_bytes=10)
+        paths = []
+        for i in range(3):
+            cacher = JsonCacheManager(base_folder="test-memory")
+            cacher.store_lod(f"lod-{i}", [i])
+            paths.append(cacher.json_path(f"lod-{i}"))
+            cache.put(paths[-1], "bytes", i, 4)
+
+        self.assertIsNone(cache.get(paths[0], "bytes"))
+        self.assertEqual(cache.get(paths[1], "bytes"), 1)
+        cache.put(paths[0], "bytes", 0, 4)
+        # lod-2 was used least recently
+        self.assertIsNone(cache.get(paths[2], "bytes"))
+        self.assertEqual(cache.size, 8)
+
+        cache.put(paths[0], "bytes", 0, 11)
+        self.assertIsNone(cache.get(paths[0], "bytes"))
+
+
+class TestConcurrentDownload(unittest.TestCase):
+    """
+    test fetching many volumes at once from a local provider
+    """
+
+    def setUp(self):
+        VolumeHandler.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), VolumeHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.cacher = JsonCacheManager(base_url=f"http://127.0.0.1:{self.server.server_port}",
+                                       base_folder="test-download", backoff=0.01, min_interval=0.001)
+        for i in range(20):
+            if os.path.isfile(path := self.cacher.json_path(f"Vol-{i}")):
+                os.remove(path)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testLoadLods(self):
+        """
+        test that missing volumes are downloaded concurrently with retries and cached afterwards
+        """
+        names = [f"Vol-{i}" for i in range(20)]
+        lods = self.cacher.load_lods(names + ["Vol-3"], max_workers=4)
+        self.assertListEqual(list(lods.keys()), names)
+        self.assertEqual(lods["Vol-3"]["number"], "Vol-3")
+        self.assertTrue(os.path.isfile(self.cacher.json_path("Vol-19")))
+        # every volume failed once and was then retried
+        self.assertEqual(len(VolumeHandler.requests), 40)
+
+        self.cacher.load_lods(names, max_workers=4)
+        self.assertEqual(len(VolumeHandler.requests), 40)
+
+        # a reload streams into the cache
+        self.assertDictEqual(self.cacher.reload_lod("Vol-3"), lods["Vol-3"])
+        self.assertEqual(len(VolumeHandler.requests), 41)
+        self.assertFalse(os.path.isfile(self.cacher.json_path("Vol-3") + ".part"))
+
+    def testDocumentStore(self):
+        """
+        test that volumes are kept in the packed store instead of a json file each
+        """
+        store = SqliteCacheManager("test-volumes", base_folder="test-download")
+        if os.path.isfile(path := store.db_path()):
+            os.remove(path)
+        cacher = JsonCacheManager(base_url=self.cacher.base_url, base_folder="test-download",
+                                  backoff=0.01, document_store=store)
+        # a volume cached as json by an earlier run
+        self.cacher.store_lod("Vol-0", {"number": "Vol-0", "wd.event": None})
+
+        names = [f"Vol-{i}" for i in range(10)]
+        lods = cacher.load_lods(names, max_workers=4)
+        self.assertIsNone(lods["Vol-0"]["wd.event"])
+        self.assertEqual(lods["Vol-9"]["number"], "Vol-9")
+        self.assertEqual(len(VolumeHandler.requests), 18)
+        self.assertFalse(any(os.path.isfile(self.cacher.json_path(name)) for name in names))
+        self.assertDictEqual(store.get_many(names), lods)
+
+        self.assertDictEqual(cacher.load_lod("Vol-5"), lods["Vol-5"])
+        self.assertDictEqual(cacher.load_lods(names), lods)
+        self.assertEqual(len(VolumeHandler.requests), 18)
+
+    def testPermanentError(self):
+        """
+        test that client errors are not retried
+        """
+        with self.assertRaises(Exception):
+            self.cacher.load_lods(["missing-1", "missing-2"])
+        self.assertListEqual(sorted(VolumeHandler.requests), ["missing-1", "missing-2"])
+
+        with self.assertRaises(Exception) as context:
+            self.cacher.reload_lod("missing-1")
+        self.assertEqual(str(context.exception).count("Could not read"), 1)
+
+    def testPartialFailure(self):
+        """
+        test that the volumes loaded before a failing one are kept in the store
+        """
+        store = SqliteCacheManager("test-volumes", base_folder="test-download")
+        if os.path.isfile(path := store.db_path()):
+            os.remove(path)
+        cacher = JsonCacheManager(base_url=self.cacher.base_url, base_folder="test-download",
+                                  backoff=0.01, document_store=store)
+
+        names = [f"Vol-{i}" for i in range(10)]
+        with self.assertRaises(Exception):
+            cacher.load_lods(names + ["missing-1"], max_workers=4)
+        self.assertEqual(len(store.get_many(names)), 10)
+
+        # a second run only asks for the failed volume again
+        VolumeHandler.requests = []
+        with self.assertRaises(Exception):
+            cacher.load_lods(names + ["missing-1"], max_workers=4)
+        self.assertListEqual(VolumeHandler.requests, ["missing-1"])
+
+
+class TestRevalidation(unittest.TestCase):
+    """
+    test revalidating cached lists of dicts with conditional requests
+    """
+
+    def setUp(self):
+        RevalidationHandler.list_version = 1
+        RevalidationHandler.statuses = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), RevalidationHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.cacher = JsonCacheManager(base_url=f"http://127.0.0.1:{self.server.server_port}",
+                                       base_folder="test-revalidate", ttl=0)
+        for path in [self.cacher.json_path("volumes"), self.cacher.meta_path("volumes")]:
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testConditionalRequests(self):
+        """
+        test that unchanged lists are not downloaded again
+        """
+        lod = self.cacher.load_lod("volumes")
+        meta = self.cacher.load_meta("volumes")
+        self.assertEqual(meta["etag"], '"v1"')
+        self.assertEqual(meta["last_modified"], "Mon, 02 Oct 2023 10:00:00 GMT")
+
+        # the ttl of 0 revalidates on every load
+        self.assertListEqual(self.cacher.load_lod("volumes"), lod)
+        self.assertListEqual(list(self.cacher.iter_lod("volumes")), lod)
+        self.assertListEqual(RevalidationHandler.statuses, [200, 304, 304])
+        self.assertTrue(self.cacher.load_meta("volumes")["fetched"] >= meta["fetched"])
+
+        RevalidationHandler.list_version = 2
+        self.assertEqual(self.cacher.load_lod("volumes")[0]["version"], 2)
+        self.assertEqual(self.cacher.load_meta("volumes")["etag"], '"v2"')
+
+        # without ttl the cached copy is used forever
+        cacher = JsonCacheManager(base_url=self.cacher.base_url, base_folder="test-revalidate")
+        RevalidationHandler.list_version = 3
+        self.assertEqual(cacher.load_lod("volumes")[0]["version"], 2)
+        self.assertListEqual(RevalidationHandler.statuses, [200, 304, 304, 200])
+
+    def testUnreachable(self):
+        """
+        test that a stale copy is used if the provider can not be reached
+        """
+        lod = self.cacher.load_lod("volumes")
+        self.server.shutdown()
+        self.server.server_close()
+        cacher = JsonCacheManager(base_url=self.cacher.base_url, base_folder="test-revalidate", ttl=0,
+                                  retries=0, timeout=1)
+        self.assertListEqual(cacher.load_lod("volumes"), lod)
+        self.assertListEqual(list(cacher.iter_lod("volumes")), lod)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -5,17 +5,80 @@ Created on 2023-08-02
 '''
 import unittest
 import os
+import re
+import shutil
+import tempfile
+import threading
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
 from pathlib import Path
 import pandas as pd
 import numpy as np
+from colocation.dataloaders import dblp_loader
 from colocation.dataloaders.dblp_loader import (get_dblp_conferences, get_dblp_workshops, guess_dblp_conference,
                                                 dblp_proceedings_to_events, dblp_events_to_proceedings,
                                                 verify_dblp_uris, verify_dblp_events)
+from colocation.cache_manager import CsvCacheManager
+
+DBLP_SAMPLE = os.path.join(os.path.dirname(__file__), "..", "testdata", "dblp-sample.xml.gz")
 
 
 IN_CI = os.environ.get('CI', False)
 
 
+class SparqlHandler(BaseHTTPRequestHandler):
+    """
+    stand-in for the Dblp SPARQL endpoint, which knows the toc page of the proceedings with an even year
+    """
+    queries = []
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+
+    def do_POST(self):
+        with self.lock:
+            SparqlHandler.active += 1
+            SparqlHandler.max_active = max(SparqlHandler.max_active, SparqlHandler.active)
+        try:
+            body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf8")
+            query = parse_qs(body)["query"][0]
+            values = re.search(r"Values \?dblp \{(.*?)\}", query).group(1)
+            uris = re.findall(r"<([^>]*)>", values)
+            with self.lock:
+                self.queries.append(uris)
+
+            bindings = []
+            for uri in uris:
+                year = uri.split("/")[-1]
+                if year.isdigit() and int(year) % 2 == 0:
+                    bindings.append({
+                        "dblp": {"type": "uri", "value": uri},
+                        "toc": {"type": "uri", "value": uri.replace("/rec/", "/db/") + ".html"},
+                        "event": {"type": "uri", "value": uri.replace("/rec/", "/db/") + ".html"},
+                    })
+            variables = re.search(r"select (?:distinct )?(.*)\n", query).group(1).replace("?", "").split()
+            response = {
+                "head": {"vars": variables},
+                "results": {"bindings": [{v: b[v] for v in variables} for b in bindings]}
+            }
+            # give the other queries the chance to overlap
+            threading.Event().wait(0.05)
+
+            data = json.dumps(response).encode("utf8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/sparql-results+json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with self.lock:
+                SparqlHandler.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
 class TestDblp(unittest.TestCase):
     """
     test download and caching
@@ -147,5 +210,134 @@ class TestDblp(unittest.TestCase):
         self.assertTrue(not proc_to_eve.any())
 
 
+class TestBatchedQueries(unittest.TestCase):
+    """
+    test splitting the values of Dblp queries into chunks
+    """
+
+    def setUp(self):
+        SparqlHandler.queries = []
+        SparqlHandler.max_active = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SparqlHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint_url = dblp_loader.dblp_endpoint_url
+        self.chunk_size = dblp_loader.values_chunk_size
+        dblp_loader.dblp_endpoint_url = f"http://127.0.0.1:{self.server.server_address[1]}/sparql"
+        dblp_loader.values_chunk_size = 3
+
+    def tearDown(self):
+        dblp_loader.dblp_endpoint_url = self.endpoint_url
+        dblp_loader.values_chunk_size = self.chunk_size
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testChunks(self):
+        """
+        test that the values are queried in concurrent chunks and the results are combined
+        """
+        uris = [f"https://dblp.org/rec/conf/test/{year}" for year in range(2000, 2010)]
+        result = verify_dblp_uris(pd.Series(data=uris + [uris[0], None]))
+
+        self.assertListEqual([year % 2 == 0 for year in range(2000, 2010)] + [True, False], result.to_list())
+        # duplicates and missing values are not queried
+        self.assertListEqual(sorted(len(chunk) for chunk in SparqlHandler.queries), [1, 3, 3, 3])
+        self.assertSetEqual({uri for chunk in SparqlHandler.queries for uri in chunk}, set(uris))
+        self.assertTrue(SparqlHandler.max_active > 1)
+
+    def testKeepsIndex(self):
+        """
+        test that the events of proceedings are assigned by uri and not by position
+        """
+        proceedings = pd.Series(data=[f"https://dblp.org/rec/conf/test/{year}" for year in range(2000, 2005)] + [None],
+                                index=[10, 11, 12, 13, 14, 15])
+        events = dblp_proceedings_to_events(proceedings)
+
+        self.assertListEqual(events.index.to_list(), proceedings.index.to_list())
+        self.assertEqual(events[10], "https://dblp.org/db/conf/test/2000.html")
+        self.assertTrue(pd.isna(events[11]))
+        self.assertEqual(events[14], "https://dblp.org/db/conf/test/2004.html")
+        self.assertTrue(pd.isna(events[15]))
+
+        self.assertTrue(verify_dblp_events(proceedings, events).iloc[[0, 2, 4]].all())
+
+    def testEmpty(self):
+        """
+        test that no query is sent without values
+        """
+        self.assertListEqual(dblp_loader.query_dblp_batched(lambda values: {}, []), [])
+        self.assertListEqual(SparqlHandler.queries, [])
+
+
+class TestDblpDump(unittest.TestCase):
+    """
+    test reading conferences and workshops from a local dblp.xml dump
+    """
+
+    def setUp(self):
+        self.cacher = dblp_loader.dblp_cacher
+        dblp_loader.dblp_cacher = CsvCacheManager(base_folder="test-dblp")
+        self.folder = tempfile.mkdtemp()
+        self.dump_path = os.path.join(self.folder, "dblp.xml.gz")
+        shutil.copy(DBLP_SAMPLE, self.dump_path)
+
+    def tearDown(self):
+        dblp_loader.dblp_cacher = self.cacher
+        shutil.rmtree(self.folder)
+
+    def testConferences(self):
+        """
+        test that the conferences are built like from the query
+        """
+        conferences = get_dblp_conferences(reload=True, dump_path=self.dump_path)
+
+        self.assertListEqual(list(conferences.columns), ["volume", "event", "title", "doi"])
+        volumes = conferences["volume"].to_list()
+        # workshops and records which are no conference proceedings are left out, split proceedings get a virtual one
+        self.assertListEqual(volumes, ["https://dblp.org/rec/conf/aaai/2019", "https://dblp.org/rec/conf/ecir/2015-1",
+                                       "https://dblp.org/rec/conf/ecir/2015-2", "https://dblp.org/rec/conf/mue/2018",
+                                       "https://dblp.org/rec/conf/ecir/2015", "https://dblp.org/rec/conf/ecir/2015"])
+
+        aaai = conferences.iloc[0]
+        self.assertEqual(aaai["event"], "https://dblp.org/db/conf/aaai/aaai2019")
+        self.assertEqual(aaai["doi"], "10.1609/aaai.v33i01")
+        # entities and markup are resolved to text
+        self.assertIn("Conference on IR Research", conferences.iloc[1]["title"])
+        self.assertTrue(conferences.iloc[3]["title"].startswith("München Conference on Ubiquitous Engineering, M&UE"))
+
+    def testWorkshops(self):
+        """
+        test that the Ceur-WS workshops are selected by number with the guess of their conference
+        """
+        workshops = get_dblp_workshops([2328, 1338, 1], number_key="Ceur-WS", dump_path=self.dump_path)
+
+        self.assertListEqual(list(workshops.columns), ["Ceur-WS", "volume", "dblpid", "urn", "conference_guess"])
+        self.assertListEqual(workshops["Ceur-WS"].astype(int).to_list(), [2328, 1338])
+        self.assertEqual(workshops.iloc[0]["urn"], "urn:nbn:de:0074-2328-8")
+        self.assertEqual(workshops.iloc[0]["conference_guess"], "https://dblp.org/rec/conf/aaai/2019")
+        self.assertEqual(workshops.iloc[1]["conference_guess"], "https://dblp.org/rec/conf/ecir/2015")
+
+    def testCache(self):
+        """
+        test that the dump is only read again if it changed
+        """
+        get_dblp_conferences(dump_path=self.dump_path)
+        self.assertEqual(dblp_loader.dblp_cacher.load_meta("dump-conferences")["dump"],
+                         os.path.abspath(self.dump_path))
+
+        # a cached table is used for an unchanged dump
+        dblp_loader.dblp_cacher.store_csv("dump-workshops", pd.DataFrame(columns=["number", "volume", "dblpid", "urn"]))
+        self.assertEqual(get_dblp_workshops([2328], dump_path=self.dump_path).shape[0], 0)
+
+        os.utime(self.dump_path, ns=(0, 0))
+        self.assertEqual(get_dblp_workshops([2328], dump_path=self.dump_path).shape[0], 1)
+
+        # the flag of the module selects the dump for all callers
+        dblp_loader.dblp_dump_path = self.dump_path
+        try:
+            self.assertEqual(get_dblp_conferences().shape[0], 6)
+        finally:
+            dblp_loader.dblp_dump_path = None
+
+
 if __name__ == "__main__":
     unittest.main()
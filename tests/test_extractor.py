@@ -5,8 +5,10 @@ Created on 2023-05-10
 '''
 import unittest
 from colocation.cache_manager import JsonCacheManager
-from colocation.extractor import ColocationExtractor, ExtractionProcessor, TitleExtractor
+from colocation.extractor import (ColocationExtractor, ExtractionProcessor, TitleExtractor,
+                                  extract_matches, matchtypes, matchregexes, get_nlp, nlp_models)
 import pandas as pd
+import re
 
 test_procs = [
     {
@@ -351,6 +353,70 @@ class TestMatcher(unittest.TestCase):
                 self.assertIsInstance(countryISO3, str)
 
 
+class TestKeywordExtraction(unittest.TestCase):
+    """
+    test the single pass search for the keywords of all matchtypes
+    """
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def testSameAsRegexes(self):
+        """
+        test that the keyword search finds the same matches as applying every regex to every field
+        """
+        volumes = test_volumes + [
+            {
+                "number": 1,
+                "title": "Workshop at the Conference (CONF 2020) hosted by Someone, part of X @ Y",
+                "h3": "affiliated to A, affiliated with B, in conjunction with C\ncolocated with D",
+                "editors": ["co-located with", "collocated with E"],
+                "colocated": None
+            }
+        ]
+        for volume in volumes:
+            expected = {mt: [] for mt in matchtypes}
+            for value in volume.values():
+                for mt in matchtypes:
+                    result = re.search(matchregexes[mt], str(value))
+                    if result is not None:
+                        expected[mt].append(result[1])
+
+            self.assertDictEqual(expected, extract_matches(volume))
+
+
+class TestEventRemoval(unittest.TestCase):
+    """
+    test removing matched events from the remaining ones
+    """
+    def setUp(self):
+        self.lod = [{"number": number, "colocated": f"CONF {number}" if number % 2 else None, "loctime": None}
+                    for number in range(10)] + [{"number": -1, "colocated": "UNNUMBERED", "loctime": None}] * 2
+
+    def tearDown(self):
+        pass
+
+    def testRemoveByKeys(self):
+        """
+        test that removed events are skipped while the order of the others is kept
+        """
+        processor = ExtractionProcessor(self.lod, entity_cache=None)
+        shorts = [info["short"] for info in processor.split_by_short_title("colocated")]
+        self.assertListEqual(shorts, ["CONF 1", "CONF 3", "CONF 5", "CONF 7", "CONF 9", "UNNUMBERED", "UNNUMBERED"])
+
+        processor.remove_events_by_keys(number_key="number", keys=[3, 4, 3, 42])
+        processor.remove_events_by_keys(number_key="number", keys=[-1.0])
+        shorts = [info["short"] for info in processor.split_by_short_title("colocated")]
+        self.assertListEqual(shorts, ["CONF 1", "CONF 5", "CONF 7", "CONF 9"])
+
+        processor.remove_events_by_keys(number_key="number", keys=[1, 5, 7, 9])
+        self.assertListEqual(processor.split_by_short_title("colocated"), [])
+        # the given lod is not changed
+        self.assertEqual(len(self.lod), 12)
+
+
 class TestTitleExtractor(unittest.TestCase):
     """
     Test the attribute extraction capabilities of TitleExtractor.
@@ -382,6 +448,38 @@ class TestTitleExtractor(unittest.TestCase):
         self.assertEqual(int(conf["year"]), 2003)
         self.assertEqual(conf["short"], "ECDL 2003")
 
+    def testBatchedEntities(self):
+        """
+        test that processing texts in batches finds the same entities as processing them one by one
+        """
+        texts = [
+            "the 14th Conference of the Italian Association for Artificial Intelligence, Ferrara, Italy, 2015",
+            "ISWC 2022, Hangzhou, China, October 23-27, 2022",
+            "",
+            "Thirty-Third AAAI Conference on Artificial Intelligence (AAAI 2019), Honolulu, USA, January 27, 2019"
+        ]
+        processor = ExtractionProcessor([], batch_size=2)
+        entities = processor.extract_entities(texts)
+        self.assertEqual(len(entities), len(texts))
+
+        for text, (times, locs) in zip(texts, entities):
+            doc = processor.nlp(text)
+            self.assertListEqual(times, [entity.text for entity in doc.ents if entity.label_ == "DATE"])
+            self.assertListEqual(locs, [entity.text for entity in doc.ents if entity.label_ == "GPE"])
+
+    def testSharedModel(self):
+        """
+        test that the nlp model is only loaded when needed and then shared by all processors
+        """
+        nlp_models.clear()
+        processor = ExtractionProcessor([], entity_cache=None)
+        self.assertListEqual(processor.extract_entities([]), [])
+        self.assertDictEqual(nlp_models, {})
+
+        other = ExtractionProcessor([], entity_cache=None)
+        self.assertIs(processor.nlp, other.nlp)
+        self.assertIs(processor.nlp, get_nlp())
+
 
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
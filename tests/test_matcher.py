@@ -7,7 +7,9 @@ import unittest
 import os
 import pandas as pd
 from colocation.matcher import Matcher
-from colocation.cache_manager import JsonCacheManager
+from colocation.similarity import TitleIndex, MinHashIndex
+from colocation.values import Constants
+from colocation.cache_manager import CsvCacheManager, JsonCacheManager
 from colocation.extractor import ColocationExtractor, ExtractionProcessor
 from colocation.dataloaders.wikidata_loader import get_wikidata_conferences
 
@@ -137,6 +139,85 @@ class TestMatcher(unittest.TestCase):
         self.assertEqual(res.shape[0], 2,
                          msg="Fuzzy matching cannot handle when multiple workshops match against a conference.")
 
+    def test_fuzzy_year_blocking(self):
+        """
+        test that blocking by year finds the same matches as comparing all titles
+        and that the year tolerance allows matching neighbouring years
+        """
+        workshops = pd.DataFrame(workshop_lod)
+        conferences = pd.DataFrame(conference_lod)
+
+        matcher = Matcher()
+        blocked = matcher.fuzzy_title_matching(workshops, conferences, threshold=0.6, max_workers=2)
+        unblocked = matcher.fuzzy_title_matching(workshops, conferences, threshold=0.6, block_by_year=False)
+        self.assertListEqual(list(blocked["C.title"]), list(unblocked["C.title"]))
+
+        conferences["C.year"] = [2004, 2005, 2005]
+        res = matcher.fuzzy_title_matching(workshops, conferences, threshold=0.6)
+        self.assertEqual(res.shape[0], 0)
+
+        res = matcher.fuzzy_title_matching(workshops, conferences, threshold=0.6, year_tolerance=1)
+        self.assertEqual(res.shape[0], 1)
+        self.assertEqual(str(res["C.title"].iloc[0]), "29th international conference VLDB 2003, Berlin, Germany.")
+
+    def test_fuzzy_title_index(self):
+        """
+        test that fuzzy matching can reuse a prefitted embedding of the conference titles
+        """
+        workshops = pd.DataFrame(workshop_lod)
+        conferences = pd.DataFrame(conference_lod)
+        index = TitleIndex(list(conferences["C.title"]))
+
+        matcher = Matcher()
+        res = matcher.fuzzy_title_matching(workshops, conferences, threshold=0.6, title_index=index)
+        self.assertEqual(res.shape[0], 1)
+        self.assertEqual(str(res["C.title"].iloc[0]), "29th international conference VLDB 2003, Berlin, Germany.")
+
+        with self.assertRaises(ValueError):
+            matcher.fuzzy_title_matching(workshops, conferences.iloc[1:], threshold=0.6, title_index=index)
+
+        # the cached index is opt-in, by default every step fits on workshops and conferences
+        self.assertIsNone(matcher.build_title_index(list(conferences["C.title"])))
+        index = Matcher(reuse_title_index=True).build_title_index(list(conferences["C.title"]), reload=True)
+        self.assertIsInstance(index, TitleIndex)
+
+    def test_fuzzy_minhash(self):
+        """
+        test that the MinHash backend can be used for fuzzy matching
+        """
+        workshops = pd.DataFrame(workshop_lod)
+        workshops.loc[0, "W.title"] = "29th International Conference VLDB 2003, Berlin, Germany"
+        conferences = pd.DataFrame(conference_lod)
+
+        matcher = Matcher(title_backend="minhash")
+        index = matcher.build_title_index(list(conferences["C.title"]), reload=True)
+        self.assertIsInstance(index, MinHashIndex)
+
+        res = matcher.fuzzy_title_matching(workshops, conferences, threshold=0.8, title_index=index)
+        self.assertEqual(res.shape[0], 1)
+        self.assertEqual(str(res["C.title"].iloc[0]), "29th international conference VLDB 2003, Berlin, Germany.")
+
+        with self.assertRaises(ValueError):
+            Matcher(title_backend="stefan")
+
+    def test_backends_same_pairs(self):
+        """
+        test that both backends find the same pairs with their own thresholds
+        """
+        workshops = pd.DataFrame(workshop_lod)
+        conferences = pd.DataFrame(conference_lod)
+
+        tfidf = Matcher()
+        expected = tfidf.fuzzy_title_matching(workshops, conferences, threshold=Constants.MATCH_THREASHOLD)
+        minhash = Matcher(title_backend="minhash")
+        index = minhash.build_title_index(list(conferences["C.title"]), reload=True)
+        res = minhash.fuzzy_title_matching(workshops, conferences, threshold=minhash.minhash_threshold,
+                                           title_index=index)
+
+        self.assertEqual(expected.shape[0], 1)
+        self.assertEqual(sorted(zip(res["W.title"], res["C.title"])),
+                         sorted(zip(expected["W.title"], expected["C.title"])))
+
     def test_matcher(self):
         """
         test matcher on two smaller keywords
@@ -228,6 +309,42 @@ ECIR 2015, Vienna, Austria, March 29 - April 2, 2015. Proceedings",
         self.assertEqual(result.shape[0], 0)
         self.assertListEqual(matcher.matchtypes, ["stefan"])
 
+    def test_cached_matching(self):
+        """
+        test that cached match results are only reused for the same inputs and settings
+        """
+        matcher = Matcher(types_to_match=["stefan"])
+        matcher.cacher = CsvCacheManager(base_folder="test-matches")
+        for name in matcher.cacher.cached_names():
+            matcher.cacher.remove_csv(name)
+        workshops = pd.DataFrame(workshop_lod).rename(columns=lambda column: column[2:])
+        conferences = pd.DataFrame(conference_lod).rename(columns=lambda column: column[2:])
+
+        name = matcher.cache_name("test", [workshops, conferences], threshold=0.6)
+        self.assertEqual(name, matcher.cache_name("test", [workshops.copy(), conferences], threshold=0.6))
+        self.assertNotEqual(name, matcher.cache_name("test", [workshops, conferences], threshold=0.7))
+        self.assertNotEqual(name, matcher.cache_name("test", [workshops.iloc[1:], conferences], threshold=0.6))
+        self.assertNotEqual(name, Matcher(year_tolerance=1).cache_name("test", [workshops, conferences], threshold=0.6))
+        self.assertIsNone(matcher.cache_name("placeholder", [workshops, conferences], threshold=0.6))
+
+        # the cached result is returned instead of matching again
+        matcher.cacher.store_csv(matcher.cache_name("test", [workshops, conferences], threshold=0.6),
+                                 pd.DataFrame({"cached": [True]}))
+        result = matcher.match_dataframes(workshops, conferences, 0.6, save_name="test")
+        self.assertListEqual(list(result.columns), ["cached"])
+
+        result = matcher.match_dataframes(workshops, conferences, 0.5, save_name="test")
+        self.assertIn("C.title", result.columns)
+        self.assertTrue(os.path.isfile(matcher.cacher.save_path(
+            matcher.cache_name("test", [workshops, conferences], threshold=0.5), matcher.cacher.file_format)))
+
+        # only the result of the latest inputs is kept, other save names are left alone
+        matcher.cacher.store_csv("test-other-0123456789abcdef", pd.DataFrame({"cached": [True]}))
+        matcher.match_dataframes(workshops, conferences, 0.4, save_name="test")
+        self.assertListEqual(matcher.cacher.cached_names("test-"),
+                             [matcher.cache_name("test", [workshops, conferences], threshold=0.4),
+                              "test-other-0123456789abcdef"])
+
     @unittest.skipIf(IN_CI, "Skip in CI environment")
     def test_workshop_dblp_linking(self):
         """
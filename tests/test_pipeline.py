@@ -0,0 +1,162 @@
+'''
+Created on 2026-10-17
+
+@author: nm
+'''
+import unittest
+import os
+import threading
+from colocation.cache_manager import PickleCacheManager
+from colocation.pipeline import Pipeline
+
+
+class TestPipeline(unittest.TestCase):
+    """
+    test running stages with checkpoints
+    """
+
+    def setUp(self):
+        self.cacher = PickleCacheManager(base_folder="test-pipeline")
+        for file_name in os.listdir(os.path.dirname(self.cacher.pickle_path("x"))):
+            os.remove(os.path.join(os.path.dirname(self.cacher.pickle_path("x")), file_name))
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        pass
+
+    def build(self, factor: int = 2, barrier: threading.Barrier = None) -> Pipeline:
+        """
+        pipeline with two independent branches joined at the end and an uncheckpointed last stage
+        """
+        def stage(name, function):
+            def run(**kwargs):
+                with self.lock:
+                    self.calls.append(name)
+                if barrier is not None and name in ["double", "square"]:
+                    barrier.wait(timeout=10)
+                return function(**kwargs)
+            return run
+
+        pipeline = Pipeline("test", cacher=self.cacher, verbose=False)
+        pipeline.add_stage("numbers", stage("numbers", lambda: [1, 2, 3]))
+        pipeline.add_stage("double", stage("double", lambda numbers: [factor * n for n in numbers]),
+                           inputs=["numbers"], params={"factor": factor})
+        pipeline.add_stage("square", stage("square", lambda numbers: [n * n for n in numbers]), inputs=["numbers"])
+        pipeline.add_stage("total", stage("total", lambda double, square: sum(double) + sum(square)),
+                           inputs=["double", "square"])
+        pipeline.add_stage("report", stage("report", lambda total: f"total {total}"), inputs=["total"],
+                           checkpoint=False)
+        return pipeline
+
+    def testCheckpoints(self):
+        """
+        test that only stages with missing or outdated checkpoints are run
+        """
+        outputs = self.build().run()
+        self.assertEqual(outputs["total"], 26)
+        self.assertEqual(outputs["report"], "total 26")
+        self.assertSetEqual(set(self.calls), {"numbers", "double", "square", "total", "report"})
+
+        self.calls = []
+        outputs = self.build().run()
+        self.assertListEqual(self.calls, ["report"])
+        self.assertEqual(outputs["report"], "total 26")
+        # only the inputs of the stages run are loaded
+        self.assertNotIn("numbers", outputs)
+
+        # changed params invalidate the stage and everything depending on it
+        self.calls = []
+        outputs = self.build(factor=3).run()
+        self.assertListEqual(self.calls, ["double", "total", "report"])
+        self.assertEqual(outputs["report"], "total 32")
+
+    def testUnchangedOutput(self):
+        """
+        test that stages after a rerun stage are skipped if its output did not change
+        """
+        for version in [1, 2]:
+            self.calls = []
+            pipeline = Pipeline("test", cacher=self.cacher, verbose=False)
+            pipeline.add_stage("source", lambda: self.calls.append("source") or [1, 2, 3], params={"version": version})
+            pipeline.add_stage("sum", lambda source: self.calls.append("sum") or sum(source), inputs=["source"])
+            pipeline.run()
+        self.assertListEqual(self.calls, ["source"])
+
+    def testFromStageAndOnly(self):
+        """
+        test rerunning a stage with the stages depending on it or on its own
+        """
+        self.build().run()
+
+        self.calls = []
+        self.build().run(from_stage="square")
+        self.assertListEqual(self.calls, ["square", "total", "report"])
+
+        self.calls = []
+        outputs = self.build().run(only=["report"])
+        self.assertListEqual(self.calls, ["report"])
+        self.assertEqual(outputs["report"], "total 26")
+
+        self.calls = []
+        self.build().run(reload=True)
+        self.assertEqual(len(self.calls), 5)
+
+        with self.assertRaises(ValueError):
+            self.build().run(from_stage="unknown")
+
+    def testOnlyUncheckpointedInput(self):
+        """
+        test that inputs without checkpoint are run together with the selected stages
+        """
+        def build() -> Pipeline:
+            pipeline = Pipeline("test", cacher=self.cacher, verbose=False)
+            pipeline.add_stage("source", lambda: self.calls.append("source") or [1, 2, 3], checkpoint=False)
+            pipeline.add_stage("offset", lambda: self.calls.append("offset") or 10)
+            pipeline.add_stage("sum", lambda source, offset: self.calls.append("sum") or sum(source) + offset,
+                               inputs=["source", "offset"])
+            return pipeline
+
+        build().run()
+        self.calls = []
+        outputs = build().run(only=["sum"])
+        self.assertListEqual(self.calls, ["source", "sum"])
+        self.assertEqual(outputs["sum"], 16)
+
+    def testConcurrency(self):
+        """
+        test that independent stages run at the same time
+        """
+        # both branches have to wait for each other, which only succeeds if they run concurrently
+        outputs = self.build(barrier=threading.Barrier(2)).run()
+        self.assertEqual(outputs["total"], 26)
+
+    def testFailure(self):
+        """
+        test that the checkpoints of finished stages survive a failing stage
+        """
+        pipeline = self.build()
+        pipeline.add_stage("fail", lambda total: 1 / 0, inputs=["total"])
+        with self.assertRaises(ZeroDivisionError):
+            pipeline.run()
+
+        self.calls = []
+        pipeline = self.build()
+        pipeline.add_stage("fail", lambda total: total, inputs=["total"])
+        self.assertEqual(pipeline.run()["fail"], 26)
+        self.assertListEqual(self.calls, ["report"])
+
+    def testInvalidStages(self):
+        """
+        test that stages can only depend on stages added before
+        """
+        pipeline = Pipeline("test", cacher=self.cacher, verbose=False)
+        with self.assertRaises(ValueError):
+            pipeline.add_stage("total", lambda double: double, inputs=["double"])
+        pipeline.add_stage("double", lambda: 2)
+        with self.assertRaises(ValueError):
+            pipeline.add_stage("double", lambda: 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+'''
+Created on 2026-10-17
+
+@author: nm
+'''
+import unittest
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from colocation.similarity import sparse_top_k, TitleIndex, MinHashIndex
+from colocation.cache_manager import PickleCacheManager
+
+titles = [
+    "29th international conference VLDB 2003, Berlin, Germany.",
+    "30th international conference VLDB 2005, Berlin, Germany.",
+    "10th international Conf. STFN 2004, Sydney, Australia",
+    "International Semantic Web Conference ISWC 2022",
+    "21st International Semantic Web Conference (ISWC2022)",
+    "European Conference on IR Research, ECIR 2015, Vienna, Austria",
+    "Advances in Information Retrieval - 37th European Conference on IR Research",
+]
+
+
+class TestSimilarity(unittest.TestCase):
+    """
+    test the candidate generation for fuzzy title matching
+    """
+
+    def setUp(self):
+        self.X = TfidfVectorizer().fit_transform(titles)
+        self.work = self.X[0:3]
+        self.conf = self.X[3:]
+
+    def tearDown(self):
+        pass
+
+    def test_sparse_equals_dense(self):
+        """
+        test that the chunked sparse product finds the same pairs as the dense cosine similarity
+        """
+        X = self.X
+        dense = cosine_similarity(X[0:4], X[2:])
+        expected = np.argwhere(dense >= 0.1)
+
+        for chunk_size in [1, 2, 10]:
+            rows, cols, scores = sparse_top_k(X[0:4], X[2:], 0.1, chunk_size=chunk_size)
+            self.assertListEqual(expected.tolist(), np.column_stack([rows, cols]).tolist())
+            np.testing.assert_allclose(scores, dense[rows, cols])
+
+    def test_top_k(self):
+        """
+        test that only the k most similar conferences are kept per workshop
+        """
+        X = self.X
+        dense = cosine_similarity(X, X)
+        rows, cols, _ = sparse_top_k(X, X, 0.0, top_k=2, chunk_size=3)
+
+        for row in range(len(titles)):
+            found = cols[rows == row]
+            self.assertTrue(len(found) <= 2)
+            # the title itself is always the best candidate
+            self.assertIn(row, found)
+            self.assertTrue(all(dense[row, found].min() >= np.delete(dense[row], found)))
+
+    def test_empty(self):
+        """
+        test that no candidates are produced above an unreachable threshold
+        """
+        rows, cols, scores = sparse_top_k(self.work, self.conf, 1.1)
+        self.assertEqual(rows.shape[0], 0)
+        self.assertEqual(cols.shape[0], 0)
+        self.assertEqual(scores.shape[0], 0)
+
+
+class TestTitleIndex(unittest.TestCase):
+    """
+    test the reusable embedding of conference titles
+    """
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_transform(self):
+        """
+        test that workshop titles are embedded in the space of the conferences and remembered
+        """
+        index = TitleIndex(titles[3:])
+        self.assertEqual(len(index), len(titles) - 3)
+
+        vectors = index.transform(titles[0:3])
+        self.assertEqual(vectors.shape, (3, index.conference_vectors.shape[1]))
+        self.assertSetEqual(set(index.workshop_vectors.keys()), set(titles[0:3]))
+
+        # the same title is embedded like the conference
+        vectors = index.transform([titles[3]])
+        np.testing.assert_allclose(vectors.toarray(), index.conference_vectors[0].toarray())
+
+    def test_cache(self):
+        """
+        test that the index is only fitted once for the same conferences
+        """
+        cacher = PickleCacheManager(base_folder="test-index")
+        index = TitleIndex.load_or_fit(titles, cacher, reload=True)
+        index.transform(["A workshop title"])
+        index.store(cacher)
+
+        cached = TitleIndex.load_or_fit(titles, cacher)
+        self.assertIsNot(index, cached)
+        self.assertEqual(index.fingerprint, cached.fingerprint)
+        # workshop embeddings are not stored, so the cached index does not grow from run to run
+        self.assertIn("A workshop title", index.workshop_vectors)
+        self.assertDictEqual(cached.workshop_vectors, {})
+        np.testing.assert_allclose(cached.transform(["A workshop title"]).toarray(),
+                                   index.transform(["A workshop title"]).toarray())
+
+        other = TitleIndex.load_or_fit(titles[1:], cacher)
+        self.assertNotEqual(index.fingerprint, other.fingerprint)
+
+    def test_update(self):
+        """
+        test that changed conference titles are embedded with the fitted vocabulary until it drifts too far
+        """
+        cacher = PickleCacheManager(base_folder="test-index")
+        index = TitleIndex.load_or_fit(titles[3:], cacher, reload=True)
+        vocabulary = index.vectorizer.vocabulary_
+
+        # a removed and a changed conference only transform the changed title
+        changed = titles[4:6] + ["International Semantic Web Conference ISWC 2023"] + titles[3:4]
+        updated = TitleIndex.load_or_fit(changed, cacher)
+        self.assertDictEqual(updated.vectorizer.vocabulary_, vocabulary)
+        self.assertEqual(updated.unknown_terms, 1)
+        self.assertEqual(len(updated), 4)
+        self.assertEqual(updated.fingerprint, TitleIndex.titles_fingerprint(changed))
+        np.testing.assert_allclose(updated.conference_vectors.toarray(),
+                                   updated.vectorizer.transform(changed).toarray())
+        self.assertEqual(TitleIndex.load_or_fit(changed, cacher).fingerprint, updated.fingerprint)
+
+        # too many unknown terms fit the vectorizer again
+        drifted = changed + ["Symposium on Quantum Robotics and Distributed Ledgers"]
+        refitted = TitleIndex.load_or_fit(drifted, cacher)
+        self.assertIn("quantum", refitted.vectorizer.vocabulary_)
+        self.assertEqual(refitted.unknown_terms, 0)
+
+
+class TestMinHashIndex(unittest.TestCase):
+    """
+    test the approximate title similarity using MinHash and LSH
+    """
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_query(self):
+        """
+        test that (near) identical titles are found and unrelated ones are not
+        """
+        index = MinHashIndex(titles)
+        queries = [titles[0], "29th international conference VLDB 2003, Berlin, Germany", "Completely unrelated", ""]
+        rows, cols, scores = index.query(queries, threshold=0.9)
+
+        self.assertListEqual(list(rows), [0, 1])
+        self.assertListEqual(list(cols), [0, 0])
+        self.assertEqual(scores[0], 1.0)
+        self.assertTrue(scores[1] > 0.8)
+
+    def test_query_blocked(self):
+        """
+        test that blocking keys restrict the conferences compared
+        """
+        index = MinHashIndex(titles)
+        years = np.array([2003, 2005, 2004, 2022, 2022, 2015, 2015], dtype=float)
+
+        rows, cols, _ = index.query([titles[0]], threshold=0.9,
+                                    workshop_keys=np.array([2004.0]), conference_keys=years)
+        self.assertEqual(rows.shape[0], 0)
+
+        rows, cols, _ = index.query([titles[0]], threshold=0.9, workshop_keys=np.array([2004.0]),
+                                    conference_keys=years, tolerance=1)
+        self.assertListEqual(list(cols), [0])
+
+    def test_invalid_bands(self):
+        """
+        test that the bands have to divide the signature
+        """
+        with self.assertRaises(ValueError):
+            MinHashIndex(titles, num_perm=100, bands=32)
+
+
+if __name__ == "__main__":
+    unittest.main()
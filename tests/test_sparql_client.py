@@ -0,0 +1,173 @@
+'''
+Created on 2026-10-17
+
+@author: nm
+'''
+import unittest
+import asyncio
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import requests
+from colocation.dataloaders.sparql_client import SparqlClient, bindings_to_lod, get_client
+
+XSD = "http://www.w3.org/2001/XMLSchema#"
+
+
+class EndpointHandler(BaseHTTPRequestHandler):
+    """
+    stand-in for a SPARQL endpoint answering with the query as literal,
+    queries starting with a status code get that status as long as failures remain
+    """
+    protocol_version = "HTTP/1.1"
+    failures = 0
+    retry_after = None
+    requests = []
+    connections = set()
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+
+    def do_POST(self):
+        query = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode("utf8"))["query"][0]
+        with self.lock:
+            self.requests.append((time.monotonic(), query))
+            self.connections.add(self.client_address)
+            EndpointHandler.active += 1
+            EndpointHandler.max_active = max(EndpointHandler.max_active, EndpointHandler.active)
+            fail = query[0:3].isdigit() and EndpointHandler.failures > 0
+            if fail:
+                EndpointHandler.failures -= 1
+        try:
+            if query == "slow":
+                time.sleep(0.2)
+            if fail:
+                status, data = int(query[0:3]), b"try again"
+            elif query.startswith("400"):
+                status, data = 400, b"syntax error"
+            else:
+                status = 200
+                data = json.dumps({
+                    "head": {"vars": ["query"]},
+                    "results": {"bindings": [{"query": {"type": "literal", "value": query}}]}
+                }).encode("utf8")
+            self.send_response(status)
+            if fail and self.retry_after is not None:
+                self.send_header("Retry-After", self.retry_after)
+            self.send_header("Content-Type", "application/sparql-results+json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with self.lock:
+                EndpointHandler.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestSparqlClient(unittest.TestCase):
+    """
+    test the shared SPARQL client against a local endpoint
+    """
+
+    def setUp(self):
+        EndpointHandler.failures = 0
+        EndpointHandler.retry_after = None
+        EndpointHandler.requests = []
+        EndpointHandler.connections = set()
+        EndpointHandler.max_active = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), EndpointHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/sparql"
+        self.client = SparqlClient(self.url, max_concurrent=2, backoff=0.05)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testConnectionReuse(self):
+        """
+        test that consecutive queries use the same connection
+        """
+        for i in range(5):
+            self.assertListEqual(self.client.query(f"query {i}"), [{"query": f"query {i}"}])
+        self.assertEqual(len(EndpointHandler.connections), 1)
+        self.assertIs(get_client(self.url), get_client(self.url))
+
+    def testRetry(self):
+        """
+        test that rate limited and unavailable queries are repeated with growing delays
+        """
+        EndpointHandler.failures = 2
+        self.assertListEqual(self.client.query("503 query"), [{"query": "503 query"}])
+        times = [t for t, _ in EndpointHandler.requests]
+        self.assertEqual(len(times), 3)
+        self.assertTrue(times[1] - times[0] >= 0.05)
+        self.assertTrue(times[2] - times[1] >= 0.1)
+
+        # the failure is raised once all retries are used up
+        EndpointHandler.failures = 10
+        with self.assertRaises(requests.HTTPError):
+            self.client.query("503 query")
+        EndpointHandler.failures = 0
+
+        # client errors are not repeated
+        EndpointHandler.requests = []
+        with self.assertRaises(requests.HTTPError):
+            self.client.query("400 query")
+        self.assertEqual(len(EndpointHandler.requests), 1)
+
+    def testRetryAfter(self):
+        """
+        test that the delay requested by the server is respected
+        """
+        EndpointHandler.failures = 1
+        EndpointHandler.retry_after = "1"
+        self.client.query("429 query")
+        times = [t for t, _ in EndpointHandler.requests]
+        self.assertTrue(times[1] - times[0] >= 1)
+
+    def testConcurrency(self):
+        """
+        test that asynchronous queries overlap up to the limit of the client
+        """
+        async def run():
+            return await asyncio.gather(*[self.client.query_async("slow") for _ in range(4)])
+
+        start = time.monotonic()
+        results = asyncio.run(run())
+        self.assertEqual(len(results), 4)
+        self.assertEqual(EndpointHandler.max_active, 2)
+        # two rounds of two queries each
+        self.assertTrue(time.monotonic() - start < 0.7)
+
+        self.assertListEqual(self.client.query_many(["a", "b"]), [[{"query": "a"}], [{"query": "b"}]])
+
+    def testLiterals(self):
+        """
+        test that typed literals are converted like pylodstorage does
+        """
+        bindings = [{
+            "uri": {"type": "uri", "value": "http://www.wikidata.org/entity/Q1"},
+            "int": {"type": "literal", "datatype": XSD + "integer", "value": "42"},
+            "dec": {"type": "literal", "datatype": XSD + "decimal", "value": "0.5"},
+            "bool": {"type": "literal", "datatype": XSD + "boolean", "value": "true"},
+            "date": {"type": "literal", "datatype": XSD + "date", "value": "2023-08-16"},
+            "time": {"type": "literal", "datatype": XSD + "dateTime", "value": "2023-08-16T00:00:00Z"},
+            "other": {"type": "literal", "datatype": XSD + "string", "value": "text"},
+        }, {}]
+        lod = bindings_to_lod(bindings)
+        self.assertDictEqual(lod[0], {
+            "uri": "http://www.wikidata.org/entity/Q1", "int": 42, "dec": 0.5, "bool": True,
+            "date": datetime.date(2023, 8, 16), "time": datetime.datetime(2023, 8, 16), "other": "text"
+        })
+        self.assertDictEqual(lod[1], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
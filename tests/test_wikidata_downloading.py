@@ -5,14 +5,126 @@ Created on 2023-06-28
 '''
 import unittest
 import os
+import re
+import json
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import datetime
 import pandas as pd
-from colocation.cache_manager import JsonCacheManager
+from typing import Callable, Dict, List
+from colocation.cache_manager import JsonCacheManager, CsvCacheManager, PickleCacheManager
 from colocation.extractor import ColocationExtractor
+from colocation.dataloaders import wikidata_loader
 from colocation.dataloaders.wikidata_loader import (get_wikidata_conferences, get_wikidata_workshops,
-                                                    get_workshop_ids_from_lod, get_wikidata_dblp_info)
+                                                    get_workshop_ids_from_lod, get_wikidata_dblp_info,
+                                                    get_wikidata_workshops_by_number, WikidataDumpLoader)
 
 IN_CI = os.environ.get('CI', False)
 
+XSD = "http://www.w3.org/2001/XMLSchema#"
+WIKIDATA_SAMPLE = os.path.join(os.path.dirname(__file__), "..", "testdata", "wikidata-sample.json.gz")
+
+
+class ConferenceHandler(BaseHTTPRequestHandler):
+    """
+    stand-in for the Wikidata endpoint knowing the entities in items.
+    Fails the page starting at a QID in fail_pages once.
+    """
+    items = {}
+    pages = []
+    modified_checks = []
+    requested = []
+    checked = []
+    fail_pages = []
+    lock = threading.Lock()
+
+    @classmethod
+    def reset(cls):
+        """
+        conferences Q1 to Q25 modified long ago with a timepoint in every fifth one
+        """
+        cls.items = {f"Q{i}": {"label": f"Conference Q{i}", "conference": True, "modified": "2020-01-01T00:00:00Z"}
+                     for i in range(1, 26)}
+        for i in range(5, 26, 5):
+            cls.items[f"Q{i}"]["timepoint"] = f"20{i:0>2}-06-01T00:00:00Z"
+        cls.pages = []
+        cls.modified_checks = []
+        cls.requested = []
+        cls.checked = []
+        cls.fail_pages = []
+
+    def do_POST(self):
+        query = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode("utf8"))["query"][0]
+        conferences = sorted(qid for qid, item in self.items.items() if item["conference"])
+        values = re.search(r"VALUES \?conference \{(.*?)\}", query)
+        selected = re.findall(r"wd:(Q\d+)", values.group(1)) if values else conferences
+
+        def uri(qid: str) -> Dict:
+            return {"type": "uri", "value": f"http://www.wikidata.org/entity/{qid}"}
+
+        if "as ?max" in query:
+            max_id = str(max(int(qid[1:]) for qid in conferences))
+            bindings = [{"max": {"type": "literal", "datatype": XSD + "integer", "value": max_id}}]
+        elif "schema:dateModified" in query:
+            watermark = re.search(r'"([^"]*)"\^\^xsd:dateTime', query).group(1)
+            with self.lock:
+                self.modified_checks.append(selected if values else None)
+            bindings = []
+            for qid in selected:
+                item = self.items.get(qid)
+                if item is None or not (item["conference"] or values):
+                    continue
+                # the proceedings only count when asking for given conferences
+                modified = max(item["modified"], item.get("proc_modified", "") if values else "")
+                if modified >= watermark:
+                    bindings.append({"conference": uri(qid)})
+        elif "?qid >=" in query:
+            start, stop = map(int, re.search(r"\?qid >= (\d+) && \?qid < (\d+)", query).groups())
+            with self.lock:
+                self.pages.append(start)
+                if start in self.fail_pages:
+                    self.fail_pages.remove(start)
+                    self.send_error(500)
+                    return
+            bindings = self.conference_bindings([qid for qid in conferences if start <= int(qid[1:]) < stop], uri)
+        elif values:
+            with self.lock:
+                # the details of conferences also need their label
+                (self.requested if "rdfs:label" in query or "dblp_event" in query else self.checked).extend(selected)
+            selected = [qid for qid in selected if qid in conferences]
+            if "dblp_event" in query:
+                bindings = [{"conference": uri(qid),
+                             "dblp_event": {"type": "literal", "value": self.items[qid]["dblp"]}}
+                            for qid in selected if "dblp" in self.items[qid]]
+            else:
+                bindings = self.conference_bindings(selected, uri)
+        else:
+            bindings = [{"conference": uri(qid)} for qid in conferences]
+
+        data = json.dumps({"head": {"vars": []}, "results": {"bindings": bindings}}).encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/sparql-results+json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def conference_bindings(self, qids: List[str], uri: Callable[[str], Dict]) -> List[Dict]:
+        bindings = []
+        for qid in qids:
+            binding = {"conference": uri(qid),
+                       "conferenceLabel": {"type": "literal", "value": self.items[qid]["label"]}}
+            if "timepoint" in self.items[qid]:
+                binding["timepoint"] = {"type": "literal", "datatype": XSD + "dateTime",
+                                        "value": self.items[qid]["timepoint"]}
+            bindings.append(binding)
+        return bindings
+
+    def log_message(self, format, *args):
+        pass
+
 
 class TestWikidata(unittest.TestCase):
     """
@@ -97,6 +209,249 @@ class TestWikidata(unittest.TestCase):
                         msg=f"Expected columns {column_signature} but got columns {list(dblp.columns)}")
 
 
+class TestConferencePages(unittest.TestCase):
+    """
+    test downloading the conferences in pages and refreshing them with the changes since
+    """
+
+    def setUp(self):
+        ConferenceHandler.reset()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ConferenceHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint_url = wikidata_loader.wikidata_endpoint_url
+        self.values_chunk_size = wikidata_loader.values_chunk_size
+        self.cacher = wikidata_loader.wikidata_cacher
+        wikidata_loader.wikidata_endpoint_url = f"http://127.0.0.1:{self.server.server_address[1]}/sparql"
+        wikidata_loader.wikidata_cacher = CsvCacheManager(base_folder="test-wikidata")
+        for name in wikidata_loader.wikidata_cacher.cached_names():
+            wikidata_loader.wikidata_cacher.remove_csv(name)
+
+    def tearDown(self):
+        wikidata_loader.wikidata_endpoint_url = self.endpoint_url
+        wikidata_loader.values_chunk_size = self.values_chunk_size
+        wikidata_loader.wikidata_cacher = self.cacher
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testPages(self):
+        """
+        test that the pages are combined into the cached conferences
+        """
+        conferences = get_wikidata_conferences(reload=True, page_size=10)
+
+        self.assertListEqual(sorted(ConferenceHandler.pages), [0, 10, 20])
+        self.assertEqual(conferences.shape[0], 25)
+        self.assertEqual(conferences["conference"].nunique(), 25)
+        self.assertTrue({"conference", "title", "year", "month"}.issubset(set(conferences.columns)))
+        self.assertEqual(conferences["year"].dropna().shape[0], 5)
+        self.assertListEqual(wikidata_loader.wikidata_cacher.cached_names(), ["conferences"])
+
+        ConferenceHandler.pages = []
+        cached = get_wikidata_conferences(page_size=10)
+        self.assertListEqual(ConferenceHandler.pages, [])
+        self.assertTrue(conferences.equals(cached))
+
+    def testResume(self):
+        """
+        test that only the failed pages are downloaded again
+        """
+        ConferenceHandler.fail_pages = [10]
+        with self.assertRaises(Exception):
+            get_wikidata_conferences(reload=True, page_size=10)
+        self.assertListEqual(wikidata_loader.wikidata_cacher.cached_names("conferences-page-"),
+                             ["conferences-page-0-10", "conferences-page-20-30"])
+        watermark = wikidata_loader.wikidata_cacher.load_meta("conferences-page-0-10")["watermark"]
+
+        # the class changes between the attempts, the pages of the first one are still valid
+        del ConferenceHandler.items["Q3"]
+        ConferenceHandler.items["Q42"] = {"label": "New conference", "conference": True, "modified": "2020-01-01"}
+        ConferenceHandler.pages = []
+        conferences = get_wikidata_conferences(reload=True, page_size=10)
+        self.assertListEqual(sorted(ConferenceHandler.pages), [10, 30, 40])
+        self.assertEqual(conferences.shape[0], 26)
+        self.assertIn("http://www.wikidata.org/entity/Q42", set(conferences["conference"]))
+        # changes since the oldest page are left to the next refresh
+        self.assertEqual(wikidata_loader.wikidata_cacher.load_meta("conferences")["watermark"], watermark)
+        self.assertListEqual(wikidata_loader.wikidata_cacher.cached_names(), ["conferences"])
+
+    def testRefresh(self):
+        """
+        test that only changed conferences are downloaded again and deleted ones are removed
+        """
+        get_wikidata_conferences(reload=True, page_size=10)
+        watermark = wikidata_loader.wikidata_cacher.load_meta("conferences")["watermark"]
+
+        now = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        items = ConferenceHandler.items
+        items["Q3"].update({"label": "Renamed conference", "modified": now})
+        del items["Q7"]
+        items["Q12"].update({"conference": False, "modified": now})
+        items["Q30"] = {"label": "New conference", "conference": True, "modified": now}
+        items["Q5"].update({"timepoint": "2006-06-01T00:00:00Z", "proc_modified": now})
+        # changed before the last synchronization
+        items["Q4"]["label"] = "Missed change"
+        ConferenceHandler.pages = []
+        wikidata_loader.values_chunk_size = 10
+
+        conferences = get_wikidata_conferences(refresh=True, page_size=10)
+        self.assertListEqual(ConferenceHandler.pages, [])
+        # the cached ids are checked in batches, the class is never listed
+        self.assertListEqual(sorted(ConferenceHandler.checked, key=lambda qid: int(qid[1:])),
+                             [f"Q{i}" for i in range(1, 26)])
+        # the modified items of the class are queried once, the proceedings for the remaining cached conferences
+        self.assertEqual(ConferenceHandler.modified_checks.count(None), 1)
+        proceedings = [qid for checks in ConferenceHandler.modified_checks if checks for qid in checks]
+        self.assertListEqual(sorted(proceedings), sorted(f"Q{i}" for i in range(1, 26) if i not in [7, 12]))
+        self.assertListEqual(sorted(ConferenceHandler.requested), ["Q3", "Q30", "Q5"])
+
+        titles = dict(zip(conferences["conference"].map(lambda uri: uri.split("/")[-1]), conferences["title"]))
+        self.assertEqual(len(titles), 24)
+        self.assertEqual(titles["Q3"], "Renamed conference")
+        self.assertEqual(titles["Q30"], "New conference")
+        self.assertEqual(titles["Q4"], "Conference Q4")
+        self.assertNotIn("Q7", titles)
+        self.assertNotIn("Q12", titles)
+        self.assertEqual(conferences["year"].dropna().shape[0], 5)
+        self.assertEqual(conferences[conferences["conference"].str.endswith("/Q5")]["year"].iloc[0], 2006)
+
+        meta = wikidata_loader.wikidata_cacher.load_meta("conferences")
+        self.assertTrue(meta["watermark"] >= watermark)
+        self.assertSetEqual({uri.split("/")[-1] for uri in meta["tombstones"]}, {"Q7", "Q12"})
+        self.assertTrue(get_wikidata_conferences().equals(conferences))
+
+    def testRefreshDblpInfo(self):
+        """
+        test that the dblp links are refreshed for new and modified conferences and their proceedings
+        """
+        for qid in ["Q1", "Q2", "Q3", "Q4"]:
+            ConferenceHandler.items[qid]["dblp"] = f"conf/{qid}/{qid}2020"
+        links = get_wikidata_dblp_info(["Q1", "Q2", "Q3"], name="test-refresh", reload=True)
+        self.assertEqual(links.shape[0], 3)
+        self.assertListEqual(list(links.columns), ["conference", "proc", "dblp_event", "dblp_proceedings", "uri"])
+
+        now = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        ConferenceHandler.items["Q2"].update({"dblp": "conf/Q2/new2020", "proc_modified": now})
+        ConferenceHandler.requested = []
+
+        links = get_wikidata_dblp_info(["Q1", "Q2", "Q4"], name="test-refresh", refresh=True)
+        self.assertListEqual(sorted(ConferenceHandler.requested), ["Q2", "Q4"])
+        events = dict(zip(links["conference"].map(lambda uri: uri.split("/")[-1]), links["dblp_event"]))
+        self.assertDictEqual(events, {"Q1": "conf/Q1/Q12020", "Q2": "conf/Q2/new2020", "Q4": "conf/Q4/Q42020"})
+
+
+class TestWikidataDump(unittest.TestCase):
+    """
+    test reading conferences and workshops from a local Wikidata json dump
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # starting the worker processes takes a while, so the dump is only read once for all tests
+        cls.folder = tempfile.mkdtemp()
+        cls.dump_path = os.path.join(cls.folder, "wikidata.json.gz")
+        shutil.copy(WIKIDATA_SAMPLE, cls.dump_path)
+        cls.cacher = PickleCacheManager(base_folder="test-wikidata-dump")
+        WikidataDumpLoader(cls.dump_path, max_workers=2, batch_size=4, cacher=cls.cacher).load(reload=True)
+        cls.subset = cls.cacher.load_pickle("dump-subset")
+        cls.modified = os.stat(cls.dump_path).st_mtime_ns
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder)
+
+    def setUp(self):
+        os.utime(self.dump_path, ns=(self.modified, self.modified))
+        self.cacher.store_pickle("dump-subset", self.subset)
+        self.loader = WikidataDumpLoader(self.dump_path, max_workers=2, batch_size=4, cacher=self.cacher)
+
+    def uris(self, df: pd.DataFrame, column: str) -> List[str]:
+        return df[column].map(lambda uri: uri.split("/")[-1]).to_list()
+
+    def testConferences(self):
+        """
+        test that the conferences are built like from the query
+        """
+        conferences = self.loader.conferences()
+        self.assertListEqual(list(conferences.columns), ["conference", "title", "short", "countryISO3", "start",
+                                                         "end", "timepoint", "month", "year"])
+        # instances of subclasses are included, deprecated classes and items without English label are not
+        self.assertListEqual(self.uris(conferences, "conference"), ["Q100001", "Q100001", "Q100002", "Q200001"])
+
+        # one row per short name, only the preferred country
+        iswc = conferences[conferences["conference"].str.endswith("Q100001")]
+        self.assertListEqual(iswc["short"].to_list(), ["ISWC 2019", "ISWC19"])
+        self.assertListEqual(iswc["countryISO3"].to_list(), ["USA", "USA"])
+        self.assertEqual(iswc.iloc[0]["start"], pd.Timestamp(2019, 10, 26))
+        self.assertEqual(iswc.iloc[0]["month"], 10)
+
+        # dates of year precision start at the first of January, English variants count as English
+        symposium = conferences[conferences["conference"].str.endswith("Q100002")].iloc[0]
+        self.assertEqual(symposium["title"], "Symposium on Data 2020")
+        self.assertEqual(symposium["timepoint"], pd.Timestamp(2020, 1, 1))
+
+    def testWorkshops(self):
+        """
+        test that the workshops get their location and are found by their Ceur-WS number
+        """
+        workshops = self.loader.workshops(["wd:Q200001", "wd:Q100001"])
+        self.assertListEqual(self.uris(workshops, "workshop"), ["Q200001"])
+        self.assertEqual(workshops.iloc[0]["locations"], "Berlin")
+        self.assertEqual(workshops.iloc[0]["countryISO3"], "DEU")
+        self.assertEqual(workshops.iloc[0]["year"], 2021)
+
+        numbers = self.loader.workshops_by_number([2950, 1])
+        self.assertListEqual(list(numbers.columns), ["Ceur-WS", "Wikidata"])
+        self.assertListEqual(numbers["Ceur-WS"].to_list(), [2950])
+        self.assertListEqual(self.uris(numbers, "Wikidata"), ["Q200001"])
+
+    def testDblpInfo(self):
+        """
+        test that the dblp links of the conferences and their proceedings are found
+        """
+        links = self.loader.dblp_info(["Q100001", "Q100002"])
+        self.assertListEqual(list(links.columns), ["conference", "proc", "dblp_event", "dblp_proceedings", "uri"])
+        self.assertListEqual(self.uris(links, "conference"), ["Q100001", "Q100002"])
+        iswc = links.iloc[0]
+        self.assertEqual(iswc["proc"], "http://www.wikidata.org/entity/Q300002")
+        self.assertEqual(iswc["dblp_event"], "conf/semweb/2019")
+        self.assertEqual(iswc["dblp_proceedings"], "conf/semweb/2019-1")
+        self.assertEqual(iswc["uri"], "https://DBLP.org/db/conf/semweb/iswc2019")
+        self.assertTrue(pd.isna(links.iloc[1]["dblp_event"]))
+
+    def testCache(self):
+        """
+        test that the kept subset is reused until the dump changes and that the module flag selects the dump
+        """
+        subset = self.cacher.load_pickle("dump-subset")
+        self.assertEqual(subset["source"]["dump"], os.path.abspath(self.dump_path))
+        self.assertNotIn("Q500001", subset["items"])
+
+        # a cached subset is used for an unchanged dump
+        subset = dict(subset, items={})
+        self.cacher.store_pickle("dump-subset", subset)
+        loader = WikidataDumpLoader(self.dump_path, max_workers=1, cacher=self.cacher)
+        self.assertEqual(loader.conferences().shape[0], 0)
+
+        # a changed dump is read again, twice at most including the labels of the locations
+        reads = []
+        read_batches = loader.read_batches
+        loader.read_batches = lambda: reads.append(1) or read_batches()
+        os.utime(self.dump_path, ns=(0, 0))
+        self.assertEqual(loader.conferences().shape[0], 4)
+        self.assertEqual(loader.workshops(["wd:Q200001"]).iloc[0]["locations"], "Berlin")
+        self.assertEqual(len(reads), 2)
+
+        wikidata_loader.wikidata_dump_path = self.dump_path
+        wikidata_loader.dump_loaders[self.dump_path] = loader
+        try:
+            self.assertEqual(get_wikidata_conferences().shape[0], 4)
+            self.assertEqual(get_wikidata_workshops_by_number([2950], name="test-dump").shape[0], 1)
+            self.assertEqual(get_wikidata_dblp_info(["Q100001"], name="test-dump").shape[0], 1)
+        finally:
+            wikidata_loader.wikidata_dump_path = None
+            del wikidata_loader.dump_loaders[self.dump_path]
+
+
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
     unittest.main()